@@ -0,0 +1,259 @@
+"""
+Benchmarks for data ingest, Syngo matching and every inquiry.
+
+Synthetic data sets of increasing size are generated with
+core.synthetic_data (and cached, so only the first run pays for that),
+then each stage is timed with core.instrumentation. Results are written
+as JSON and can be compared against a saved baseline to flag regressions.
+
+== Usage ==
+
+From the top of the srqi directory:
+
+    python benchmark/run_benchmarks.py
+    python benchmark/run_benchmarks.py --sizes 10000,100000 --save-baseline baseline.json
+    python benchmark/run_benchmarks.py --baseline baseline.json
+
+The exit status is 1 if any stage regressed against the baseline, either
+by taking longer or by reaching a higher peak memory use.
+
+"""
+import os
+import sys
+import json
+import argparse
+import traceback
+import datetime
+import imp
+
+def _import_srqi():
+    """Make `import srqi` work no matter what the checkout is called
+    """
+    try:
+        import srqi
+    except ImportError:
+        srqi_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        imp.load_module('srqi', None, srqi_dir, ('', '', imp.PKG_DIRECTORY))
+
+_import_srqi()
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from srqi.core import my_utils, srdata, Parse_Syngo, synthetic_data, instrumentation
+import srqi.inquiries
+
+DEFAULT_SIZES = [10000, 50000, 200000]
+DEFAULT_TOLERANCE = .25 # fraction a stage may slow down before it is flagged
+DEFAULT_MEMORY_TOLERANCE = .25 # fraction a stage's peak memory may grow before it is flagged
+MIN_SECONDS = .05 # stages faster than this in the baseline are too noisy to flag
+
+
+def get_dataset(data_dir, num_events, seed):
+    """Return (xml paths, syngo paths) for a synthetic data set, generating
+    it only if it hasn't been cached in data_dir already.
+    """
+    set_dir = os.path.join(data_dir, str(num_events) + '_' + str(seed))
+    manifest_path = os.path.join(set_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return manifest['xml'], manifest['syngo']
+    xml_paths, syngo_paths = synthetic_data.generate_dataset(set_dir, num_events, seed)
+    with open(manifest_path, 'w') as f:
+        json.dump({'xml' : xml_paths, 'syngo' : syngo_paths}, f)
+    return xml_paths, syngo_paths
+
+def get_benchmark_inquiry_classes():
+    """The active inquiries, or every inquiry in srqi.inquiries if none
+    have been activated.
+    """
+    inq_classes = my_utils.get_inquiry_classes()
+    if not inq_classes:
+        inq_classes = my_utils.get_inquiry_classes(srqi.inquiries)
+    return inq_classes
+
+def _widen_date_parameters(inq_cls, first_date, last_date):
+    """Set the date parameters of an inquiry class so that the whole
+    synthetic data set is included no matter when it was generated.
+
+    Returns:
+        a dict mapping parameter name -> its old value, for
+            _restore_parameters
+    """
+    old_values = {}
+    for name in inq_cls.get_parameter_names():
+        param = getattr(inq_cls, name)
+        if not isinstance(param.value, datetime.date):
+            continue
+        old_values[name] = param.value
+        if 'END' in name:
+            param.set_value(last_date + datetime.timedelta(days = 1))
+        else:
+            param.set_value(first_date)
+    return old_values
+
+def _restore_parameters(inq_cls, old_values):
+    for name, value in old_values.iteritems():
+        getattr(inq_cls, name).set_value(value)
+
+def _time_inquiry(instr, inq_cls, procs, extra_procs):
+    name = inq_cls.__name__
+    with instr.stage(name + '.run', 'inquiry'):
+        inq = inq_cls(procs, extra_procs = extra_procs)
+    with instr.stage(name + '.get_tables', 'inquiry'):
+        tables = inq.get_tables()
+        if tables is not None:
+            for table in tables:
+                for row in table:
+                    pass # make sure lazily generated tables are generated
+    with instr.stage(name + '.get_figures', 'inquiry'):
+        figs = inq.get_figures()
+    plt.close('all')
+
+def benchmark_size(xml_paths, syngo_paths, inq_classes):
+    """Time every stage on one data set
+
+    Returns:
+        a dict mapping stage name -> Stage_Record.to_dict(), with an
+            additional 'error' key for inquiries that raised an exception
+    """
+    instr = instrumentation.Instrumentation()
+    num_events = 0
+    with instr.stage("process_files", 'ingest'):
+        procs, extra_procs = srdata.process_files(xml_paths, syngo_paths, instr)
+    num_events = sum([len(p._events) for p in procs])
+    # time the Syngo stages on their own as well, since process_files
+    # includes them in its total
+    with instr.stage("parse_syngo_files", 'ingest') as record:
+        syngo_procs = Parse_Syngo.parse_syngo_files(syngo_paths)
+        record.count = len(syngo_procs)
+    with instr.stage("add_syngo_to_procedures", 'ingest') as record:
+        srdata.add_syngo_to_procedures(procs, syngo_procs)
+        record.count = len(procs)
+    if procs:
+        first_date = min([p.StudyDate for p in procs])
+        last_date = max([p.StudyDate for p in procs])
+    errors = {}
+    for inq_cls in inq_classes:
+        old_values = {}
+        if procs:
+            old_values = _widen_date_parameters(inq_cls, first_date, last_date)
+        try:
+            _time_inquiry(instr, inq_cls, procs, extra_procs)
+        except Exception as e:
+            errors[inq_cls.__name__] = traceback.format_exc()
+        finally:
+            _restore_parameters(inq_cls, old_values)
+    out = {}
+    for record in instr.get_records():
+        d = record.to_dict()
+        # report every stage in events per second so sizes can be compared
+        d['events'] = num_events
+        d['throughput'] = num_events/d['seconds'] if d['seconds'] else None
+        out[record.name] = d
+    for inq_name, error in errors.iteritems():
+        for stage_name in out.keys():
+            if stage_name.startswith(inq_name + '.'):
+                out[stage_name]['error'] = error
+        if not inq_name + '.run' in out:
+            out[inq_name + '.run'] = {'error' : error}
+    return out
+
+def run_benchmarks(sizes, data_dir, seed = 0, log = sys.stdout):
+    inq_classes = get_benchmark_inquiry_classes()
+    if not os.path.exists(my_utils.get_output_directory()):
+        os.makedirs(my_utils.get_output_directory()) # some inquiries write files there
+    results = {'sizes' : {}, 'seed' : seed}
+    for size in sizes:
+        log.write("Benchmarking " + str(size) + " events\n")
+        xml_paths, syngo_paths = get_dataset(data_dir, size, seed)
+        results['sizes'][str(size)] = benchmark_size(xml_paths, syngo_paths, inq_classes)
+    return results
+
+def find_regressions(results, baseline, tolerance = DEFAULT_TOLERANCE,
+                     min_seconds = MIN_SECONDS,
+                     memory_tolerance = DEFAULT_MEMORY_TOLERANCE):
+    """Compare results against baseline results
+
+    Returns:
+        a list of (size, stage name, measure, baseline value, new value)
+            where measure is 'seconds' for every stage that got slower by
+            more than `tolerance`, or 'peak_rss' for every stage whose peak
+            memory grew by more than `memory_tolerance`
+    """
+    regressions = []
+    for size, stages in results['sizes'].iteritems():
+        if not size in baseline['sizes']:
+            continue
+        for name, d in stages.iteritems():
+            old = baseline['sizes'][size].get(name)
+            if old is None:
+                continue
+            for measure, measure_tolerance in (('seconds', tolerance),
+                                               ('peak_rss', memory_tolerance)):
+                if old.get(measure) is None or d.get(measure) is None:
+                    continue
+                if measure == 'seconds' and old['seconds'] < min_seconds:
+                    continue
+                if d[measure] > old[measure]*(1 + measure_tolerance):
+                    regressions.append((size, name, measure, old[measure], d[measure]))
+    return sorted(regressions)
+
+def format_results(results):
+    lines = []
+    for size in sorted(results['sizes'].keys(), key = int):
+        lines.append("== " + size + " events ==")
+        lines.append("%-50s %10s %14s %10s" % ("Stage", "Seconds", "Events/s", "Peak MB"))
+        stages = results['sizes'][size]
+        for name in sorted(stages.keys()):
+            d = stages[name]
+            if 'error' in d and d.get('seconds') is None:
+                lines.append("%-50s %10s" % (name, "ERROR"))
+                continue
+            peak = d.get('peak_rss')
+            lines.append("%-50s %10.3f %14s %10s" % (name, d['seconds'],
+                                                     '' if not d.get('throughput') else "%.0f" % d['throughput'],
+                                                     '' if peak is None else "%.1f" % (peak/(1024.0*1024.0))))
+    return '\n'.join(lines)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark srqi on synthetic data")
+    parser.add_argument('--sizes', default = ','.join([str(s) for s in DEFAULT_SIZES]),
+                        help = "comma separated numbers of irradiation events")
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--data-dir', default = os.path.join(my_utils.get_output_directory(), 'benchmark_data'),
+                        help = "where generated data sets are cached")
+    parser.add_argument('--output', default = os.path.join(my_utils.get_output_directory(), 'benchmark.json'),
+                        help = "where to write the results")
+    parser.add_argument('--baseline', help = "results file to compare against")
+    parser.add_argument('--save-baseline', help = "also write the results to this path")
+    parser.add_argument('--tolerance', type = float, default = DEFAULT_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type = float, default = DEFAULT_MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+    sizes = [int(float(s)) for s in args.sizes.split(',')]
+    results = run_benchmarks(sizes, args.data_dir, args.seed)
+    print format_results(results)
+    for path in [args.output, args.save_baseline]:
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(path, 'w') as f:
+                json.dump(results, f, indent = 2, sort_keys = True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance,
+                                       memory_tolerance = args.memory_tolerance)
+        for size, name, measure, old, new in regressions:
+            if measure == 'peak_rss':
+                print "REGRESSION %s events, %s: peak memory %.1f MB -> %.1f MB" % (
+                    size, name, old/(1024.0*1024.0), new/(1024.0*1024.0))
+            else:
+                print "REGRESSION %s events, %s: %.3fs -> %.3fs" % (size, name, old, new)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Measure how long it takes to discover the inquiries, the way the GUI does
+at start-up, with and without core.inquiry_registry.
+
+Every measurement is made in a new python process so that nothing is
+already imported. Both the time spent discovering inquiries and the time
+for the whole process (including starting python) are reported.
+
+== Usage ==
+
+From the top of the srqi directory:
+
+    python benchmark/startup_time.py
+    python benchmark/startup_time.py --repeats 10 --package srqi.active_inquiries
+
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import time
+
+SRQI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run in a new process. prints the seconds spent discovering inquiries
+_SCRIPT = """
+import imp, sys, time
+try:
+    import srqi
+except ImportError:
+    imp.load_module('srqi', None, %(srqi_dir)r, ('', '', imp.PKG_DIRECTORY))
+start = time.time()
+import %(package)s as package
+%(discover)s
+sys.stdout.write(repr(time.time() - start))
+"""
+
+MODES = {'eager' : "from srqi.core import my_utils\n"
+                   "my_utils.get_inquiry_classes(package)",
+         'lazy' : "from srqi.core import inquiry_registry\n"
+                  "inquiry_registry.get_lazy_inquiries(package)"}
+
+
+def measure(mode, package, repeats):
+    """
+    Returns:
+        a dict with lists of seconds under 'discover' (just finding the
+            inquiries) and 'process' (the whole python process)
+    """
+    script = _SCRIPT % {'srqi_dir' : SRQI_DIR,
+                        'package' : package,
+                        'discover' : MODES[mode]}
+    env = dict(os.environ)
+    env['MPLBACKEND'] = 'Agg'
+    out = {'discover' : [], 'process' : []}
+    for i in range(repeats):
+        start = time.time()
+        output = subprocess.check_output([sys.executable, '-c', script], env = env)
+        out['process'].append(time.time() - start)
+        out['discover'].append(float(output.strip().splitlines()[-1]))
+    return out
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Measure srqi start-up time")
+    parser.add_argument('--package', default = 'srqi.inquiries',
+                        help = "package of inquiry modules to discover")
+    parser.add_argument('--repeats', type = int, default = 5)
+    parser.add_argument('--output', help = "also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    results = {}
+    print "%-8s %14s %14s" % ("Mode", "Discover (s)", "Process (s)")
+    for mode in sorted(MODES.keys()):
+        times = measure(mode, args.package, args.repeats)
+        results[mode] = times
+        # the minimum is the least affected by whatever else is running
+        print "%-8s %14.3f %14.3f" % (mode, min(times['discover']), min(times['process']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import datetime
 import xlrd
 import my_utils
+import my_exceptions
 
 class Syngo(object):
         """Representation of a record of a procedure retrieved from Syngo.
@@ -214,7 +215,12 @@ def no_dupes(procs):
                         no_acc_table[(proc.mpi,proc.dos_start)] = proc
         return table.values() + no_acc_table.values()
                 
-def parse_syngo_file(file_name, run_no_dupes = True):
+def parse_syngo_file(file_name, run_no_dupes = True, progress = None):
+        """Parse the second sheet of a Syngo .xls file
+
+        If a progress.Progress object is passed in, my_exceptions.CancelledError
+        is raised if the run is cancelled part way through the file.
+        """
         import os
         file_extension = os.path.splitext(file_name)[1]
         if not file_extension == '.xls':
@@ -246,6 +252,8 @@ def parse_syngo_file(file_name, run_no_dupes = True):
                                 
         procedures = []
         for r in xrange(1,s.nrows):
+                if not progress is None:
+                        progress.check()
                 try:
                         procedures.append(Syngo(s.row(r),column_numbers,wb.datemode))
                 except ValueError as ve:
@@ -261,14 +269,18 @@ def parse_syngo_file(file_name, run_no_dupes = True):
         
 
 
-def parse_syngo_files(file_names):
+def parse_syngo_files(file_names, progress = None):
         out = []
         for name in file_names:
                 try:
-                        out = out + parse_syngo_file(name, run_no_dupes = False)
+                        out = out + parse_syngo_file(name, run_no_dupes = False, progress = progress)
+                except my_exceptions.CancelledError:
+                        raise
                 except:
                         print "Error while parsing Syngo file: " + name
                         raise
+                if not progress is None:
+                        progress.advance("Read " + name)
         return no_dupes(out)
 
 import xlwt
@@ -0,0 +1,205 @@
+"""Sum and count event values over groups in one vectorized pass.
+
+Many inquiries want the same few sums (dose, frames, number of events...)
+over every combination of a grouping (a period, a day, a room...) and an
+event category such as Irradiation_Event_Type. Rather than scanning the
+events once for every combination, the values are pulled out of the events
+into arrays once, and every sum is then a single np.bincount over a
+combined (group, category) index. Weighted means, such as the average
+pulse rate weighted by event duration, are two such sums divided.
+
+== Usage ==
+
+    columns = get_event_columns(procs, ['Dose_RP', 'Number_of_Pulses'])
+    days, group_ids = np.unique(columns['StudyDate'], return_inverse = True)
+    sums = grouped_sums(group_ids,
+                        [columns['Dose_RP'], columns['Number_of_Pulses'], None],
+                        columns['Irradiation_Event_Type'],
+                        ("Fluoroscopy", "Stationary Acquisition"),
+                        num_groups = len(days))
+    fluoro_dose_per_day = sums[:, 1, 0]
+    events_per_day = sums[:, 0, 2]
+
+"""
+import math
+import numbers
+import numpy as np
+
+
+def get_event_columns(procs, attributes, valid = True):
+    """Pull attributes of all the events of some procedures into arrays
+
+    Parameters:
+        procs : list of srdata.Procedure objects
+        attributes : list of names of Event attributes
+        valid : passed on to Procedure.get_events
+
+    Returns:
+        a dict mapping each of the attributes, 'Irradiation_Event_Type' and
+            'StudyDate' (of the event's procedure) to an array with one
+            entry per event, and 'procedure' to the index in procs of each
+            event's procedure. Numeric attributes give float arrays, others
+            (e.g. DateTime_Started, Irradiation_Event_UID) object arrays.
+    """
+    proc_indices = []
+    event_types = []
+    dates = []
+    values = [[] for a in attributes]
+    for i, proc in enumerate(procs):
+        events = proc.get_events(valid)
+        proc_indices.extend([i]*len(events))
+        dates.extend([proc.StudyDate]*len(events))
+        event_types.extend([e.Irradiation_Event_Type for e in events])
+        for column, attribute in zip(values, attributes):
+            column.extend([getattr(e, attribute) for e in events])
+    out = {'procedure' : np.array(proc_indices, dtype = int),
+           'Irradiation_Event_Type' : np.array(event_types, dtype = object),
+           'StudyDate' : np.array(dates, dtype = object)}
+    for attribute, column in zip(attributes, values):
+        if all([isinstance(value, numbers.Real) for value in column]):
+            out[attribute] = np.array(column, dtype = float)
+        else:
+            out[attribute] = np.array(column, dtype = object)
+    return out
+
+def get_category_codes(values, categories):
+    """Return an int array with i+1 where values is categories[i] and 0
+    where values isn't any of the categories
+    """
+    values = np.asarray(values, dtype = object)
+    codes = np.zeros(len(values), dtype = int)
+    for i, category in enumerate(categories):
+        codes[values == category] = i + 1
+    return codes
+
+def grouped_sums(group_ids, values, categories = None, category_names = (), num_groups = None):
+    """Sum several columns of values over every (group, category) at once
+
+    Parameters:
+        group_ids : int array giving each value's group, from 0 to
+            num_groups - 1
+        values : list of arrays the same length as group_ids. None in place
+            of an array counts instead of summing.
+        categories : array of each value's category (e.g. its
+            Irradiation_Event_Type), or None if there is only one
+        category_names : the categories to sum separately
+        num_groups : the number of groups. Defaults to max(group_ids) + 1.
+
+    Returns:
+        a float array sums[group, category, column] where category 0 is the
+            sum over every value in the group, whatever its category, and
+            category i + 1 is category_names[i]
+    """
+    group_ids = np.asarray(group_ids, dtype = int)
+    if num_groups is None:
+        num_groups = group_ids.max() + 1 if len(group_ids) else 0
+    num_categories = len(category_names) + 1
+    if categories is None:
+        cells = group_ids*num_categories
+    else:
+        cells = group_ids*num_categories + get_category_codes(categories, category_names)
+    size = num_groups*num_categories
+    out = np.zeros((num_groups, num_categories, len(values)))
+    for i, column in enumerate(values):
+        if column is None:
+            sums = np.bincount(cells, minlength = size)
+        else:
+            sums = np.bincount(cells, weights = np.asarray(column, dtype = float),
+                               minlength = size)
+        # column 0 of the bincount is 'none of the categories'
+        sums = sums.reshape((num_groups, num_categories))
+        out[:, 0, i] = sums.sum(axis = 1)
+        out[:, 1:, i] = sums[:, 1:]
+    return out
+
+def sum_by_group(array, group_ids, num_groups):
+    """Add up the rows of an array that share a group
+
+    Returns:
+        an array with num_groups rows, row i the sum of the rows of array
+            whose group_id is i
+    """
+    array = np.asarray(array, dtype = float)
+    out = np.zeros((num_groups,) + array.shape[1:])
+    np.add.at(out, np.asarray(group_ids, dtype = int), array)
+    return out
+
+def get_durations(number_of_pulses, pulse_rates):
+    """Same as srdata.Event.get_duration, in seconds, for arrays of the
+    events' Number_of_Pulses and Pulse_Rate
+    """
+    number_of_pulses = np.asarray(number_of_pulses, dtype = float)
+    pulse_rates = np.asarray(pulse_rates, dtype = float)
+    single = number_of_pulses == 1
+    # single pulse events have no duration, whatever their pulse rate
+    return np.where(single, 0., (number_of_pulses - 1)/np.where(single, 1., pulse_rates))
+
+def weighted_means(group_ids, values, weights, num_groups = None):
+    """Weighted mean of the values in each group
+
+    Returns:
+        (means, total weights) arrays with an entry per group. The mean is
+            nan for groups with no weight.
+    """
+    sums = grouped_sums(group_ids, [np.asarray(values, dtype = float)*weights, weights],
+                        num_groups = num_groups)[:, 0, :]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        means = sums[:, 0]/sums[:, 1]
+    return means, sums[:, 1]
+
+def average_fps(group_ids, number_of_pulses, pulse_rates, num_groups = None):
+    """Average pulse rate of the events in each group, weighted by the
+    events' durations (see my_utils.average_fps)
+
+    Parameters:
+        group_ids : int array of each event's group (period, physician,
+            room...)
+        number_of_pulses : array of each event's Number_of_Pulses
+        pulse_rates : array of each event's Pulse_Rate
+        num_groups : the number of groups. Defaults to max(group_ids) + 1.
+
+    Returns:
+        (averages, total durations in seconds) arrays with an entry per
+            group. The average is nan for groups with no duration.
+    """
+    durations = get_durations(number_of_pulses, pulse_rates)
+    return weighted_means(group_ids, pulse_rates, durations, num_groups)
+
+def get_bin_edges(low, high, bin_size):
+    """Return the edges of bins of width bin_size from low up to (at least)
+    high
+    """
+    num_bins = max(int(math.ceil((high - low)/float(bin_size))), 1)
+    return low + bin_size*np.arange(num_bins + 1)
+
+def grid_sums(group_ids, xs, ys, weights, x_edges, y_edges, num_groups = None):
+    """Sum weights over a fixed 2-D grid of (x, y) bins for every group at
+    once, like one np.histogram2d per group
+
+    Values outside the edges are put in the nearest bin at the edge of the
+    grid. Values that are nan (e.g. missing) are left out.
+
+    Parameters:
+        group_ids : int array giving each value's group, from 0 to
+            num_groups - 1
+        xs, ys, weights : arrays the same length as group_ids
+        x_edges, y_edges : increasing arrays of bin edges
+        num_groups : the number of groups. Defaults to max(group_ids) + 1.
+
+    Returns:
+        a float array sums[group, x bin, y bin]
+    """
+    group_ids = np.asarray(group_ids, dtype = int)
+    xs = np.asarray(xs, dtype = float)
+    ys = np.asarray(ys, dtype = float)
+    weights = np.asarray(weights, dtype = float)
+    if num_groups is None:
+        num_groups = group_ids.max() + 1 if len(group_ids) else 0
+    num_x = len(x_edges) - 1
+    num_y = len(y_edges) - 1
+    known = ~(np.isnan(xs) | np.isnan(ys) | np.isnan(weights))
+    x_bins = np.clip(np.searchsorted(x_edges, xs[known], 'right') - 1, 0, num_x - 1)
+    y_bins = np.clip(np.searchsorted(y_edges, ys[known], 'right') - 1, 0, num_y - 1)
+    cells = (group_ids[known]*num_x + x_bins)*num_y + y_bins
+    sums = np.bincount(cells, weights = weights[known], minlength = num_groups*num_x*num_y)
+    return sums.reshape((num_groups, num_x, num_y))
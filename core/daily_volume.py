@@ -0,0 +1,159 @@
+"""Count procedures per day and find days that look like missing data.
+
+Days are numbered by their ordinal (datetime.date.toordinal), so the
+number of procedures on every day of every machine is a single
+np.bincount over (machine, day) indices, however many years and rooms
+there are.
+
+A day looks like missing data when it has far fewer procedures than the
+same weekday usually has on that machine. The usual number (the baseline)
+is the median of the same weekday over the previous few weeks, so
+quiet weekends aren't flagged, but a Tuesday with no procedures in a room
+that does ten every Tuesday is. Runs of flagged days are reported as one
+gap.
+
+== Usage ==
+
+    counts = daily_counts(ordinals, device_ids, num_devices, first, num_days)
+    baseline = weekday_baseline(counts, 4)
+    for device, start, end in find_gaps(counts, baseline, .25):
+        ...
+
+"""
+import numpy as np
+
+DAYS_PER_WEEK = 7
+
+
+def daily_counts(ordinals, group_ids, num_groups, first, num_days):
+    """Count the values on each day in each group
+
+    Parameters:
+        ordinals : int array of the day of each value, as date ordinals
+        group_ids : int array of the group of each value, from 0 to
+            num_groups - 1
+        first : the ordinal of the first day to count
+        num_days : the number of days to count. values on days outside of
+            first to first + num_days - 1 are left out.
+
+    Returns:
+        an array counts[group, day - first]
+    """
+    days = np.asarray(ordinals, dtype = int) - first
+    group_ids = np.asarray(group_ids, dtype = int)
+    inside = (days >= 0) & (days < num_days)
+    counts = np.bincount(group_ids[inside]*num_days + days[inside],
+                         minlength = num_groups*num_days)
+    return counts.reshape((num_groups, num_days))
+
+
+class Daily_Counts(object):
+    """Number of values on each day, for days added in any order. Mergeable,
+    like the sketches in core.sketches.
+
+    Attributes:
+        first : the ordinal of the first day counted, or None if nothing has
+            been counted
+        counts : int array, counts[i] is the number of values on day
+            first + i
+    """
+
+    def __init__(self):
+        self.first = None
+        self.counts = np.zeros(0, dtype = int)
+
+    def add_counts(self, first, counts):
+        """Add counts[i] to the count of day first + i"""
+        counts = np.asarray(counts, dtype = int)
+        if self.first is None:
+            self.first = first
+            self.counts = counts.copy()
+            return
+        new_first = min(first, self.first)
+        new_last = max(first + len(counts), self.first + len(self.counts))
+        out = np.zeros(new_last - new_first, dtype = int)
+        out[self.first - new_first:self.first - new_first + len(self.counts)] += self.counts
+        out[first - new_first:first - new_first + len(counts)] += counts
+        self.first = new_first
+        self.counts = out
+
+    def extend(self, ordinals):
+        """Count values on the days with the given ordinals"""
+        ordinals = np.asarray(ordinals, dtype = int)
+        if len(ordinals):
+            first = ordinals.min()
+            self.add_counts(first, np.bincount(ordinals - first))
+
+    def merge(self, other):
+        if not other.first is None:
+            self.add_counts(other.first, other.counts)
+        return self
+
+    def get_counts(self, first, num_days):
+        """Return an int array of the counts of the num_days days starting
+        with ordinal first, with 0 for days that weren't counted
+        """
+        out = np.zeros(num_days, dtype = int)
+        if self.first is None:
+            return out
+        low = max(first, self.first)
+        high = min(first + num_days, self.first + len(self.counts))
+        if low < high:
+            out[low - first:high - first] = self.counts[low - self.first:high - self.first]
+        return out
+
+
+def weekday_baseline(counts, weeks):
+    """The usual count of each day: the median of the same weekday over the
+    previous `weeks` weeks
+
+    Parameters:
+        counts : array counts[group, day] of consecutive days
+
+    Returns:
+        a float array the same shape as counts. nan for days in the first
+            `weeks` weeks, which don't have enough weeks before them.
+    """
+    counts = np.asarray(counts, dtype = float)
+    num_days = counts.shape[-1]
+    # previous[k - 1, group, day] is the count k weeks before day
+    previous = np.empty((weeks,) + counts.shape)
+    previous.fill(np.nan)
+    for k in range(1, weeks + 1):
+        shift = k*DAYS_PER_WEEK
+        if shift < num_days:
+            previous[k - 1, ..., shift:] = counts[..., :num_days - shift]
+    missing = np.isnan(previous).any(axis = 0)
+    previous[:, missing] = 0
+    baseline = np.median(previous, axis = 0)
+    baseline[missing] = np.nan
+    return baseline
+
+def find_gaps(counts, baseline, fraction, min_baseline = 5.0):
+    """Find runs of days whose count is at most `fraction` of the baseline
+
+    Parameters:
+        counts : array counts[group, day]
+        baseline : array the same shape as counts (see weekday_baseline)
+        fraction : a day is flagged if its count <= fraction*baseline
+        min_baseline : days whose baseline is less than this (e.g. weekends)
+            are never flagged. For a machine that only does a couple of
+            procedures a day, a day without any is just chance.
+
+    Returns:
+        a list of (group, first day index, last day index) for each run of
+            consecutive flagged days, in order of group then day
+    """
+    counts = np.atleast_2d(np.asarray(counts, dtype = float))
+    baseline = np.atleast_2d(np.asarray(baseline, dtype = float))
+    with np.errstate(invalid = 'ignore'):
+        flagged = (baseline >= min_baseline) & (counts <= fraction*baseline)
+    num_groups, num_days = flagged.shape
+    # a False column between groups, so runs don't continue into the next
+    padded = np.zeros((num_groups, num_days + 1), dtype = int)
+    padded[:, :num_days] = flagged
+    changes = np.diff(np.concatenate(([0], padded.ravel())))
+    starts = np.flatnonzero(changes == 1)
+    ends = np.flatnonzero(changes == -1) - 1
+    return [(int(s//(num_days + 1)), int(s%(num_days + 1)), int(e%(num_days + 1)))
+            for s, e in zip(starts, ends)]
@@ -0,0 +1,181 @@
+"""Test many groups of values for normality and lognormality at once.
+
+Inquiries such as Syngo_Stats test the fluoro times of every CPT code
+combination with the Anderson-Darling test. The values are split into
+groups once (one sort rather than a filtered list per group), the groups
+are tested in a pool of worker processes, and the results are saved in a
+cache directory under a fingerprint of the grouped values, so drawing the
+report again, or running again on the same data, doesn't refit them.
+
+== Usage ==
+
+    groups = group_values(cpt_of_each_proc, fluoro_times)
+    fits = Fit_Cache(directory).fit(groups)
+    fits[cpt].lognormal.statistic
+
+"""
+import os
+import hashlib
+import cPickle as pickle
+import multiprocessing
+import numpy as np
+from scipy.stats import anderson
+
+FIT_VERSION = 1 # change when Fit_Result changes, so cached fits are refit
+MIN_POOL_GROUPS = 200 # fewer groups than this are fit in this process
+
+
+def group_values(keys, values):
+    """Split values into groups by key
+
+    Parameters:
+        keys : list of the (hashable, sortable) group of each value
+        values : list or array of numbers
+
+    Returns:
+        a dict mapping each key to a float array of its values, in the order
+            they were given
+    """
+    values = np.asarray(values, dtype = float)
+    if not len(values):
+        return {}
+    unique_keys, key_ids = np.unique(np.array(keys, dtype = object), return_inverse = True)
+    order = np.argsort(key_ids, kind = 'mergesort')
+    bounds = np.searchsorted(key_ids[order], np.arange(len(unique_keys) + 1))
+    out = {}
+    for i, key in enumerate(unique_keys):
+        out[key] = values[order[bounds[i]:bounds[i+1]]]
+    return out
+
+
+class Anderson_Result(object):
+    """The result of scipy.stats.anderson
+
+    Attributes:
+        statistic : the Anderson-Darling statistic
+        critical_values : list of critical values of the statistic
+        significance_levels : list of the significance levels (in percent)
+            of each critical value
+    """
+    def __init__(self, statistic, critical_values, significance_levels):
+        self.statistic = float(statistic)
+        self.critical_values = list(critical_values)
+        self.significance_levels = list(significance_levels)
+
+
+class Fit_Result(object):
+    """How well one group of values fits a normal and a lognormal
+    distribution
+
+    Attributes:
+        count : the number of values
+        normal : Anderson_Result for the values, or None if they can't be
+            tested (fewer than two, or all the same)
+        lognormal : Anderson_Result for the log of the values, or None if
+            they can't be tested (as for normal, or some aren't positive)
+    """
+    def __init__(self, count, normal, lognormal):
+        self.count = count
+        self.normal = normal
+        self.lognormal = lognormal
+
+
+def _test_normal(values):
+    if len(values) < 2 or values.min() == values.max():
+        return None
+    return Anderson_Result(*anderson(values, dist = 'norm'))
+
+def fit_values(values):
+    """Return a Fit_Result for an array of values"""
+    values = np.asarray(values, dtype = float)
+    lognormal = None
+    if len(values) and values.min() > 0:
+        lognormal = _test_normal(np.log(values))
+    return Fit_Result(len(values), _test_normal(values), lognormal)
+
+def fit_groups(groups, processes = None):
+    """Fit every group of values (see fit_values)
+
+    Parameters:
+        groups : dict mapping key -> array of values (see group_values)
+        processes : number of worker processes. defaults to the number of
+            cpus. if 1, or if there are few groups, everything is done in
+            this process.
+
+    Returns:
+        a dict mapping each key to a Fit_Result
+    """
+    keys = sorted(groups.keys())
+    arrays = [groups[key] for key in keys]
+    if processes == 1 or len(keys) < MIN_POOL_GROUPS:
+        results = [fit_values(a) for a in arrays]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(fit_values, arrays,
+                               chunksize = max(len(arrays)//(4*multiprocessing.cpu_count()), 1))
+        finally:
+            pool.close()
+            pool.join()
+    return dict(zip(keys, results))
+
+def get_fingerprint(groups):
+    """Return a hex string that is the same for any two dicts of groups with
+    the same keys and values
+    """
+    digest = hashlib.sha1(str(FIT_VERSION))
+    for key in sorted(groups.keys()):
+        digest.update(repr(key))
+        values = np.ascontiguousarray(groups[key], dtype = float)
+        digest.update(str(len(values)))
+        digest.update(values.tostring())
+    return digest.hexdigest()
+
+
+class Fit_Cache(object):
+
+    def __init__(self, directory):
+        """
+        Parameters:
+            directory : where the fits are saved. Created if it doesn't
+                exist.
+        """
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_path(self, fingerprint):
+        return os.path.join(self.directory, 'fits_' + fingerprint + '.pkl')
+
+    def load(self, fingerprint):
+        """Return the saved fits for a fingerprint, or None if there aren't
+        any (or they can't be read)
+        """
+        path = self.get_path(fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def save(self, fingerprint, fits):
+        path = self.get_path(fingerprint)
+        # write then rename, so a half written file is never loaded
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(fits, f, pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+
+    def fit(self, groups, processes = None):
+        """Same as fit_groups, but returns the saved fits if these groups
+        have been fit before
+        """
+        fingerprint = get_fingerprint(groups)
+        fits = self.load(fingerprint)
+        if fits is None:
+            fits = fit_groups(groups, processes)
+            self.save(fingerprint, fits)
+        return fits
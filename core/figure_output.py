@@ -0,0 +1,184 @@
+"""Save inquiries' figures in worker processes, skipping unchanged ones.
+
+Drawing a figure into a .png is often the slowest part of writing a
+report, and some inquiries (Operator_Improvement, High_Cases) make dozens
+of figures. `save_figures` sends the figures to a pool of worker
+processes, which draw them with the Agg backend, and closes every figure
+once it is saved so they don't pile up in memory.
+
+Each figure is also fingerprinted by the data it shows (line and marker
+coordinates, colors, images, text, axis limits and so on). The
+fingerprints of the saved files are kept in a Figure_Manifest next to
+them, and a figure whose file is already there with the same fingerprint
+isn't drawn again.
+
+== Usage ==
+
+    save_figures(inq.get_figures(), paths)
+
+"""
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.axes, matplotlib.axis, matplotlib.collections, matplotlib.image
+import matplotlib.lines, matplotlib.patches, matplotlib.text
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+FIGURE_DPI = 100
+MIN_POOL_FIGURES = 4 # fewer figures than this are saved in this process
+MANIFEST_NAME = 'figure_hashes.json'
+
+_manifest_lock = threading.Lock()
+
+
+def _update_array(digest, values):
+    values = np.ma.getdata(values)
+    try:
+        values = np.ascontiguousarray(values, dtype = float)
+    except (TypeError, ValueError):
+        digest.update(repr(values.tolist() if hasattr(values, 'tolist') else values))
+        return
+    digest.update(str(values.shape))
+    digest.update(values.tostring())
+
+def _update_artist(digest, artist):
+    digest.update(type(artist).__name__)
+    digest.update(str(artist.get_visible()))
+    if isinstance(artist, matplotlib.lines.Line2D):
+        _update_array(digest, artist.get_xydata())
+        digest.update(repr((artist.get_color(), artist.get_linestyle(),
+                            artist.get_linewidth(), artist.get_marker())))
+    elif isinstance(artist, matplotlib.collections.Collection):
+        _update_array(digest, artist.get_offsets())
+        if not artist.get_array() is None:
+            _update_array(digest, artist.get_array())
+        for path in artist.get_paths():
+            _update_array(digest, path.vertices)
+        _update_array(digest, artist.get_facecolors())
+        _update_array(digest, artist.get_edgecolors())
+        if isinstance(artist, matplotlib.collections.PathCollection):
+            _update_array(digest, artist.get_sizes())
+    elif isinstance(artist, matplotlib.image.AxesImage):
+        _update_array(digest, artist.get_array())
+        digest.update(repr(artist.get_extent()))
+    elif isinstance(artist, matplotlib.text.Text):
+        digest.update(repr((artist.get_text(), artist.get_position(), artist.get_fontsize(),
+                            artist.get_rotation(), artist.get_color())))
+    elif isinstance(artist, matplotlib.patches.Patch):
+        _update_array(digest, artist.get_path().vertices)
+        _update_array(digest, artist.get_patch_transform().get_matrix())
+        _update_array(digest, artist.get_facecolor())
+    elif isinstance(artist, matplotlib.axes.Axes):
+        digest.update(repr((artist.get_xlim(), artist.get_ylim(),
+                            artist.get_xscale(), artist.get_yscale(),
+                            artist.get_position().bounds)))
+    elif isinstance(artist, matplotlib.axis.Axis):
+        # tick labels are only made when the figure is drawn, so use what
+        # they will be made from
+        for ticker in (artist.get_major_locator(), artist.get_major_formatter()):
+            digest.update(type(ticker).__name__)
+            for attr in ('locs', 'seq'):
+                if hasattr(ticker, attr):
+                    digest.update(repr(list(getattr(ticker, attr))))
+
+def get_figure_hash(fig, dpi = FIGURE_DPI):
+    """Return a hex string that is the same for any two figures that show
+    the same data in the same way, so will be saved the same
+    """
+    digest = hashlib.sha1(repr((dpi, tuple(fig.get_size_inches()))))
+    for artist in fig.findobj():
+        _update_artist(digest, artist)
+    return digest.hexdigest()
+
+
+class Figure_Manifest(object):
+    """The hashes (see get_figure_hash) of the figures saved in a directory
+
+    Several threads may share the file, so it is reread and written in
+    one step by `update`.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def get_hashes(self):
+        """Return a dict mapping file name -> hash"""
+        with _manifest_lock:
+            return self._read()
+
+    def update(self, hashes):
+        """Add (or replace) the hashes of some file names"""
+        with _manifest_lock:
+            out = self._read()
+            out.update(hashes)
+            with open(self.path, 'w') as f:
+                json.dump(out, f, indent = 1, sort_keys = True)
+
+
+def _init_worker():
+    plt.switch_backend('agg')
+
+def _save_figure(args):
+    fig, path, dpi = args
+    FigureCanvasAgg(fig)
+    fig.savefig(path, dpi = dpi)
+    plt.close('all')
+    return path
+
+def save_figures(figs, paths, dpi = FIGURE_DPI, processes = None):
+    """Save figs[i] to paths[i] as images, unless the file is already there
+    and the figure is the same as when it was saved. Closes the figures.
+
+    Parameters:
+        figs : list of matplotlib Figure objects
+        paths : list of file paths, which must all be in one directory
+        processes : number of worker processes. defaults to the number of
+            cpus. if 1, or if there are only a few figures to save,
+            everything is done in this process.
+
+    Returns:
+        the list of paths that were saved (not skipped)
+    """
+    if not figs:
+        return []
+    manifest = Figure_Manifest(os.path.dirname(paths[0]))
+    saved_hashes = manifest.get_hashes()
+    todo = []
+    hashes = {}
+    for fig, path in zip(figs, paths):
+        name = os.path.basename(path)
+        hashes[name] = get_figure_hash(fig, dpi)
+        if saved_hashes.get(name) != hashes[name] or not os.path.exists(path):
+            todo.append((fig, path, dpi))
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    try:
+        if processes == 1 or len(todo) < MIN_POOL_FIGURES:
+            for fig, path, dpi in todo:
+                fig.savefig(path, dpi = dpi)
+        else:
+            pool = multiprocessing.Pool(processes, _init_worker)
+            try:
+                pool.map(_save_figure, todo)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        for fig in figs:
+            plt.close(fig)
+    manifest.update(hashes)
+    return [path for fig, path, dpi in todo]
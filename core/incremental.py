@@ -0,0 +1,184 @@
+"""Keep the partial state of streaming inquiries on disk so that they can
+be brought up to date with just the data that has arrived since they were
+last run.
+
+The state of a inquiry.Streaming_Inquiry after `consume` is additive (see
+its `merge` method), so when new DICOM-SR exports are added only the new
+files need to be read. The store remembers which files each inquiry has
+already consumed. If one of those files has changed or disappeared, or
+the inquiry's parameters have changed, the saved state no longer matches
+the data and the inquiry is rebuilt from all of the files. Files that a
+saved state refers to are kept in a directory of its own next to it (see
+Streaming_Inquiry.state_directory).
+
+== Usage ==
+
+    store = Aggregate_Store('aggregates')
+    inqs = store.refresh([Modality_Usage, Room_Usage], xml_paths)
+
+"""
+import os
+import shutil
+import cPickle as pickle
+import srdata
+import streaming
+from instrumentation import stage_or_null
+
+STATE_VERSION = 6
+
+
+def get_file_signature(path):
+    """Return (absolute path, modification time, size) for a file, which is
+    used to tell whether a file has changed since it was consumed.
+    """
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime, st.st_size)
+
+
+class Aggregate_State(object):
+    """What is saved for one inquiry class
+
+    Attributes:
+        partial : the Streaming_Inquiry after consuming `files`, but
+            before `finish`
+        parameters : dict of the inquiry's parameter values when it was
+            computed
+        files : dict mapping absolute path -> file signature for every
+            file consumed so far
+    """
+    def __init__(self, partial, parameters, files):
+        self.version = STATE_VERSION
+        self.partial = partial
+        self.parameters = parameters
+        self.files = files
+
+
+class Aggregate_Store(object):
+
+    def __init__(self, directory):
+        """
+        Parameters:
+            directory : where the state files are kept. Created if it
+                doesn't exist.
+        """
+        self.directory = directory
+
+    def get_state_path(self, inq_cls):
+        return os.path.join(self.directory,
+                            inq_cls.__module__ + '.' + inq_cls.__name__ + '.pkl')
+
+    def get_state_directory(self, inq_cls):
+        """Return the directory for the files that the saved state of
+        inq_cls refers to
+        """
+        return os.path.splitext(self.get_state_path(inq_cls))[0] + '_files'
+
+    def load(self, inq_cls):
+        """Return the saved Aggregate_State for inq_cls, or None if there
+        isn't one that can be used with its current parameters.
+        """
+        path = self.get_state_path(inq_cls)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if getattr(state, 'version', None) != STATE_VERSION:
+            return None
+        if state.parameters != inq_cls.get_parameter_values():
+            return None
+        return state
+
+    def save(self, inq_cls, state):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        path = self.get_state_path(inq_cls)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(path):
+            os.remove(path) # os.rename won't replace a file on Windows
+        os.rename(tmp_path, path)
+
+    def clear(self, inq_cls):
+        path = self.get_state_path(inq_cls)
+        if os.path.exists(path):
+            os.remove(path)
+        directory = self.get_state_directory(inq_cls)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+    def _get_usable_state(self, inq_cls, signatures):
+        """Return the saved state for inq_cls if every file it has consumed
+        is still in `signatures` unchanged and every file it refers to is
+        still there, otherwise a new empty state.
+        """
+        state = self.load(inq_cls)
+        if not state is None:
+            for path, signature in state.files.iteritems():
+                if signatures.get(path) != signature:
+                    state = None
+                    break
+        if not state is None:
+            for path in state.partial.get_state_files():
+                if not os.path.exists(path):
+                    state = None
+                    break
+        if state is None:
+            self.clear(inq_cls)
+            partial = inq_cls.new_partial()
+            partial.state_directory = self.get_state_directory(inq_cls)
+            state = Aggregate_State(partial,
+                                    inq_cls.get_parameter_values(),
+                                    {})
+        return state
+
+    def refresh(self, inquiry_classes, xml_file_names,
+                chunk_size = streaming.DEFAULT_CHUNK_SIZE, instrumentation = None):
+        """Bring the saved state of each inquiry class up to date with
+        xml_file_names and return finished inquiries.
+
+        Only files that an inquiry hasn't already consumed are read, and
+        each of those is only read once no matter how many inquiries need
+        it.
+
+        Parameters:
+            inquiry_classes : list of Streaming_Inquiry subclasses
+            xml_file_names : every DICOM-SR xml file in the data set, both
+                old and new
+            chunk_size : number of procedures passed to consume at a time
+
+        Returns:
+            a list of finished inquiries, one per class in inquiry_classes
+        """
+        streaming._check_streamable(inquiry_classes)
+        paths = []
+        signatures = {}
+        for name in xml_file_names:
+            signature = get_file_signature(name)
+            if not signature[0] in signatures:
+                paths.append(signature[0])
+                signatures[signature[0]] = signature
+        states = [self._get_usable_state(inq_cls, signatures) for inq_cls in inquiry_classes]
+        changed = set([id(s) for s in states if not s.files])
+        for path in paths:
+            needing = [s for s in states if not path in s.files]
+            if not needing:
+                continue
+            with stage_or_null(instrumentation, "consume " + os.path.basename(path), 'ingest'):
+                for chunk in srdata.iter_procedure_chunks([path], chunk_size):
+                    for state in needing:
+                        state.partial.consume_unfiltered(chunk)
+            for state in needing:
+                state.files[path] = signatures[path]
+                changed.add(id(state))
+        inqs = []
+        for inq_cls, state in zip(inquiry_classes, states):
+            if id(state) in changed:
+                self.save(inq_cls, state)
+            with stage_or_null(instrumentation, inq_cls.__name__ + '.finish', 'inquiry'):
+                state.partial.finish()
+            inqs.append(state.partial)
+        return inqs
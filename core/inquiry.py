@@ -1,7 +1,6 @@
 from srqi.core import my_utils
-from srqi.gui import report_writer
+from srqi.core import products as products_module
 import os
-import matplotlib.pyplot as plt
 import datetime
 
 class Inquiry_Parameter(object):
@@ -72,23 +71,64 @@ class Inquiry(object):
     """
     description = "No description entered."
     
-    def __init__(self, sr_procs, context = None, extra_procs = None):
+    def __init__(self, sr_procs, context = None, extra_procs = None, products = None):
         """Initializer
 
         Should not be overridden in sublcasses
+
+        Parameters:
+            products : optional products.Product_Store holding products
+                already computed from the same (filtered) procedures. Used
+                by scheduler.Inquiry_Scheduler to share work between
+                inquiries. If None, products are computed on demand.
         """
+        if extra_procs is None:
+            extra_procs = []
         sr_procs, context, extra_procs = self._handle_standard_parameters(sr_procs, context, extra_procs)
+        if products is None:
+            products = products_module.Product_Store(sr_procs, extra_procs)
+        self._products = products
         self.run(sr_procs, context, extra_procs)
 
-    def _handle_standard_parameters(self, sr_procs, context, extra_procs):
-        if hasattr(self, 'DATE_RANGE_START'):
-            sr_procs = [p for p in sr_procs if p.StudyDate >= self.DATE_RANGE_START.value]
-            extra_procs = [p for p in extra_procs if p.get_start_date() >= self.DATE_RANGE_START.value]
-        if hasattr(self, 'DATE_RANGE_END'):
-            sr_procs = [p for p in sr_procs if p.StudyDate < self.DATE_RANGE_END.value]
-            extra_procs = [p for p in extra_procs if p.get_start_date() < self.DATE_RANGE_END.value]
+    @classmethod
+    def _handle_standard_parameters(cls, sr_procs, context, extra_procs):
+        if hasattr(cls, 'DATE_RANGE_START'):
+            sr_procs = [p for p in sr_procs if p.StudyDate >= cls.DATE_RANGE_START.value]
+            extra_procs = [p for p in extra_procs if p.get_start_date() >= cls.DATE_RANGE_START.value]
+        if hasattr(cls, 'DATE_RANGE_END'):
+            sr_procs = [p for p in sr_procs if p.StudyDate < cls.DATE_RANGE_END.value]
+            extra_procs = [p for p in extra_procs if p.get_start_date() < cls.DATE_RANGE_END.value]
         return sr_procs, context, extra_procs
 
+    @classmethod
+    def get_data_filter_key(cls):
+        """Return a hashable value that is the same for any two inquiry
+        classes whose standard parameters select the same procedures
+        """
+        key = []
+        for name in ('DATE_RANGE_START', 'DATE_RANGE_END'):
+            if hasattr(cls, name):
+                key.append(getattr(cls, name).value)
+            else:
+                key.append(None)
+        return tuple(key)
+
+    @classmethod
+    def get_required_products(cls):
+        """Return a list of products.Product_Request objects for the
+        products that `run` will ask for with self.get_product.
+
+        Declaring them lets the scheduler compute them ahead of time and
+        share them with other inquiries. Defaults to none.
+        """
+        return []
+
+    def get_product(self, name, **params):
+        """Return the named product (see core.products) computed from the
+        procedures this inquiry is being run on.
+        """
+        return self._products.get(name, **params)
+
 
     @classmethod
     def get_parameters(cls):
@@ -104,6 +144,12 @@ class Inquiry(object):
                 names.append(attr_name)
         return names
 
+    @classmethod
+    def get_parameter_values(cls):
+        """Return a dict mapping the name of each parameter to its value
+        """
+        return dict([(name, getattr(cls, name).value) for name in cls.get_parameter_names()])
+
     def run(self, sr_procs, context, extra_procs):
         """Do all the necessary work with the data
         and save the stuff you need for the other methods
@@ -162,22 +208,34 @@ class Inquiry(object):
         else:
             return unicode(cls.__name__)
 
-    def get_figure_paths(self):
+    def get_figure_paths(self, figs = None):
         """Save a figure and return its
         location
 
+        The figures are saved in worker processes and closed, and figures
+        that are the same as the last time they were saved are skipped
+        (see figure_output.save_figures).
+
         Only override this method if you would like
         to use some plotting library other than matplotlib
+
+        Parameters:
+            figs : what get_figures returned, if it has already been
+                called. Otherwise it is called here.
         """
-        figs = self.get_figures()
+        from srqi.core import figure_output # imports pyplot, so not at startup
+        if figs is None:
+            figs = self.get_figures()
         if figs is None:
             return []
+        out_dir = my_utils.get_output_directory()
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
         paths = []
         for i, f in enumerate(figs):
             fig_name = unicode(self.__class__.__name__ + str(i) +'.png')
-            fig_path = os.path.join(my_utils.get_output_directory(), fig_name)
-            paths.append(fig_path)
-            f.savefig(fig_path, dpi =100)
+            paths.append(os.path.join(out_dir, fig_name))
+        figure_output.save_figures(list(figs), paths)
         return paths
             
         
@@ -188,6 +246,15 @@ class Inquiry(object):
         """
         return None
 
+    def get_sweep_summary(self):
+        """Return a list of (label, value) pairs summarizing the results
+        in a few numbers, used to compare runs with different parameter
+        values in a sweep (see core.sweep)
+
+        Returns an empty list if not overwritten
+        """
+        return []
+
     @classmethod
     def get_description(cls):
         """Return a text description of the inquiry, the requirements
@@ -208,7 +275,77 @@ class Inquiry(object):
             
         
 
+class Streaming_Inquiry(Inquiry):
+    """Base class for inquiries that can be computed a chunk of procedures
+    at a time.
+
+    Instead of overriding `run`, subclasses override
+        begin() - set up empty partial state on self
+        consume(procs, extra_procs) - add a chunk of procedures to the
+            partial state
+        merge(other) - add the partial state of another instance of the
+            same class (e.g. one computed in another process) to self
+        finish() - turn the partial state into whatever the output
+            methods need
+    The partial state must be picklable so that it can be sent between
+    processes. See core.streaming for running these over a stream of
+    procedures.
+
+    Streaming inquiries still work anywhere a normal inquiry does, since
+    `run` just consumes all of the procedures as a single chunk.
+
+    Attributes:
+        state_directory : if the partial state is saved (by
+            core.incremental) and more may be consumed into it after
+            `finish`, a directory that belongs to this state alone. Any
+            files the state refers to must then be written there and kept.
+            None if the state is only used for one run.
+    """
+    state_directory = None
+
+    def run(self, sr_procs, context, extra_procs):
+        self.begin()
+        self.consume(sr_procs, extra_procs)
+        self.finish()
+
+    @classmethod
+    def new_partial(cls):
+        """Return an instance of cls with empty partial state and
+        without running it on anything.
+        """
+        inq = cls.__new__(cls)
+        inq._products = None
+        inq.begin()
+        return inq
+
+    def consume_unfiltered(self, procs, extra_procs = ()):
+        """Apply the standard parameters (e.g. DATE_RANGE_START) to a chunk
+        and consume what is left.
+        """
+        procs, _, extra_procs = self._handle_standard_parameters(procs, None, list(extra_procs))
+        self.consume(procs, extra_procs)
+
+    def get_state_files(self):
+        """Return the files the partial state refers to. If one of them is
+        missing, core.incremental rebuilds the state rather than using it.
+        """
+        return []
+
+    def begin(self):
+        raise NotImplementedError("Streaming_Inquiry.begin must be overridden in implementing class")
+
+    def consume(self, procs, extra_procs = ()):
+        raise NotImplementedError("Streaming_Inquiry.consume must be overridden in implementing class")
+
+    def merge(self, other):
+        raise NotImplementedError("Streaming_Inquiry.merge must be overridden in implementing class")
+
+    def finish(self):
+        raise NotImplementedError("Streaming_Inquiry.finish must be overridden in implementing class")
+
+
 def inquiry_main(inq_cls, proc_set = 'test'):
+    from srqi.gui import report_writer
     procs, extra_procs = my_utils.get_procs(proc_set)
     inq = inq_cls(procs, extra_procs = extra_procs)
     report_writer.write_report([inq])
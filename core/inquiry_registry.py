@@ -0,0 +1,267 @@
+"""Find out about the inquiries in a package without importing them.
+
+Most inquiry modules import matplotlib, numpy, scipy etc. at the top, and
+importing all of them is most of the time it takes to start the GUI. The
+GUI only needs each inquiry's name, description and parameters until the
+inquiry is actually run, so those are read straight from the module's
+source instead. The module is only imported when `Lazy_Inquiry.load` is
+called, e.g. for the inquiries that have been enabled when the report is
+written.
+
+The source is read with the ast module. Parameter definitions are
+evaluated with nothing but the module's imports of datetime, math and
+srqi.core.inquiry available, which covers the usual
+
+    START_DATE = inquiry.Inquiry_Parameter(datetime.date.today(), "Start Date")
+    PERIOD_LEN = inquiry.get_standard_parameter('PERIOD_LEN')
+
+If anything about an inquiry can't be worked out that way (e.g. it
+inherits from another inquiry, or a parameter's default is computed with
+something else) the module is just imported, so every inquiry still works.
+
+== Usage ==
+
+    for inq in get_lazy_inquiries():
+        print inq.get_name(), inq.get_parameter_names()
+    inq_cls = inq.load()
+
+"""
+import os
+import ast
+import math
+import datetime
+import inquiry
+import my_utils
+import my_exceptions
+
+# modules a parameter definition may use
+_LIGHT_MODULES = {'datetime' : datetime,
+                  'math' : math,
+                  'srqi.core.inquiry' : inquiry}
+
+_INQUIRY_BASES = ('Inquiry', 'Streaming_Inquiry')
+
+# class methods whose results come from the metadata. if an inquiry
+# overrides one of them, only the real class knows the answer, so calling
+# it on a Lazy_Inquiry loads the real class.
+_METADATA_METHODS = ('get_name', 'get_description', 'get_parameters',
+                     'get_parameter_names', 'get_parameter_text')
+
+
+class Not_Lazy_Error(Exception):
+    """The metadata of an inquiry can't be found without importing it"""
+    pass
+
+
+def _get_namespace(module_node):
+    """Return a dict of the names a module's top level import statements
+    bind to the modules in _LIGHT_MODULES
+    """
+    namespace = {'__builtins__' : {'True' : True, 'False' : False, 'None' : None}}
+    for node in module_node.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name in _LIGHT_MODULES:
+                    namespace[alias.asname or alias.name] = _LIGHT_MODULES[alias.name]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                full_name = node.module + '.' + alias.name
+                if full_name in _LIGHT_MODULES:
+                    value = _LIGHT_MODULES[full_name]
+                elif node.module in _LIGHT_MODULES and hasattr(_LIGHT_MODULES[node.module], alias.name):
+                    value = getattr(_LIGHT_MODULES[node.module], alias.name)
+                else:
+                    continue
+                namespace[alias.asname or alias.name] = value
+    return namespace
+
+def _is_inquiry_base(base):
+    if isinstance(base, ast.Attribute):
+        return base.attr in _INQUIRY_BASES
+    return isinstance(base, ast.Name) and base.id in _INQUIRY_BASES
+
+def _evaluate(node, namespace, file_name):
+    code = compile(ast.Expression(node), file_name, 'eval')
+    try:
+        return eval(code, dict(namespace))
+    except Exception as e:
+        raise Not_Lazy_Error(str(e))
+
+def read_inquiry_metadata(path, class_name):
+    """Read the metadata of an inquiry class from the source of its module
+
+    Returns:
+        a dict with keys 'description', 'NAME' (only if the class sets it),
+            'parameters', a dict mapping parameter names to
+            inquiry.Inquiry_Parameter objects, and 'overridden', a list of
+            the names in _METADATA_METHODS the class overrides
+
+    Raises:
+        Not_Lazy_Error if the metadata can't be read without importing the
+            module
+        my_exceptions.BadInquiryError if there is no class named class_name
+    """
+    with open(path, 'rU') as f:
+        source = f.read()
+    try:
+        module_node = ast.parse(source, path)
+    except SyntaxError as e:
+        raise Not_Lazy_Error(str(e))
+    class_nodes = [node for node in module_node.body
+                   if isinstance(node, ast.ClassDef) and node.name == class_name]
+    if not class_nodes:
+        raise my_exceptions.BadInquiryError("No class named " + str(class_name) + " found in " + path + ". Please ensure you have named your inquiry class correctly.")
+    class_node = class_nodes[-1]
+    if class_node.decorator_list or not all([_is_inquiry_base(b) for b in class_node.bases]):
+        raise Not_Lazy_Error(class_name + " does not inherit directly from inquiry.Inquiry")
+    namespace = _get_namespace(module_node)
+    metadata = {'description' : inquiry.Inquiry.description,
+                'parameters' : {},
+                'overridden' : [node.name for node in class_node.body
+                                if isinstance(node, ast.FunctionDef) and node.name in _METADATA_METHODS]}
+    for node in class_node.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        names = [t.id for t in node.targets if isinstance(t, ast.Name)]
+        if len(names) != len(node.targets):
+            continue
+        if isinstance(node.value, ast.Call):
+            value = _evaluate(node.value, namespace, path)
+            if isinstance(value, inquiry.Inquiry_Parameter):
+                for name in names:
+                    metadata['parameters'][name] = value
+        elif isinstance(node.value, ast.Str):
+            for name in names:
+                if name in ('description', 'NAME'):
+                    metadata[name] = node.value.s
+    return metadata
+
+
+class Lazy_Inquiry(object):
+    """Stands in for an inquiry class until it is needed
+
+    Has the class methods of inquiry.Inquiry that are used before an
+    inquiry is run (get_name, get_description, get_parameter_names,
+    get_parameters, get_parameter_text), and its parameters are
+    attributes, just like on the real class. Their values are given to
+    the real class when it is loaded.
+    """
+    def __init__(self, package_name, module_name, path):
+        """
+        Parameters:
+            package_name : e.g. 'srqi.active_inquiries'
+            module_name : name of the inquiry module within the package
+            path : path to the module's source file
+        """
+        self.package_name = package_name
+        self.module_name = module_name
+        self.path = path
+        self.__name__ = my_utils.module_to_class_case(module_name)
+        self._class = None
+        self._parameters = {}
+        self._overridden = []
+        try:
+            metadata = read_inquiry_metadata(path, self.__name__)
+        except Not_Lazy_Error:
+            self._use_class(self.load())
+        else:
+            self.description = metadata['description']
+            if 'NAME' in metadata:
+                self.NAME = metadata['NAME']
+            self._parameters = metadata['parameters']
+            self._overridden = metadata['overridden']
+
+    def _use_class(self, inq_cls):
+        self.description = inq_cls.description
+        self._parameters = dict([(name, getattr(inq_cls, name))
+                                 for name in inq_cls.get_parameter_names()])
+
+    def is_loaded(self):
+        return not self._class is None
+
+    def _needs_class(self, method_name):
+        if method_name in self._overridden:
+            self.load()
+        return self.is_loaded()
+
+    def load(self):
+        """Import the inquiry's module if it hasn't been already, give the
+        real class this object's parameter values and return it.
+        """
+        if self._class is None:
+            package = __import__(self.package_name, globals(), locals(), [self.module_name], -1)
+            module = getattr(package, self.module_name)
+            try:
+                self._class = getattr(module, self.__name__)
+            except AttributeError:
+                raise my_exceptions.BadInquiryError("No class named " + self.__name__ + " found in " + module.__name__ + ". Please ensure you have named your inquiry class correctly.")
+        for name, param in self._parameters.iteritems():
+            real_param = getattr(self._class, name)
+            if not real_param is param:
+                real_param.set_value(param.value)
+        # share the parameter objects from now on
+        self._use_class(self._class)
+        return self._class
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't found normally
+        parameters = self.__dict__.get('_parameters', {})
+        if name in parameters:
+            return parameters[name]
+        raise AttributeError(name)
+
+    def get_name(self):
+        if self._needs_class('get_name'):
+            return self._class.get_name()
+        # same as inquiry.Inquiry.get_name
+        if hasattr(inquiry.Inquiry, 'NAME'):
+            return unicode(self.NAME)
+        else:
+            return unicode(self.__name__)
+
+    def get_description(self):
+        if self._needs_class('get_description'):
+            return self._class.get_description()
+        return self.description
+
+    def get_parameter_names(self):
+        if self._needs_class('get_parameter_names'):
+            return self._class.get_parameter_names()
+        return sorted(self._parameters.keys())
+
+    def get_parameters(self):
+        if self._needs_class('get_parameters'):
+            return self._class.get_parameters()
+        return [getattr(self, name) for name in self.get_parameter_names()]
+
+    def get_parameter_text(self):
+        if self._needs_class('get_parameter_text'):
+            return self._class.get_parameter_text()
+        out = ''
+        for param in self.get_parameters():
+            out += param.label + ': ' + str(param.value) +'\n'
+        return out
+
+
+def get_lazy_inquiries(package = None):
+    """Same as my_utils.get_inquiry_classes, but returns Lazy_Inquiry
+    objects instead of importing the inquiry modules
+
+    Arguments:
+        - package - the package containing the inquiry modules.
+            Defaults to srqi.active_inquiries
+    """
+    if package is None:
+        import srqi.active_inquiries
+        package = srqi.active_inquiries
+    pkgpath = os.path.dirname(package.__file__)
+    inq_module_names = [os.path.splitext(name)[0] for name in os.listdir(pkgpath) if os.path.splitext(name)[1] =='.py' and not name[0] =='_']
+    return [Lazy_Inquiry(package.__name__, name, os.path.join(pkgpath, name + '.py'))
+            for name in inq_module_names]
+
+def load_all(inquiries):
+    """Return the real inquiry classes for a list of inquiry classes
+    and/or Lazy_Inquiry objects
+    """
+    return [inq.load() if isinstance(inq, Lazy_Inquiry) else inq
+            for inq in inquiries]
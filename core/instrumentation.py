@@ -0,0 +1,293 @@
+"""Timing and memory instrumentation for the stages of a report run.
+
+An Instrumentation object collects a Stage_Record for every named stage
+that is run inside of its `stage` context manager. The records can be
+rendered in the "Performance" section of the report or dumped to JSON so
+that the timings of different runs can be compared for regressions.
+
+== Usage ==
+
+    instr = Instrumentation()
+    with instr.stage("Parse XML"):
+        ...
+    instr.write_json('performance.json')
+
+"""
+import time
+import threading
+import json
+import os
+import sys
+import platform
+import datetime
+from contextlib import contextmanager
+import progress as progress_module
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+def _get_peak_rss():
+    """Return the peak resident set size of this process in bytes, or
+    None if it can't be determined on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak # already in bytes on OS X
+    return peak * 1024 # kilobytes everywhere else
+
+_PAGE_SIZE = None
+def _get_current_rss():
+    """Return the current resident set size of this process in bytes.
+
+    Reads /proc/self/statm where it exists (Linux) and falls back to the
+    peak rss otherwise.
+    """
+    global _PAGE_SIZE
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return _get_peak_rss()
+    if _PAGE_SIZE is None:
+        _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+    return resident_pages * _PAGE_SIZE
+
+
+class _Memory_Sampler(threading.Thread):
+    """Background thread that polls the resident set size of the process
+    and remembers the largest value it saw.
+    """
+    def __init__(self, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.peak = _get_current_rss()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._sample()
+            self._stop_event.wait(self.interval)
+
+    def _sample(self):
+        rss = _get_current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self._sample()
+        return self.peak
+
+
+class Stage_Record(object):
+    """The measurements taken for a single run of a stage
+
+    Attributes:
+        name : a string. e.g. "Parse XML" or "Modality_Usage.run"
+        category : a string used to group stages in the output. e.g. 'ingest'
+            or 'inquiry'
+        seconds : wall clock time spent in the stage
+        start_rss : resident set size in bytes when the stage began
+        peak_rss : largest resident set size in bytes sampled during the stage
+        count : optional number of items (procedures, events, ...) that
+            were processed by the stage. Used to report throughput.
+        depth : how many stages this one was nested inside of
+    """
+    def __init__(self, name, category = '', depth = 0):
+        self.name = name
+        self.category = category
+        self.depth = depth
+        self.seconds = None
+        self.start_rss = None
+        self.peak_rss = None
+        self.count = None
+
+    def get_memory_growth(self):
+        """Return how many bytes the peak rss rose above the rss at the
+        start of the stage, or None if memory could not be sampled.
+        """
+        if self.start_rss is None or self.peak_rss is None:
+            return None
+        return max(0, self.peak_rss - self.start_rss)
+
+    def get_throughput(self):
+        """Return self.count per second, or None if no count was recorded
+        """
+        if not self.count or not self.seconds:
+            return None
+        return self.count / self.seconds
+
+    def to_dict(self):
+        return {'name' : self.name,
+                'category' : self.category,
+                'depth' : self.depth,
+                'seconds' : self.seconds,
+                'start_rss' : self.start_rss,
+                'peak_rss' : self.peak_rss,
+                'memory_growth' : self.get_memory_growth(),
+                'count' : self.count,
+                'throughput' : self.get_throughput()}
+
+
+class Instrumentation(object):
+    """Collects Stage_Records for a run of the program.
+
+    Passing an Instrumentation object around is always optional. Functions
+    that accept one should accept None and skip timing in that case. Use
+    `stage_or_null` for that.
+
+    Every stage also reports its name to self.progress (a
+    progress.Progress) and raises my_exceptions.CancelledError before it
+    starts if the run has been cancelled.
+    """
+    def __init__(self, sample_interval = 0.05, sample_memory = True, progress = None):
+        """
+        Parameters:
+            sample_interval : seconds between samples of the resident set
+                size while a stage is running
+            sample_memory : if False, only wall clock times are recorded
+            progress : optional progress.Progress object. If None, one that
+                nothing listens to is made.
+        """
+        self.sample_interval = sample_interval
+        self.sample_memory = sample_memory
+        if progress is None:
+            progress = progress_module.Progress()
+        self.progress = progress
+        self._records = []
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, category = '', count = None):
+        """Context manager that times the code run inside of it
+
+        Yields the Stage_Record so that the caller can fill in
+        `record.count` once it knows how many items were processed.
+        """
+        self.progress.check()
+        self.progress.set_message(name)
+        with self._lock:
+            record = Stage_Record(name, category, self._depth)
+            self._records.append(record)
+            self._depth += 1
+        record.count = count
+        sampler = None
+        if self.sample_memory:
+            record.start_rss = _get_current_rss()
+            sampler = _Memory_Sampler(self.sample_interval)
+            sampler.start()
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record.seconds = time.time() - start
+            if sampler is not None:
+                record.peak_rss = sampler.stop()
+            with self._lock:
+                self._depth -= 1
+
+    def wrap(self, func, name, category = ''):
+        """Return a version of func that is timed as stage `name`
+        every time it is called.
+        """
+        def timed(*args, **kwargs):
+            with self.stage(name, category):
+                return func(*args, **kwargs)
+        timed.__name__ = getattr(func, '__name__', 'timed')
+        timed.__doc__ = getattr(func, '__doc__', None)
+        return timed
+
+    def instrument_inquiry(self, inq):
+        """Time the output methods of an Inquiry object from now on
+
+        Replaces get_tables, get_figures and get_figure_paths on the
+        instance (not the class) with timed versions. `run` has to be timed
+        by the caller since it is called from the Inquiry initializer.
+        """
+        inq_name = inq.__class__.__name__
+        for method_name in ('get_tables', 'get_figures', 'get_figure_paths'):
+            method = getattr(inq, method_name)
+            setattr(inq, method_name,
+                    self.wrap(method, inq_name + '.' + method_name, 'inquiry'))
+        return inq
+
+    def get_records(self, category = None):
+        """Return the Stage_Records collected so far in the order the
+        stages were started.
+        """
+        if category is None:
+            return list(self._records)
+        return [r for r in self._records if r.category == category]
+
+    def get_total_seconds(self):
+        """Total wall clock time of all of the top level stages
+        """
+        return sum([r.seconds for r in self._records
+                    if r.depth == 0 and r.seconds is not None])
+
+    def get_peak_rss(self):
+        peaks = [r.peak_rss for r in self._records if r.peak_rss is not None]
+        if not peaks:
+            return _get_peak_rss()
+        return max(peaks)
+
+    def clear(self):
+        self._records = []
+
+    def get_table(self):
+        """Return the records as a table (see Inquiry.get_tables) for
+        display in the report.
+        """
+        out = [("Stage", "Seconds", "Peak Memory (MB)",
+                "Memory Growth (MB)", "Items", "Items per Second")]
+        def to_mb(x):
+            if x is None:
+                return ''
+            return round(x/(1024.0*1024.0), 1)
+        for r in self._records:
+            throughput = r.get_throughput()
+            out.append(('. '*r.depth + r.name,
+                        '' if r.seconds is None else round(r.seconds, 3),
+                        to_mb(r.peak_rss),
+                        to_mb(r.get_memory_growth()),
+                        '' if r.count is None else r.count,
+                        '' if throughput is None else round(throughput, 1)))
+        return out
+
+    def to_dict(self):
+        return {'created' : datetime.datetime.now().isoformat(),
+                'python' : platform.python_version(),
+                'platform' : platform.platform(),
+                'total_seconds' : self.get_total_seconds(),
+                'peak_rss' : self.get_peak_rss(),
+                'stages' : [r.to_dict() for r in self._records]}
+
+    def write_json(self, path):
+        """Dump the collected records to `path` as JSON
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent = 2, sort_keys = True)
+
+
+@contextmanager
+def _null_stage():
+    yield Stage_Record('')
+
+def stage_or_null(instrumentation, name, category = '', count = None):
+    """Return instrumentation.stage(...) or a do-nothing context
+    manager if instrumentation is None.
+    """
+    if instrumentation is None:
+        return _null_stage()
+    return instrumentation.stage(name, category, count)
@@ -20,6 +20,11 @@ class BadInquiryError(Exception):
     writing an inquiry.
     """
 
+class CancelledError(Exception):
+    """Raised inside a run (parsing, running inquiries, writing the report)
+    once the user has asked for it to stop. See core.progress
+    """
+
 class UnmetRequirementError(Exception):
     """Raised when attempting to run an inquiry with insufficient data
     """
@@ -83,27 +83,32 @@ def get_procs(group = 'all'):
                 raise ValueError("Invalid group")
         return procs, extra_procs
 
-def get_procs_from_files(paths):
+def get_procs_from_files(paths, instrumentation = None):
         """Return a list of procedures gleaned from a list of data files
 
         Arguments:
                 - paths - iterable of absolute paths to data files. Files can be
                         Syngo data (.xls) or DICOM-SR (.xml). Eventually
                         extend to other.
+                - instrumentation - optional instrumentation.Instrumentation
+                        object used to time the parsing stages
         """
         # this will eventually be more sophisticated
         syngo_paths = [p for p in paths if os.path.splitext(p)[1] == '.xls']
         sr_paths = [p for p in paths if os.path.splitext(p)[1] == '.xml']
-        return srdata.process_files(sr_paths, syngo_paths)
+        return srdata.process_files(sr_paths, syngo_paths, instrumentation)
 
 def average_fps(events):
         """Gets the average FPS weighted by event duration"""
         if len(events) == 0:
                 raise ValueError("Cannot take average of empyt list")
-        total_fluoro_time = sum([e.get_duration() for e in events],timedelta(0) )
-        total_fluoro_seconds = total_seconds(total_fluoro_time)
-        mean_numerator = sum([multiply_timedelta(e.get_duration(),e.Pulse_Rate) for e in events], timedelta(0))
-        return total_seconds(mean_numerator)/total_fluoro_seconds
+        # imported here so that importing my_utils doesn't import numpy
+        import numpy as np
+        import aggregate
+        rates = np.array([e.Pulse_Rate for e in events], dtype = float)
+        durations = aggregate.get_durations([e.Number_of_Pulses for e in events], rates)
+        total_fluoro_seconds = float(durations.sum())
+        return float(np.dot(durations, rates))/total_fluoro_seconds
 
 
 def is_subset(list1, list2):
@@ -173,35 +178,24 @@ def organize(iterable, key):
 def periodize_by_date(iterable, period_len, date_key):
         """Break up all the obects in iterable into time periods
 
-        Runs in linear time with respect to the # of days between the first
-        and the last object in `iterable`. (Would also be easy to implement
-        as n*log(n) with respect to the number of objects in iterable, but
-        for the data we're working on, that would generally be slower. TODO:
-        implement this so that it checks which would be faster and runs that
-        way)
+        The periods are found by periods.periodize. Use that directly to
+        get indices instead of lists, or calendar periods (ISO weeks,
+        months, fiscal quarters).
         Parameters:
                 iterable :
                 period_len : the length of the period in days
                 date_key : a function that takes an object in `iterable` and
                         returns a datetime.date object
+        Returns:
+                (list of lists of objects in each period, list of the start
+                date of each period)
         """
-        orgd_iter = organize(iterable, date_key)
-        first_date = min(orgd_iter.keys())
-        last_date = max(orgd_iter.keys())
-        current = first_date
-        periods = []
-        period_starts = []
-        while current <= last_date:
-                period_starts.append(current)
-                period_end = current + timedelta(days=period_len)
-                period = []
-                while current < period_end:
-                        if current in orgd_iter:
-                                period = period + orgd_iter[current]
-                        current = current + timedelta(days =1)
-                periods.append(period)
-        assert(len(periods) == len(period_starts))
-        return periods, period_starts
+        # imported here so that importing my_utils doesn't import numpy
+        import periods as periods_module
+        items = list(iterable)
+        result = periods_module.periodize([date_key(item) for item in items],
+                                          'days', period_len)
+        return result.group(items), result.starts
         
 
 import xlrd
@@ -253,13 +247,19 @@ def module_to_class_case(m_name):
 import pkgutil
 import srqi.active_inquiries
 from srqi.core import my_exceptions
-def get_inquiry_classes():
+def get_inquiry_classes(package = None):
         """Get a list of inquiry classes
+
+        Arguments:
+                - package - the package containing the inquiry modules.
+                        Defaults to srqi.active_inquiries
         """
-        pkgpath = os.path.dirname(srqi.active_inquiries.__file__)
+        if package is None:
+                package = srqi.active_inquiries
+        pkgpath = os.path.dirname(package.__file__)
         inq_module_names = [os.path.splitext(name)[0] for name in os.listdir(pkgpath) if os.path.splitext(name)[1] =='.py' and not name[0] =='_']
         #inq_module_names = [name for _, name, _ in pkgutil.iter_modules([pkgpath])]
-        temp = __import__('srqi.active_inquiries', globals(), locals(), inq_module_names,-1)
+        temp = __import__(package.__name__, globals(), locals(), inq_module_names,-1)
         inq_modules = [getattr(temp, name) for name in inq_module_names]
         inq_classes = []
         for module in inq_modules:
@@ -0,0 +1,95 @@
+"""Count how often machines are in use at each time of the week.
+
+The week is split into blocks of `resolution` seconds, starting again at
+midnight each day (if a day isn't evenly divisible, the last block of the
+day is slightly longer). Each interval a machine is in use adds one to every
+block it overlaps. Rather than visiting every block of every interval, each
+interval adds 1 at its first block and subtracts 1 after its last in a
+difference array, and one cumulative sum at the end gives the counts, so an
+interval costs the same however long it is.
+
+Intervals may run past midnight, or past midnight on Sunday into Monday,
+which wraps around to the start of the week.
+
+== Usage ==
+
+    counts = weekly_occupancy(starts, ends, 600, device_ids, num_devices)
+    counts[device, weekday, block]
+
+"""
+import numpy as np
+
+SECONDS_PER_DAY = 24*60*60
+SECONDS_PER_WEEK = 7*SECONDS_PER_DAY
+
+
+def get_blocks_per_day(resolution):
+    return max(SECONDS_PER_DAY//resolution, 1)
+
+def get_week_seconds(times, whole_minutes = False):
+    """Return an int array of the number of seconds since the start of the
+    week (Monday at midnight) of some datetime.datetime objects
+
+    Parameters:
+        whole_minutes : drop the seconds, counting from the start of the
+            minute
+    """
+    if whole_minutes:
+        seconds = [((t.weekday()*24 + t.hour)*60 + t.minute)*60 for t in times]
+    else:
+        seconds = [((t.weekday()*24 + t.hour)*60 + t.minute)*60 + t.second for t in times]
+    return np.array(seconds, dtype = int)
+
+def get_block_index(seconds, resolution):
+    """Return the index of the block containing each of `seconds`, counting
+    blocks from the start of the week. seconds may be negative or a week or
+    more, in which case the index is in the week before or after.
+    """
+    seconds = np.asarray(seconds, dtype = int)
+    blocks_per_day = get_blocks_per_day(resolution)
+    days = seconds//SECONDS_PER_DAY
+    blocks = np.minimum((seconds - days*SECONDS_PER_DAY)//resolution, blocks_per_day - 1)
+    return days*blocks_per_day + blocks
+
+def weekly_occupancy(starts, ends, resolution, device_ids = None, num_devices = None):
+    """Count the number of intervals overlapping every block of the week
+
+    An interval overlaps the blocks from the one containing its start to the
+    one containing the second before its end.
+
+    Parameters:
+        starts : array of the seconds since the start of the week each
+            interval starts at (see get_week_seconds)
+        ends : array of the seconds since the start of the week each
+            interval ends at. An end before its start wraps around past
+            the end of the week.
+        resolution : number of seconds per block
+        device_ids : int array of the device each interval is on, from 0 to
+            num_devices - 1. None if they are all on one.
+        num_devices : the number of devices. Defaults to max(device_ids) + 1.
+
+    Returns:
+        an int array counts[device, weekday, block]
+    """
+    starts = np.asarray(starts, dtype = int)%SECONDS_PER_WEEK
+    ends = np.asarray(ends, dtype = int)
+    durations = (ends - starts)%SECONDS_PER_WEEK
+    if device_ids is None:
+        device_ids = np.zeros(len(starts), dtype = int)
+    device_ids = np.asarray(device_ids, dtype = int)
+    if num_devices is None:
+        num_devices = device_ids.max() + 1 if len(device_ids) else 1
+    blocks_per_day = get_blocks_per_day(resolution)
+    week_blocks = 7*blocks_per_day
+    # two weeks, so intervals that wrap around don't need to be split, and
+    # one more entry for the -1 after an interval ending in the last block
+    length = 2*week_blocks + 1
+    first = get_block_index(starts, resolution)
+    last = get_block_index(starts + durations - 1, resolution)
+    offsets = device_ids*length
+    diff = np.bincount(offsets + first, minlength = num_devices*length)
+    diff -= np.bincount(offsets + last + 1, minlength = num_devices*length)
+    counts = np.cumsum(diff.reshape((num_devices, length)), axis = 1)
+    # fold the second week back onto the first
+    counts = counts[:, :week_blocks] + counts[:, week_blocks:2*week_blocks]
+    return counts.reshape((num_devices, 7, blocks_per_day))
@@ -0,0 +1,158 @@
+"""Assign dated objects to time periods.
+
+The periods run from the period containing the first date up to the one
+containing the last date, and periods with no objects in them are kept, so
+that plots over time show the gaps. Each object's period is found with one
+np.searchsorted of its date against the sorted period start dates, and the
+result is a list of index arrays into the original objects, rather than
+copies of the objects.
+
+Kinds of periods:
+
+    'days' : period_len days, starting from the first date
+    'iso_week' : period_len ISO weeks (Monday to Sunday)
+    'month' : period_len calendar months
+    'fiscal_quarter' : period_len quarters of a fiscal year starting in
+        fiscal_year_start (a month number)
+
+== Usage ==
+
+    periods = periodize([p.StudyDate for p in procs], 'month')
+    for start, indices in zip(periods.starts, periods.get_groups()):
+        print start, len(indices)
+
+"""
+import datetime
+import numpy as np
+
+PERIOD_KINDS = ('days', 'iso_week', 'month', 'fiscal_quarter')
+
+# the US federal fiscal year starts in October
+DEFAULT_FISCAL_YEAR_START = 10
+
+
+def _add_months(date, months):
+    month = date.month - 1 + months
+    return datetime.date(date.year + month//12, month%12 + 1, 1)
+
+def get_period_start(date, kind, fiscal_year_start = DEFAULT_FISCAL_YEAR_START):
+    """Return the first day of the period of `kind` containing date. For
+    'days' periods, which have no calendar alignment, that is date itself.
+    """
+    if kind == 'days':
+        return date
+    elif kind == 'iso_week':
+        return date - datetime.timedelta(days = date.weekday())
+    elif kind == 'month':
+        return datetime.date(date.year, date.month, 1)
+    elif kind == 'fiscal_quarter':
+        offset = (date.month - fiscal_year_start)%3
+        return _add_months(datetime.date(date.year, date.month, 1), -offset)
+    raise ValueError("Unknown kind of period " + repr(kind) + ". Must be one of " + repr(PERIOD_KINDS))
+
+def get_next_start(start, kind, period_len = 1):
+    """Return the start of the period after the one starting at `start`"""
+    if kind == 'days':
+        return start + datetime.timedelta(days = period_len)
+    elif kind == 'iso_week':
+        return start + datetime.timedelta(days = 7*period_len)
+    elif kind == 'month':
+        return _add_months(start, period_len)
+    elif kind == 'fiscal_quarter':
+        return _add_months(start, 3*period_len)
+    raise ValueError("Unknown kind of period " + repr(kind) + ". Must be one of " + repr(PERIOD_KINDS))
+
+def to_ordinals(dates):
+    """Return an int array of date.toordinal() for datetime.date or
+    datetime.datetime objects
+    """
+    return np.fromiter((d.toordinal() for d in dates), dtype = int, count = len(dates))
+
+
+class Periods(object):
+    """
+    Attributes:
+        starts : list of datetime.date, the first day of each period
+        period_ids : int array with the index in `starts` of each object's
+            period, or -1 for objects outside of all of the periods
+    """
+    def __init__(self, starts, period_ids, order):
+        self.starts = starts
+        self.period_ids = period_ids
+        # indices of the objects in date order, used by get_groups
+        self._order = order
+
+    def __len__(self):
+        return len(self.starts)
+
+    def get_groups(self):
+        """Return a list with an array for each period of the indices of the
+        objects in that period, in date order (objects on the same date
+        keep the order they were given in)
+        """
+        order = self._order[self.period_ids[self._order] >= 0]
+        # in date order, so the period ids are sorted
+        bounds = np.searchsorted(self.period_ids[order], np.arange(len(self.starts) + 1))
+        return [order[bounds[i]:bounds[i+1]] for i in range(len(self.starts))]
+
+    def get_counts(self, weights = None):
+        """Return an array with the number of objects (or the sum of their
+        weights) in each period
+        """
+        inside = self.period_ids >= 0
+        if not weights is None:
+            weights = np.asarray(weights, dtype = float)[inside]
+        return np.bincount(self.period_ids[inside], weights = weights,
+                           minlength = len(self.starts))
+
+    def group(self, objects):
+        """Return a list of lists of the objects (in the same order as the
+        dates given to periodize) in each period
+        """
+        return [[objects[i] for i in indices] for indices in self.get_groups()]
+
+
+def periodize(dates, kind = 'days', period_len = 1, first = None, last = None,
+              fiscal_year_start = DEFAULT_FISCAL_YEAR_START):
+    """Work out which period each date falls in
+
+    Parameters:
+        dates : a sequence of datetime.date objects
+        kind : one of PERIOD_KINDS
+        period_len : number of days, weeks, months or quarters per period
+        first : the periods start with the one containing this date.
+            Defaults to the earliest of dates.
+        last : the periods end with the one containing this date. Defaults
+            to the latest of dates. If it is before first there are no
+            periods.
+        fiscal_year_start : month number the fiscal year starts in, for
+            'fiscal_quarter' periods
+
+    Returns:
+        a Periods object
+    """
+    if not kind in PERIOD_KINDS:
+        raise ValueError("Unknown kind of period " + repr(kind) + ". Must be one of " + repr(PERIOD_KINDS))
+    if period_len < 1:
+        raise ValueError("period_len must be at least 1")
+    ordinals = to_ordinals(dates)
+    order = np.argsort(ordinals, kind = 'mergesort')
+    if first is None and len(dates):
+        first = dates[order[0]]
+    if last is None and len(dates):
+        last = dates[order[-1]]
+    starts = []
+    if not first is None and last >= first:
+        start = get_period_start(first, kind, fiscal_year_start)
+        while start <= last:
+            starts.append(start)
+            start = get_next_start(start, kind, period_len)
+        # so that dates after the last period fall outside of it
+        end = start
+    if starts:
+        boundaries = to_ordinals(starts + [end])
+        period_ids = np.searchsorted(boundaries, ordinals, side = 'right') - 1
+        period_ids[period_ids >= len(starts)] = -1
+    else:
+        period_ids = -np.ones(len(ordinals), dtype = int)
+    return Periods(starts, period_ids, order)
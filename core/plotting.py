@@ -0,0 +1,110 @@
+"""Scatter plots that stay fast however many points there are.
+
+A scatter plot with a marker for every procedure or event is fine for a
+few thousand points, but with hundreds of thousands drawing it and saving
+it (see Inquiry.get_figure_paths) takes minutes and makes huge files.
+Above MAX_SCATTER_POINTS points, `scatter` instead either
+
+    - draws the density of the points as hexagonal bins (if no style
+      arguments such as c, marker or label are given), or
+    - decimates them: splits the x axis into bins and keeps only the
+      lowest and highest point of each, so outliers and the outline of
+      the data are still there, drawn with the style they were given.
+      This way several series can share one axes and still be told apart.
+
+Only the figure changes; inquiries' tables still have every value.
+
+== Usage ==
+
+    fig = plt.figure()
+    plotting.scatter(start_times, frame_counts)
+
+"""
+import datetime
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.dates
+import matplotlib.colors
+
+MAX_SCATTER_POINTS = 20000
+DENSITY_GRID_SIZE = 100 # number of hexagons across the x axis
+_PER_POINT_ARGS = ('c', 's') # scatter arguments that may have a value per point
+
+
+def to_numbers(xs):
+    """Return a float array of xs, converting dates and datetimes with
+    matplotlib.dates.date2num
+
+    Returns:
+        (array, whether xs were dates)
+    """
+    if len(xs) and isinstance(xs[0], (datetime.date, datetime.datetime)):
+        return np.asarray(matplotlib.dates.date2num(list(xs)), dtype = float), True
+    return np.asarray(xs, dtype = float), False
+
+def decimate(xs, ys, max_points):
+    """Choose at most max_points of the points (xs[i], ys[i]) to plot
+
+    The x axis is split into max_points/2 equal bins and the points with the
+    lowest and highest y in each bin are kept.
+
+    Parameters:
+        xs, ys : arrays of numbers
+
+    Returns:
+        a sorted int array of the indices of the points to keep
+    """
+    xs = np.asarray(xs, dtype = float)
+    ys = np.asarray(ys, dtype = float)
+    if len(xs) <= max_points:
+        return np.arange(len(xs))
+    num_bins = max(max_points//2, 1)
+    low, high = xs.min(), xs.max()
+    if high > low:
+        bins = np.minimum(((xs - low)/(high - low)*num_bins).astype(int), num_bins - 1)
+    else:
+        bins = np.zeros(len(xs), dtype = int)
+    order = np.lexsort((ys, bins))
+    sorted_bins = bins[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    lasts = np.r_[firsts[1:] - 1, len(order) - 1]
+    return np.unique(np.concatenate((order[firsts], order[lasts])))
+
+def _is_per_point(value, num_points):
+    return not isinstance(value, basestring) and np.ndim(value) > 0 and len(value) == num_points
+
+def scatter(xs, ys, max_points = None, ax = None, **kwargs):
+    """Same as plt.scatter(xs, ys, **kwargs), unless there are more than
+    max_points points, in which case their density is drawn, or they are
+    decimated if any other arguments are given (see the module docstring)
+
+    Parameters:
+        xs : list of numbers, dates or datetimes
+        ys : list of numbers
+        max_points : defaults to MAX_SCATTER_POINTS
+        ax : the axes to draw on. defaults to the current axes.
+
+    Returns:
+        whatever plt.scatter or plt.hexbin return
+    """
+    if max_points is None:
+        max_points = MAX_SCATTER_POINTS
+    if ax is None:
+        ax = plt.gca()
+    if len(xs) <= max_points:
+        return ax.scatter(xs, ys, **kwargs)
+    x_numbers, is_date = to_numbers(xs)
+    y_numbers = np.asarray(ys, dtype = float)
+    if kwargs:
+        per_point = [k for k in _PER_POINT_ARGS if _is_per_point(kwargs.get(k), len(xs))]
+        keep = decimate(x_numbers, y_numbers, max_points)
+        for k in per_point:
+            kwargs[k] = np.asarray(kwargs[k])[keep]
+        out = ax.scatter(x_numbers[keep], y_numbers[keep], **kwargs)
+    else:
+        out = ax.hexbin(x_numbers, y_numbers, gridsize = DENSITY_GRID_SIZE, mincnt = 1,
+                        norm = matplotlib.colors.LogNorm(), cmap = 'viridis')
+        ax.figure.colorbar(out, ax = ax).set_label("Number of Points")
+    if is_date:
+        ax.xaxis_date()
+    return out
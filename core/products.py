@@ -0,0 +1,200 @@
+"""Named intermediate products that can be shared between inquiries.
+
+Many inquiries start by computing the same things from the procedures,
+e.g. the list of all fluoro events or the Syngo records grouped by CPT code
+combination. A product is a function registered under a name that computes
+one of those things. Inquiries ask for products with `self.get_product`
+and declare the ones they will need in `get_required_products`, so that
+the scheduler can compute each one once, ahead of time, for all of them.
+
+A product function is called as
+    func(procs, extra_procs, *required_products, **params)
+where `required_products` are the values of the products listed in
+`requires`, in order. A required product is requested with whichever of
+the caller's params it also takes.
+
+== Usage ==
+
+    @register_product('syngo_by_rad1', requires = ['syngo_procs'])
+    def _syngo_by_rad1(procs, extra_procs, syngo_procs):
+        return my_utils.organize(syngo_procs, lambda p:p.rad1)
+
+"""
+import threading
+import itertools
+import my_utils
+import my_exceptions
+import Parse_Syngo
+
+_PRODUCTS = {}
+
+class Product_Definition(object):
+    def __init__(self, name, func, requires = (), params = ()):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.params = tuple(params)
+
+    def get_dependency_requests(self, request):
+        """Return the Product_Requests for the products this one needs
+        in order to fulfill `request`
+        """
+        out = []
+        for dep_name in self.requires:
+            dep = get_definition(dep_name)
+            dep_params = dict([(k, v) for k, v in request.params
+                               if k in dep.params])
+            out.append(Product_Request(dep_name, **dep_params))
+        return out
+
+
+def register_product(name, requires = (), params = ()):
+    """Decorator that registers a function as the product `name`
+
+    Parameters:
+        name : a string. must be unique
+        requires : names of other products passed to the function as
+            positional arguments after procs and extra_procs
+        params : names of the keyword arguments the function takes
+    """
+    def decorator(func):
+        if name in _PRODUCTS and not _PRODUCTS[name].func is func:
+            raise my_exceptions.BadInquiryError("A product named " + name + " has already been registered.")
+        _PRODUCTS[name] = Product_Definition(name, func, requires, params)
+        return func
+    return decorator
+
+def get_definition(name):
+    try:
+        return _PRODUCTS[name]
+    except KeyError:
+        raise my_exceptions.BadInquiryError("No product named " + str(name) + " has been registered.")
+
+
+class Product_Request(object):
+    """A product name along with the parameter values to compute it with.
+
+    Requests with the same name and params are equal, which is what lets
+    inquiries share products.
+    """
+    def __init__(self, name, **params):
+        self.name = name
+        self.params = tuple(sorted(params.items()))
+
+    def get_key(self):
+        return (self.name, self.params)
+
+    def __eq__(self, other):
+        return isinstance(other, Product_Request) and self.get_key() == other.get_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def __repr__(self):
+        return "Product_Request(" + ', '.join([repr(self.name)] + [k + '=' + repr(v) for k, v in self.params]) + ")"
+
+
+class Product_Store(object):
+    """Memoizes the products computed from one set of procedures.
+
+    Products that haven't been computed by the scheduler are computed
+    (along with anything they require) the first time they are asked for,
+    so inquiries work the same when they are run on their own.
+    """
+    def __init__(self, procs, extra_procs):
+        self.procs = procs
+        self.extra_procs = extra_procs
+        self._values = {}
+        self._lock = threading.RLock()
+
+    def has(self, request):
+        return request.get_key() in self._values
+
+    def compute(self, request):
+        """Compute the product for `request`, assuming that everything it
+        requires has already been computed. Does not need the lock, so
+        independent products can be computed at the same time.
+        """
+        definition = get_definition(request.name)
+        deps = [self._values[r.get_key()] for r in definition.get_dependency_requests(request)]
+        value = definition.func(self.procs, self.extra_procs, *deps, **dict(request.params))
+        with self._lock:
+            self._values[request.get_key()] = value
+        return value
+
+    def get(self, name, **params):
+        request = Product_Request(name, **params)
+        with self._lock:
+            if not self.has(request):
+                for r in get_build_order([request]):
+                    if not self.has(r):
+                        self.compute(r)
+            return self._values[request.get_key()]
+
+
+def get_build_levels(requests):
+    """Group the requests, and everything they require, into levels
+
+    Every product in a level only requires products from earlier levels,
+    so the products within a level can be computed in parallel.
+
+    Returns:
+        a list of lists of Product_Requests
+    """
+    depth = {}
+    def visit(request, path):
+        if request in path:
+            raise my_exceptions.BadInquiryError("Circular product requirements: " + repr(path + [request]))
+        if request in depth:
+            return depth[request]
+        deps = get_definition(request.name).get_dependency_requests(request)
+        d = 0
+        for dep in deps:
+            d = max(d, visit(dep, path + [request]) + 1)
+        depth[request] = d
+        return d
+    for request in requests:
+        visit(request, [])
+    levels = [[] for i in range(max(depth.values()) + 1)] if depth else []
+    for request, d in sorted(depth.items(), key = lambda x: repr(x[0])):
+        levels[d].append(request)
+    return levels
+
+def get_build_order(requests):
+    """Return the requests and all of their requirements in an order
+    in which they can be computed one at a time.
+    """
+    return list(itertools.chain(*get_build_levels(requests)))
+
+
+# Products used by more than one of the standard inquiries
+
+@register_product('fluoro_events')
+def _fluoro_events(procs, extra_procs):
+    """All of the valid fluoroscopy events in procs"""
+    return list(itertools.chain.from_iterable(p.get_fluoro_events() for p in procs))
+
+@register_product('syngo_procs')
+def _syngo_procs(procs, extra_procs):
+    """The Syngo records of procs that have one, followed by the Syngo
+    records in extra_procs
+    """
+    out = [p.get_syngo() for p in procs if p.has_syngo()]
+    out += [p for p in extra_procs if isinstance(p, Parse_Syngo.Syngo)]
+    return out
+
+@register_product('syngo_by_cpt', requires = ['syngo_procs'])
+def _syngo_by_cpt(procs, extra_procs, syngo_procs):
+    """dict mapping cpt code combination strings to lists of Syngo objects"""
+    return my_utils.organize(syngo_procs, lambda p: p.get_cpts_as_string())
+
+@register_product('syngo_with_fluoro_by_cpt', requires = ['syngo_procs'])
+def _syngo_with_fluoro_by_cpt(procs, extra_procs, syngo_procs):
+    """Same as syngo_by_cpt, but only includes Syngo records with a
+    fluoro time recorded
+    """
+    return my_utils.organize([p for p in syngo_procs if not p.fluoro is None],
+                             lambda p: p.get_cpts_as_string())
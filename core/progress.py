@@ -0,0 +1,119 @@
+"""Report how far a run has got, and let it be cancelled.
+
+A run (reading the data files, running the inquiries, writing the report)
+is split into phases, and each phase into steps: a data file read, an
+inquiry run, a section of the report rendered. The code doing the run
+calls `start_phase` and `advance` as it goes, and `check` wherever it can
+safely stop. Once `cancel` has been called (from any thread), the next
+`check` raises my_exceptions.CancelledError.
+
+The listener is called in whatever thread the run is in, with a message
+and the fraction of the whole run that is done. A gui should pass these
+on to its own thread, e.g. with wx.CallAfter.
+
+Usually a Progress object is passed around as the `progress` attribute
+of an instrumentation.Instrumentation object, whose stages check for
+cancellation and report their names.
+
+== Usage ==
+
+    progress = Progress(listener, PHASES)
+    progress.start_phase(READING, len(paths))
+    for p in paths:
+        progress.check()
+        ...
+        progress.advance("Read " + p)
+
+"""
+import threading
+import my_exceptions
+
+READING = "Reading data files"
+RUNNING = "Running inquiries"
+WRITING = "Writing report"
+PHASES = (READING, RUNNING, WRITING)
+
+
+class Progress(object):
+
+    def __init__(self, listener = None, phases = ()):
+        """
+        Parameters:
+            listener : a function taking (message, fraction done), or None
+            phases : the names of the phases in the order they are run. If
+                a phase isn't in the list, the fraction done is just for
+                that phase.
+        """
+        self.listener = listener
+        self.phases = list(phases)
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._phase = None
+        self._steps = 0
+        self._done = 0
+        self._message = ''
+
+    def cancel(self):
+        """Make the next call to check raise CancelledError"""
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Raise my_exceptions.CancelledError if cancel has been called"""
+        if self._cancelled.is_set():
+            raise my_exceptions.CancelledError("The run was cancelled.")
+
+    def get_fraction(self):
+        """Return the fraction of the whole run that is done, from 0 to 1"""
+        with self._lock:
+            return self._get_fraction()
+
+    def _get_fraction(self):
+        fraction = 0.0
+        if self._steps:
+            fraction = min(self._done, self._steps)/float(self._steps)
+        if self._phase in self.phases:
+            fraction = (self.phases.index(self._phase) + fraction)/len(self.phases)
+        return fraction
+
+    def get_state(self):
+        """Return (the latest message, the fraction done)"""
+        with self._lock:
+            return self._message, self._get_fraction()
+
+    def _notify(self, message):
+        with self._lock:
+            self._message = message
+            fraction = self._get_fraction()
+        if not self.listener is None:
+            self.listener(message, fraction)
+
+    def start_phase(self, phase, steps):
+        """Start a phase that is done after `steps` calls to advance"""
+        self.check()
+        with self._lock:
+            self._phase = phase
+            self._steps = steps
+            self._done = 0
+        self._notify(phase)
+
+    def advance(self, message = None, steps = 1):
+        """Record that steps more steps of the phase are done"""
+        with self._lock:
+            self._done += steps
+        self._notify(self._message if message is None else message)
+
+    def set_message(self, message):
+        """Report what is being done, without any steps being done"""
+        self._notify(message)
+
+
+def get_progress(instrumentation):
+    """Return the Progress of an instrumentation.Instrumentation object, or
+    one that nothing listens to if instrumentation is None
+    """
+    if instrumentation is None:
+        return Progress()
+    return instrumentation.progress
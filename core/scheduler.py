@@ -0,0 +1,99 @@
+"""Runs a set of inquiries so that the products they share are only
+computed once.
+
+The scheduler collects the Product_Requests of every inquiry class,
+expands them into a DAG of everything they require, and computes that DAG
+level by level before any of the inquiries are run. Products in the same
+level don't depend on each other and are computed in a thread pool.
+
+Inquiries that filter the procedures differently (e.g. different
+DATE_RANGE_START values) can't share products, so each distinct filter gets
+its own Product_Store.
+"""
+from multiprocessing.pool import ThreadPool
+import products
+from instrumentation import stage_or_null
+from progress import get_progress, RUNNING
+
+
+class Inquiry_Scheduler(object):
+
+    def __init__(self, procs, extra_procs, threads = 4):
+        """
+        Parameters:
+            procs : list of srdata.Procedure objects
+            extra_procs : list of other procedure objects (e.g. Syngo)
+            threads : number of threads used to compute independent
+                products. 1 computes everything in the calling thread.
+        """
+        self.procs = procs
+        self.extra_procs = extra_procs
+        self.threads = threads
+        self._stores = {}
+
+    def get_store(self, inq_cls):
+        """Return the Product_Store for the procedures inq_cls will see
+        after its standard parameters have been applied.
+        """
+        key = inq_cls.get_data_filter_key()
+        if not key in self._stores:
+            procs, _, extra_procs = inq_cls._handle_standard_parameters(self.procs, None, self.extra_procs)
+            self._stores[key] = products.Product_Store(procs, extra_procs)
+        return self._stores[key]
+
+    def get_plan(self, inquiry_classes):
+        """Return a list of (Product_Store, list of levels of Product_Requests)
+        covering every product required by inquiry_classes.
+        """
+        requests_by_store = {}
+        stores = []
+        for inq_cls in inquiry_classes:
+            store = self.get_store(inq_cls)
+            if not id(store) in requests_by_store:
+                requests_by_store[id(store)] = []
+                stores.append(store)
+            requests_by_store[id(store)] += inq_cls.get_required_products()
+        return [(store, products.get_build_levels(requests_by_store[id(store)]))
+                for store in stores]
+
+    def compute_products(self, inquiry_classes, instrumentation = None):
+        """Compute every product required by inquiry_classes that hasn't
+        been computed yet.
+        """
+        pool = None
+        if self.threads > 1:
+            pool = ThreadPool(self.threads)
+        try:
+            for store, levels in self.get_plan(inquiry_classes):
+                for level in levels:
+                    level = [r for r in level if not store.has(r)]
+                    def compute(request):
+                        with stage_or_null(instrumentation, 'product ' + repr(request), 'product'):
+                            store.compute(request)
+                    if pool is None or len(level) == 1:
+                        for request in level:
+                            compute(request)
+                    else:
+                        pool.map(compute, level)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def run(self, inquiry_classes, instrumentation = None):
+        """Compute the shared products, then run each inquiry
+
+        Returns:
+            a list of Inquiry objects in the same order as inquiry_classes
+        """
+        progress = get_progress(instrumentation)
+        progress.start_phase(RUNNING, len(inquiry_classes) + 1)
+        self.compute_products(inquiry_classes, instrumentation)
+        progress.advance()
+        inqs = []
+        for inq_cls in inquiry_classes:
+            with stage_or_null(instrumentation, inq_cls.__name__ + '.run', 'inquiry'):
+                inqs.append(inq_cls(self.procs, extra_procs = self.extra_procs,
+                                    products = self.get_store(inq_cls)))
+            progress.advance("Ran " + inq_cls.__name__)
+        return inqs
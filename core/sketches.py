@@ -0,0 +1,504 @@
+"""Mergeable, fixed-size summaries of streams of numbers.
+
+Quantile_Sketch is a KLL sketch: values are kept in levels, where a value
+in level h stands for 2**h of the original values. When a level gets too
+big it is sorted and every other value (starting at a random offset) is
+promoted to the next level up. Lower levels are kept smaller than higher
+ones, so the sketch holds O(k) values however many it has seen, and the
+rank of a returned quantile is typically within about 1/k of the
+requested rank (within 1% for the default k = 200). Until more than k
+values have been added nothing is discarded and quantiles are exact.
+
+Moment_Sketch keeps the count, mean and the 2nd to 4th central moments,
+which are exact (up to floating point) and are merged with the pairwise
+formulas of Chan et al. and Pebay.
+
+Histogram_Sketch counts values in fixed bins, either of a fixed width or
+logarithmic, and only stores the bins that have values in them. The bins
+don't depend on the data, so histograms of different chunks line up and
+merge exactly; they are combined into coarser bins for plotting.
+
+All of them can be fed one value at a time or an array at once, merged
+with another sketch of the same kind, and pickled, so partial sketches
+of different chunks of data can be combined.
+
+The USE_SKETCHES options of Operator_Improvement, Cpt_Box_Plots and
+Syngo_Stats sketch Syngo records that have already been read (the
+'syngo_procs' and 'operator_cpt_to_procs' products), and those inquiries
+still use the records for the rest of their output. So they save sorting
+and copying the fluoro times of each procedure type, but not the memory
+of the records themselves.
+
+== Usage ==
+
+    sketch = Value_Sketch()
+    sketch.extend(fluoro_times)
+    sketch.merge(other_sketch)
+    median = sketch.quantile(.5)
+    mean, std = sketch.moments.get_mean(), sketch.moments.get_std()
+
+"""
+import math
+import random
+import numpy as np
+
+DEFAULT_K = 200
+_BUFFER_SIZE = 1000 # values buffered by update() before they're added as an array
+_CAPACITY_RATIO = 2.0/3 # each level may be this fraction the size of the one above
+
+
+class Quantile_Sketch(object):
+
+    def __init__(self, k = DEFAULT_K, seed = 0):
+        """
+        Parameters:
+            k : the size of the top level. bigger is more accurate and
+                uses more memory.
+            seed : seed for the random offsets used when compacting, so
+                results are reproducible
+        """
+        self.k = k
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._levels = [np.empty(0)]
+        self._buffer = []
+        self._random = random.Random(seed)
+
+    def update(self, value):
+        self._buffer.append(value)
+        if len(self._buffer) >= _BUFFER_SIZE:
+            self._flush()
+
+    def extend(self, values):
+        self._flush()
+        self._add(np.asarray(values, dtype = float).ravel())
+
+    def _flush(self):
+        if self._buffer:
+            values = np.array(self._buffer, dtype = float)
+            self._buffer = []
+            self._add(values)
+
+    def _add(self, values):
+        if not len(values):
+            return
+        self.count += len(values)
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self._levels[0] = np.concatenate((self._levels[0], values))
+        self._compress()
+
+    def _get_capacity(self, h):
+        depth = len(self._levels) - h - 1
+        return max(2, int(math.ceil(self.k*_CAPACITY_RATIO**depth)))
+
+    def _compact(self, h):
+        """Promote half of the values in level h to level h+1"""
+        if h + 1 == len(self._levels):
+            self._levels.append(np.empty(0))
+        items = np.sort(self._levels[h])
+        if len(items) % 2:
+            # keep one value so that an even number are compacted and
+            # the total weight is unchanged
+            held, items = items[-1:], items[:-1]
+        else:
+            held = items[:0]
+        promoted = items[self._random.randint(0, 1)::2]
+        self._levels[h] = held
+        self._levels[h + 1] = np.concatenate((self._levels[h + 1], promoted))
+
+    def _compress(self):
+        compacted = True
+        while compacted:
+            compacted = False
+            for h in range(len(self._levels)):
+                if len(self._levels[h]) > self._get_capacity(h):
+                    self._compact(h)
+                    compacted = True
+                    break # adding a level changes the capacities
+
+    def merge(self, other):
+        """Add everything summarized by other (a Quantile_Sketch) to self"""
+        self._flush()
+        other._flush()
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for h, items in enumerate(other._levels):
+            self._levels[h] = np.concatenate((self._levels[h], items))
+        self.count += other.count
+        for attr, pick in (('min', min), ('max', max)):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            if mine is None or theirs is None:
+                setattr(self, attr, theirs if mine is None else mine)
+            else:
+                setattr(self, attr, pick(mine, theirs))
+        self._compress()
+        return self
+
+    def get_size(self):
+        """Number of values actually being stored"""
+        return sum([len(items) for items in self._levels]) + len(self._buffer)
+
+    def get_weighted_values(self):
+        """Return (sorted array of stored values, array of their weights)"""
+        self._flush()
+        values = np.concatenate(self._levels)
+        weights = np.concatenate([np.repeat(2.0**h, len(items))
+                                  for h, items in enumerate(self._levels)])
+        order = np.argsort(values, kind = 'mergesort')
+        return values[order], weights[order]
+
+    def quantiles(self, qs):
+        """Return an array of the values at each fraction in qs (e.g.
+        .5 for the median). q = 0 and q = 1 give the exact min and max.
+        """
+        qs = np.asarray(qs, dtype = float)
+        if self.count == 0 and not self._buffer:
+            return np.repeat(np.nan, len(qs))
+        values, weights = self.get_weighted_values()
+        cum_weights = np.cumsum(weights)
+        idx = np.searchsorted(cum_weights, qs*cum_weights[-1], side = 'left')
+        out = values[np.clip(idx, 0, len(values) - 1)]
+        out[qs <= 0] = self.min
+        out[qs >= 1] = self.max
+        return out
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def rank(self, value):
+        """Approximate fraction of values <= value"""
+        values, weights = self.get_weighted_values()
+        if not len(values):
+            return float('nan')
+        return weights[:np.searchsorted(values, value, side = 'right')].sum()/weights.sum()
+
+
+class Moment_Sketch(object):
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0 # sums of powers of deviations from the mean
+        self._m3 = 0.0
+        self._m4 = 0.0
+        self._buffer = []
+
+    def update(self, value):
+        self._buffer.append(value)
+        if len(self._buffer) >= _BUFFER_SIZE:
+            self._flush()
+
+    def extend(self, values):
+        self._flush()
+        values = np.asarray(values, dtype = float).ravel()
+        if not len(values):
+            return
+        mean = values.mean()
+        dev = values - mean
+        dev2 = dev*dev
+        self._combine(len(values), mean, dev2.sum(), (dev2*dev).sum(), (dev2*dev2).sum())
+
+    def _flush(self):
+        if self._buffer:
+            values = self._buffer
+            self._buffer = []
+            self.extend(values)
+
+    def _combine(self, nb, mean_b, m2_b, m3_b, m4_b):
+        na = self.count
+        if na == 0:
+            self.count, self.mean, self._m2, self._m3, self._m4 = nb, mean_b, m2_b, m3_b, m4_b
+            return
+        n = float(na + nb)
+        delta = mean_b - self.mean
+        m2_a, m3_a, m4_a = self._m2, self._m3, self._m4
+        self.mean = self.mean + delta*nb/n
+        self._m2 = m2_a + m2_b + delta**2*na*nb/n
+        self._m3 = (m3_a + m3_b + delta**3*na*nb*(na - nb)/n**2 +
+                    3*delta*(na*m2_b - nb*m2_a)/n)
+        self._m4 = (m4_a + m4_b + delta**4*na*nb*(na*na - na*nb + nb*nb)/n**3 +
+                    6*delta**2*(na*na*m2_b + nb*nb*m2_a)/n**2 +
+                    4*delta*(na*m3_b - nb*m3_a)/n)
+        self.count = na + nb
+
+    def merge(self, other):
+        """Add everything summarized by other (a Moment_Sketch) to self"""
+        self._flush()
+        other._flush()
+        if other.count:
+            self._combine(other.count, other.mean, other._m2, other._m3, other._m4)
+        return self
+
+    def get_mean(self):
+        self._flush()
+        return self.mean if self.count else float('nan')
+
+    def get_variance(self):
+        """Population variance, the same as np.var"""
+        self._flush()
+        return self._m2/self.count if self.count else float('nan')
+
+    def get_std(self):
+        return math.sqrt(self.get_variance())
+
+    def get_skewness(self):
+        self._flush()
+        if not self._m2:
+            return float('nan')
+        return math.sqrt(self.count)*self._m3/self._m2**1.5
+
+    def get_kurtosis(self):
+        """Excess kurtosis (0 for a normal distribution)"""
+        self._flush()
+        if not self._m2:
+            return float('nan')
+        return self.count*self._m4/self._m2**2 - 3
+
+    def jarque_bera(self):
+        """Jarque-Bera test of whether the values are normally distributed
+
+        Returns:
+            (test statistic, p-value)
+        """
+        s, k = self.get_skewness(), self.get_kurtosis()
+        statistic = self.count/6.0*(s*s + k*k/4.0)
+        # the statistic has a chi-squared distribution with 2 degrees of
+        # freedom, whose survival function is exp(-x/2)
+        return statistic, math.exp(-statistic/2.0)
+
+
+class Histogram_Sketch(object):
+
+    def __init__(self, bin_width = None, bins_per_decade = None, origin = 0.0):
+        """Give exactly one of bin_width and bins_per_decade
+
+        Parameters:
+            bin_width : width of each bin, for bins of a fixed width
+            bins_per_decade : number of bins between each power of 10, for
+                logarithmic bins. Values <= 0 are only counted.
+            origin : a bin starts here, for bins of a fixed width
+        """
+        if (bin_width is None) == (bins_per_decade is None):
+            raise ValueError("Give exactly one of bin_width and bins_per_decade")
+        self.bin_width = bin_width
+        self.bins_per_decade = bins_per_decade
+        self.origin = origin
+        self.count = 0 # number of values in the bins
+        self.non_positive = 0 # values that can't go in a logarithmic bin
+        self._counts = {} # bin index -> number of values
+
+    def is_log(self):
+        return not self.bins_per_decade is None
+
+    def update(self, value):
+        self.extend([value])
+
+    def extend(self, values):
+        values = np.asarray(values, dtype = float).ravel()
+        values = values[~np.isnan(values)]
+        if self.is_log():
+            positive = values > 0
+            self.non_positive += len(values) - int(positive.sum())
+            indices = np.floor(np.log10(values[positive])*self.bins_per_decade)
+        else:
+            indices = np.floor((values - self.origin)/self.bin_width)
+        if not len(indices):
+            return
+        keys, counts = np.unique(indices.astype(np.int64), return_counts = True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self._counts[key] = self._counts.get(key, 0) + count
+        self.count += len(indices)
+
+    def _get_binning(self):
+        return (self.bin_width, self.bins_per_decade, self.origin)
+
+    def merge(self, other):
+        """Add everything counted by other (a Histogram_Sketch with the same
+        bins) to self
+        """
+        if self._get_binning() != other._get_binning():
+            raise ValueError("Can't merge histograms with different bins")
+        for key, count in other._counts.iteritems():
+            self._counts[key] = self._counts.get(key, 0) + count
+        self.count += other.count
+        self.non_positive += other.non_positive
+        return self
+
+    def get_bin_edges(self, indices):
+        """Return the lower edges of the bins with the given indices"""
+        indices = np.asarray(indices, dtype = float)
+        if self.is_log():
+            return 10**(indices/self.bins_per_decade)
+        return self.origin + indices*self.bin_width
+
+    def get_histogram(self, num_bins = None):
+        """Return (edges, counts) for every bin from the lowest to the
+        highest that has values in it, where counts[i] is the number of
+        values between edges[i] and edges[i+1]
+
+        Parameters:
+            num_bins : if given, neighbouring bins are added together so
+                that there are at most this many
+        """
+        if not self._counts:
+            return np.empty(0), np.empty(0, dtype = int)
+        low = min(self._counts.keys())
+        high = max(self._counts.keys())
+        counts = np.zeros(high - low + 1, dtype = int)
+        for key, count in self._counts.iteritems():
+            counts[key - low] = count
+        group = 1
+        if num_bins and len(counts) > num_bins:
+            group = int(math.ceil(len(counts)/float(num_bins)))
+            counts = np.concatenate((counts, np.zeros((-len(counts))%group, dtype = int)))
+            counts = counts.reshape((-1, group)).sum(axis = 1)
+        edges = self.get_bin_edges(low + group*np.arange(len(counts) + 1))
+        return edges, counts
+
+
+class Value_Sketch(object):
+    """Quantiles and moments of one stream of values
+
+    Attributes:
+        quantiles : a Quantile_Sketch
+        moments : a Moment_Sketch
+    """
+    def __init__(self, k = DEFAULT_K):
+        self.quantiles = Quantile_Sketch(k)
+        self.moments = Moment_Sketch()
+
+    def update(self, value):
+        self.quantiles.update(value)
+        self.moments.update(value)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype = float)
+        self.quantiles.extend(values)
+        self.moments.extend(values)
+
+    def merge(self, other):
+        self.quantiles.merge(other.quantiles)
+        self.moments.merge(other.moments)
+        return self
+
+    def get_count(self):
+        self.moments._flush()
+        return self.moments.count
+
+    def quantile(self, q):
+        return self.quantiles.quantile(q)
+
+
+class Grouped_Sketch(object):
+    """A Value_Sketch for each key, e.g. each cpt code combination.
+
+    Values added with `add` are buffered per key and added to the sketches
+    as arrays, so adding values one at a time is still fast.
+    """
+    def __init__(self, k = DEFAULT_K):
+        self.k = k
+        self._sketches = {}
+        self._buffers = {}
+
+    def add(self, key, value):
+        buf = self._buffers.setdefault(key, [])
+        buf.append(value)
+        if len(buf) >= _BUFFER_SIZE:
+            self._flush_key(key)
+
+    def extend(self, key, values):
+        self._flush_key(key)
+        self._get_sketch(key).extend(values)
+
+    def _get_sketch(self, key):
+        if not key in self._sketches:
+            self._sketches[key] = Value_Sketch(self.k)
+        return self._sketches[key]
+
+    def _flush_key(self, key):
+        buf = self._buffers.pop(key, None)
+        if buf:
+            self._get_sketch(key).extend(buf)
+
+    def flush(self):
+        for key in self._buffers.keys():
+            self._flush_key(key)
+
+    def merge(self, other):
+        self.flush()
+        other.flush()
+        for key, sketch in other._sketches.iteritems():
+            if key in self._sketches:
+                self._sketches[key].merge(sketch)
+            else:
+                self._sketches[key] = sketch
+        return self
+
+    def keys(self):
+        self.flush()
+        return self._sketches.keys()
+
+    def items(self):
+        self.flush()
+        return self._sketches.items()
+
+    def __getitem__(self, key):
+        self.flush()
+        return self._sketches[key]
+
+    def __contains__(self, key):
+        return key in self._sketches or key in self._buffers
+
+    def __len__(self):
+        self.flush()
+        return len(self._sketches)
+
+
+# Sketches of Syngo fluoro times
+
+def _fluoro_value(fluoro, log, zero_value):
+    """The value to sketch for a fluoro time, or None to skip it"""
+    if fluoro == 0 and not zero_value is None:
+        fluoro = zero_value
+    if log:
+        if fluoro <= 0:
+            return None
+        return math.log(fluoro)
+    return float(fluoro)
+
+def sketch_syngo_fluoros(syngo_procs, log = False, zero_value = None, k = DEFAULT_K):
+    """Sketch the fluoro times of Syngo records by cpt code combination
+
+    Parameters:
+        syngo_procs : iterable of Syngo objects. those without a fluoro time
+            are skipped.
+        log : if True, sketch the log of the fluoro times. times that are
+            still <= 0 after zero_value is applied are skipped.
+        zero_value : if not None, fluoro times of 0 are replaced with this
+
+    Returns:
+        a Grouped_Sketch keyed by cpt code combination string
+    """
+    grouped = Grouped_Sketch(k)
+    for p in syngo_procs:
+        if p.fluoro is None:
+            continue
+        value = _fluoro_value(p.fluoro, log, zero_value)
+        if not value is None:
+            grouped.add(p.get_cpts_as_string(), value)
+    grouped.flush()
+    return grouped
+
+
+import products
+
+@products.register_product('syngo_fluoro_sketches', requires = ['syngo_procs'],
+                           params = ['log', 'zero_value'])
+def _syngo_fluoro_sketches(procs, extra_procs, syngo_procs, log = False, zero_value = None):
+    """Grouped_Sketch of the fluoro times of every Syngo record by cpt code
+    combination. See sketch_syngo_fluoros.
+    """
+    return sketch_syngo_fluoros(syngo_procs, log, zero_value)
@@ -149,6 +149,10 @@ class Procedure(object):
                 StudyDate : a datetime.date object. usually the same as SeriesDate
                 StudyDescription : a string.
                 StudyInstanceUID : a string.
+                Device_Observer_UID : a string identifying the fluoro
+                        machine, from the Observer_Context. None if missing.
+                Device_Observer_Name : a string. the machine's name, if any
+                Serial_Number : a string. the machine's serial number
         """
         DATE_ATTRS = ['SeriesDate', 'StudyDate']
         OTHER_ATTRS = ['SeriesTime','StudyTime', 'PatientID']
@@ -160,6 +164,9 @@ class Procedure(object):
                         'SeriesDescription',
                         'StudyDescription',
                         'Performing_Physician']
+        OBSERVER_ATTRS = ['Device_Observer_UID',
+                          'Device_Observer_Name',
+                          'Serial_Number'] #attrs of the Observer_Context child element
         
         IVRFU_CPT = "-99999"
         
@@ -181,6 +188,12 @@ class Procedure(object):
                                 setattr(self, attr, die.attributes[attr].value)
                         except KeyError:
                                 setattr(self, attr, None)
+                observer_contexts = die.getElementsByTagName('Observer_Context')
+                for attr in self.OBSERVER_ATTRS:
+                        try:
+                                setattr(self, attr, observer_contexts[0].attributes[attr].value)
+                        except (IndexError, KeyError):
+                                setattr(self, attr, None)
                 self._syngo = None
                 if syngo:
                         self.add_syngo(syngo)
@@ -206,6 +219,21 @@ class Procedure(object):
                 """
                 events = self.get_events(valid)
                 return [e for e in events if e.Irradiation_Event_Type =="Fluoroscopy"]
+
+        def get_device(self):
+                """Return a string identifying the fluoro machine the
+                procedure was done on: its Device_Observer_UID, or its
+                Serial_Number if that is missing, or None if neither is known
+                """
+                if self.Device_Observer_UID:
+                        return self.Device_Observer_UID
+                return self.Serial_Number or None
+
+        def get_device_label(self):
+                """Return the name of the fluoro machine the procedure was done
+                on, for the report. See get_device_label
+                """
+                return get_device_label(self.get_device(), self.Device_Observer_Name)
         
 
                 
@@ -373,11 +401,27 @@ def add_syngo_to_procedures(procs, syngo_procs):
                 a list of Syngo_Procedures that haven't been paired to SR
                         procedures
         """
+        lookup = make_syngo_lookup(syngo_procs)
+        match_syngo(procs, lookup)
+        return sum(lookup.values(), [])
+
+def make_syngo_lookup(syngo_procs):
+        """Return a dict mapping (mpi, dos_start) to lists of syngo
+        procedures, for use with match_syngo
+        """
         lookup = {}
         for sproc in syngo_procs:
                 if not (sproc.mpi, sproc.dos_start) in lookup:
                         lookup[(sproc.mpi, sproc.dos_start)] = []
                 lookup[(sproc.mpi, sproc.dos_start)].append(sproc)
+        return lookup
+
+def match_syngo(procs, lookup):
+        """Pair each procedure in procs with a syngo procedure from lookup
+        (see make_syngo_lookup). Syngo procedures that get matched are
+        removed from lookup, so it can be reused for the next batch of
+        procedures.
+        """
         for proc in procs:
                 found_match = False
                 try:
@@ -395,22 +439,120 @@ def add_syngo_to_procedures(procs, syngo_procs):
                         break
                 if found_match:
                         sproc_list.remove(sproc)
-        return sum(lookup.values(), [])
+
+def get_device_label(device, name = None):
+        """Return the name of a fluoro machine to show in the report
+
+        Arguments:
+                device : the machine, as returned by Procedure.get_device
+                name : the machine's Device_Observer_Name, if known
+        """
+        if device is None:
+                return "Unknown Machine"
+        elif name:
+                return name + " (" + device + ")"
+        return device
+
+def index_devices(procs, names = None):
+        """Number the fluoro machines a list of procedures were done on
+
+        Arguments:
+                procs : list of Procedure objects
+                names : optional dict mapping machines to their
+                        Device_Observer_Name. machines that aren't in it
+                        yet are added, with the name of their first procedure
+
+        Returns:
+                (devices, device_ids) where devices is a sorted list of the
+                        distinct machines (see Procedure.get_device) and
+                        device_ids is an int array of the index in devices of
+                        each procedure's machine
+        """
+        # imported here so that importing srdata doesn't import numpy
+        import numpy as np
+        devices = [p.get_device() for p in procs]
+        if not names is None:
+                for proc, device in zip(procs, devices):
+                        if not device in names:
+                                names[device] = proc.Device_Observer_Name
+        device_list = sorted(set(devices))
+        device_index = dict([(d, i) for i, d in enumerate(device_list)])
+        return device_list, np.array([device_index[d] for d in devices], dtype = int)
         
                 
 import Parse_Syngo
+from instrumentation import stage_or_null
+from progress import get_progress, READING
 
-def process_files(xml_file_names, cpt_file_names):
+def process_files(xml_file_names, cpt_file_names, instrumentation = None):
         """Given lists of SR and xpt file names, return procedure objects
+
+        If an instrumentation.Instrumentation object is passed in, each
+        stage (XML parsing, Syngo parsing, matching) is timed, each file
+        read is reported to its progress, and my_exceptions.CancelledError
+        is raised if the run is cancelled part way through a file.
         """
+        progress = get_progress(instrumentation)
+        progress.start_phase(READING, len(xml_file_names) + len(cpt_file_names) + 1)
         procs = []
-        for xfn in xml_file_names:
-                xmldoc = minidom.parse(xfn)
-                procs = procs + [Procedure(dose_info_element) for dose_info_element in xmldoc.getElementsByTagName('DoseInfo')]
-        syngo_procs = Parse_Syngo.parse_syngo_files(cpt_file_names)
-        extra_syngo = add_syngo_to_procedures(procs, syngo_procs)
-        return [proc for proc in procs if proc.is_real()],  extra_syngo
+        with stage_or_null(instrumentation, "XML parsing", 'ingest') as record:
+                for xfn in xml_file_names:
+                        xmldoc = minidom.parse(xfn)
+                        for dose_info_element in xmldoc.getElementsByTagName('DoseInfo'):
+                                progress.check()
+                                procs.append(Procedure(dose_info_element))
+                        progress.advance("Read " + xfn)
+                record.count = len(procs)
+        with stage_or_null(instrumentation, "Syngo parsing", 'ingest') as record:
+                syngo_procs = Parse_Syngo.parse_syngo_files(cpt_file_names, progress)
+                record.count = len(syngo_procs)
+        with stage_or_null(instrumentation, "Syngo matching", 'ingest') as record:
+                extra_syngo = add_syngo_to_procedures(procs, syngo_procs)
+                real_procs = [proc for proc in procs if proc.is_real()]
+                record.count = len(procs)
+        progress.advance()
+        return real_procs,  extra_syngo
                 
+from xml.dom import pulldom
+
+def iter_procedures(xml_file_names, syngo_lookup = None):
+        """Yield Procedure objects one at a time from the xml files
+        without holding the whole document in memory.
+
+        Unlike process_files, procedures that aren't real are still
+        yielded.
+
+        Arguments:
+                xml_file_names : iterable of paths to DICOM-SR xml files
+                syngo_lookup : optional dict made by make_syngo_lookup.
+                        procedures are matched against it as they are read
+        """
+        for xfn in xml_file_names:
+                stream = pulldom.parse(xfn)
+                for event, node in stream:
+                        if event == pulldom.START_ELEMENT and node.tagName == 'DoseInfo':
+                                stream.expandNode(node)
+                                proc = Procedure(node)
+                                node.unlink()
+                                if syngo_lookup is not None:
+                                        match_syngo([proc], syngo_lookup)
+                                yield proc
+
+def iter_procedure_chunks(xml_file_names, chunk_size = 1000, syngo_lookup = None):
+        """Yield lists of up to chunk_size real procedures from the xml
+        files. See iter_procedures.
+        """
+        chunk = []
+        for proc in iter_procedures(xml_file_names, syngo_lookup):
+                if not proc.is_real():
+                        continue
+                chunk.append(proc)
+                if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+        if chunk:
+                yield chunk
+
 def process_file(xml_file_name, cpt_file_names):
         """Use xml file to generate Procedure and Event objects.
         DEPRECATED
@@ -0,0 +1,104 @@
+"""Run inquiry.Streaming_Inquiry subclasses over procedures read from
+disk a chunk at a time, so that the whole data set never has to be in
+memory at once.
+
+run_streaming consumes any iterable of chunks in this process.
+run_streaming_files splits the work by xml file across worker processes,
+each of which returns its partial inquiries to be merged.
+
+Only DICOM-SR data is streamed. Syngo data can't be streamed since every
+Syngo record has to be available to match against, so streaming
+inquiries should not depend on extra_procs.
+"""
+import multiprocessing
+import srdata
+import my_exceptions
+from inquiry import Streaming_Inquiry
+from instrumentation import stage_or_null
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _check_streamable(inquiry_classes):
+    for inq_cls in inquiry_classes:
+        if not issubclass(inq_cls, Streaming_Inquiry):
+            raise my_exceptions.BadInquiryError(inq_cls.__name__ + " is not a Streaming_Inquiry")
+
+def consume_chunks(inquiry_classes, chunks, instrumentation = None):
+    """Return a list of partial inquiries (one per class) that have
+    consumed every chunk, but haven't been finished.
+    """
+    _check_streamable(inquiry_classes)
+    partials = [inq_cls.new_partial() for inq_cls in inquiry_classes]
+    for chunk in chunks:
+        for inq in partials:
+            with stage_or_null(instrumentation, inq.__class__.__name__ + '.consume', 'inquiry'):
+                inq.consume_unfiltered(chunk)
+    return partials
+
+def run_streaming(inquiry_classes, chunks, instrumentation = None):
+    """Run streaming inquiries over an iterable of lists of procedures
+
+    Returns:
+        a list of finished inquiries, one per class in inquiry_classes
+    """
+    partials = consume_chunks(inquiry_classes, chunks, instrumentation)
+    for inq in partials:
+        inq.finish()
+    return partials
+
+
+def _set_parameter_values(inq_cls, values):
+    for name, value in values.iteritems():
+        getattr(inq_cls, name).set_value(value)
+
+def _consume_file(args):
+    """Worker process: run partial inquiries over one xml file"""
+    inquiry_classes, parameter_values, xml_file_name, chunk_size = args
+    # parameters are class attributes, so they have to be set again in
+    # processes that didn't inherit them from the parent
+    for inq_cls, values in zip(inquiry_classes, parameter_values):
+        _set_parameter_values(inq_cls, values)
+    chunks = srdata.iter_procedure_chunks([xml_file_name], chunk_size)
+    return consume_chunks(inquiry_classes, chunks)
+
+def run_streaming_files(inquiry_classes, xml_file_names, processes = None,
+                        chunk_size = DEFAULT_CHUNK_SIZE, instrumentation = None):
+    """Run streaming inquiries over DICOM-SR xml files
+
+    Each file is read by a worker process which returns its partial
+    inquiries. The partials are merged in the order of xml_file_names and
+    then finished.
+
+    Parameters:
+        inquiry_classes : list of Streaming_Inquiry subclasses
+        xml_file_names : list of paths to DICOM-SR xml files
+        processes : number of worker processes. defaults to the number of
+            cpus. if 1, everything is done in this process.
+        chunk_size : number of procedures passed to consume at a time
+
+    Returns:
+        a list of finished inquiries, one per class in inquiry_classes
+    """
+    _check_streamable(inquiry_classes)
+    if processes == 1 or len(xml_file_names) <= 1:
+        chunks = srdata.iter_procedure_chunks(xml_file_names, chunk_size)
+        return run_streaming(inquiry_classes, chunks, instrumentation)
+    parameter_values = [inq_cls.get_parameter_values() for inq_cls in inquiry_classes]
+    tasks = [(inquiry_classes, parameter_values, name, chunk_size) for name in xml_file_names]
+    pool = multiprocessing.Pool(processes)
+    try:
+        with stage_or_null(instrumentation, "Streaming consume", 'inquiry'):
+            file_partials = pool.map(_consume_file, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    results = file_partials[0]
+    with stage_or_null(instrumentation, "Streaming merge", 'inquiry'):
+        for partials in file_partials[1:]:
+            for inq, other in zip(results, partials):
+                inq.merge(other)
+    for inq in results:
+        with stage_or_null(instrumentation, inq.__class__.__name__ + '.finish', 'inquiry'):
+            inq.finish()
+    return results
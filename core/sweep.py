@@ -0,0 +1,117 @@
+"""Run one inquiry class over a grid of parameter values.
+
+Each combination of values gets its own copy of the inquiry class with
+its own parameters, so the combinations don't interfere with each other or
+with the class the GUI is using. All of the copies are run by one
+scheduler.Inquiry_Scheduler, so the products that don't depend on the
+parameters being swept (e.g. extracting and grouping the Syngo records)
+are computed once and shared, and only the rest of each run is repeated.
+
+== Usage ==
+
+    result = run_sweep(Operator_Improvement,
+                       {'PROCS_PER_WINDOW' : [100, 200, 400],
+                        'USE_LOG' : [True, False]},
+                       procs, extra_procs)
+    table = result.get_table()
+
+"""
+import copy
+import itertools
+from multiprocessing.pool import ThreadPool
+from scheduler import Inquiry_Scheduler
+from instrumentation import stage_or_null
+
+
+def expand_grid(grid):
+    """
+    Parameters:
+        grid : a dict mapping parameter names to lists of values
+
+    Returns:
+        a list of dicts mapping parameter names to values, one for every
+            combination. the last parameter (by name) varies fastest.
+    """
+    names = sorted(grid.keys())
+    return [dict(zip(names, values))
+            for values in itertools.product(*[grid[name] for name in names])]
+
+def make_variant(inq_cls, values):
+    """Return a subclass of inq_cls with its own copies of the parameters,
+    set to `values` (a dict mapping parameter names to values)
+    """
+    names = inq_cls.get_parameter_names()
+    attrs = {'__module__' : inq_cls.__module__}
+    for name in names:
+        attrs[name] = copy.copy(getattr(inq_cls, name))
+    for name, value in values.iteritems():
+        if not name in attrs:
+            raise ValueError(inq_cls.__name__ + " has no parameter named " + str(name))
+        attrs[name].set_value(value)
+    return type(inq_cls.__name__, (inq_cls,), attrs)
+
+
+class Sweep_Result(object):
+    """
+    Attributes:
+        names : the names of the swept parameters
+        runs : list of (dict of parameter values, Inquiry) in the order
+            returned by expand_grid
+    """
+    def __init__(self, names, runs):
+        self.names = names
+        self.runs = runs
+
+    def get_table(self):
+        """Return one table with a row per combination of parameter
+        values, holding the values followed by the inquiry's
+        get_sweep_summary
+        """
+        summaries = [inq.get_sweep_summary() for values, inq in self.runs]
+        labels = []
+        for summary in summaries:
+            for label, value in summary:
+                if not label in labels:
+                    labels.append(label)
+        table = [list(self.names) + labels]
+        for (values, inq), summary in zip(self.runs, summaries):
+            summary = dict(summary)
+            table.append([values[name] for name in self.names] +
+                         [summary.get(label, '') for label in labels])
+        return table
+
+
+def run_sweep(inq_cls, grid, procs, extra_procs, threads = 4, instrumentation = None):
+    """Run inq_cls once for every combination of the values in grid
+
+    Parameters:
+        inq_cls : an Inquiry subclass
+        grid : a dict mapping parameter names of inq_cls to lists of
+            values to try
+        procs : list of srdata.Procedure objects
+        extra_procs : list of other procedure objects (e.g. Syngo)
+        threads : number of threads used for the products and the runs.
+            1 does everything in the calling thread.
+
+    Returns:
+        a Sweep_Result
+    """
+    combinations = expand_grid(grid)
+    variants = [make_variant(inq_cls, values) for values in combinations]
+    scheduler = Inquiry_Scheduler(procs, extra_procs, threads)
+    scheduler.compute_products(variants, instrumentation)
+    def run(i):
+        variant = variants[i]
+        with stage_or_null(instrumentation, inq_cls.__name__ + '.run ' + repr(combinations[i]), 'inquiry'):
+            return variant(procs, extra_procs = extra_procs,
+                           products = scheduler.get_store(variant))
+    if threads > 1 and len(variants) > 1:
+        pool = ThreadPool(threads)
+        try:
+            inqs = pool.map(run, range(len(variants)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        inqs = [run(i) for i in range(len(variants))]
+    return Sweep_Result(sorted(grid.keys()), zip(combinations, inqs))
@@ -0,0 +1,397 @@
+"""
+This module generates synthetic CARE DICOM-SR exports and matching Syngo
+workbooks so that the rest of the program can be tested and benchmarked at
+realistic volumes without access to patient data.
+
+The XML has the same structure the parser in srdata expects: a DoseInfo
+element per procedure with an Observer_Context child and one CT_Acquisition
+element per irradiation event, including the xml payload hidden in the
+"Comment" attribute. The Syngo workbooks are written with
+Parse_Syngo.write_syngo_file, so they have the data on the second sheet just
+like the real exports.
+
+Everything is drawn from a random.Random seeded with `seed`, so the same
+arguments always produce the same files.
+
+== Usage ==
+
+As a command-line script:
+    python synthetic_data.py [output directory] [number of events] [seed]
+
+From within another python program, use "generate_dataset".
+
+"""
+import os
+import random
+import datetime
+import collections
+from xml.sax.saxutils import quoteattr
+import my_utils
+import Parse_Syngo
+
+
+class Synthetic_Config(object):
+    """The distributions the synthetic data is drawn from.
+
+    Every attribute can be overridden by passing it as a keyword argument
+    to the initializer.
+
+    Attributes:
+        start_date : datetime.date of the first procedure
+        num_days : number of days the procedures are spread over
+        events_per_procedure : mean number of irradiation events per procedure
+        event_types : list of (Irradiation_Event_Type, weight)
+        spot_fraction : fraction of fluoroscopy events recorded with the
+            'Spot' Acquisition_Protocol
+        cpt_combinations : list of (list of cpt strings, weight, median
+            fluoro minutes)
+        radiologists : list of (name, weight, fluoro time multiplier)
+        rooms : list of (LOCATION, Serial_Number, weight)
+        weekend_weight : how likely a procedure is to happen on a weekend day
+            relative to a weekday
+        syngo_fraction : fraction of SR procedures that have a Syngo record
+        extra_syngo_fraction : number of additional Syngo-only records
+            written, as a fraction of the number of SR procedures
+        invalid_event_fraction : fraction of events written with nonsense
+            values so that Event.is_valid() is False
+    """
+    def __init__(self, **kwargs):
+        self.start_date = datetime.date(2011, 1, 3)
+        self.num_days = 365
+        self.events_per_procedure = 40
+        self.event_types = [("Fluoroscopy", 85),
+                            ("Stationary Acquisition", 14),
+                            ("Rotational Acquisition", 1)]
+        self.spot_fraction = .05
+        self.cpt_combinations = [(['36556'], 30, 2.0),
+                                 (['36561', '77001'], 20, 4.5),
+                                 (['49440'], 12, 8.0),
+                                 (['37224', '75710'], 10, 18.0),
+                                 (['50432'], 10, 6.5),
+                                 (['47511', '75980'], 8, 12.0),
+                                 (['36005', '75820', '37187'], 5, 15.0),
+                                 (['62311'], 5, 1.0)]
+        self.radiologists = [("Stewart, J.", 20, 1.0),
+                             ("Rayner, K.", 18, .8),
+                             ("Mani, N.", 15, 1.4),
+                             ("Picus, D.", 15, .7),
+                             ("Duncan, J.", 12, 1.0),
+                             ("Vedantham, S.", 10, 1.1),
+                             ("Salter, A.", 10, .9)]
+        self.rooms = [("IR ROOM 1", "100101", 30),
+                      ("IR ROOM 2", "100102", 30),
+                      ("IR ROOM 3", "100103", 25),
+                      ("NEURO IR", "200101", 15)]
+        self.weekend_weight = .1
+        self.syngo_fraction = .9
+        self.extra_syngo_fraction = .05
+        self.invalid_event_fraction = .002
+        for name, value in kwargs.iteritems():
+            if not hasattr(self, name):
+                raise ValueError("Synthetic_Config has no setting named " + str(name))
+            setattr(self, name, value)
+
+
+def _weighted_choice(rand, choices, weight_index = 1):
+    total = sum([c[weight_index] for c in choices])
+    r = rand.uniform(0, total)
+    upto = 0
+    for c in choices:
+        upto += c[weight_index]
+        if upto >= r:
+            return c
+    return choices[-1]
+
+def _device_observer_uid(serial_number):
+    return "2.4.10.7.1008.6.2.6." + str(serial_number)
+
+
+class _Synthetic_Procedure(object):
+    """Plain data describing one generated procedure. Knows how to
+    write itself out as a DoseInfo element and a Syngo record.
+    """
+    def __init__(self, number, patient_id, start, room, rad1, cpts,
+                 events, has_syngo):
+        self.number = number
+        self.patient_id = patient_id
+        self.start = start
+        self.room = room
+        self.rad1 = rad1
+        self.cpts = cpts
+        self.events = events # list of attribute dicts
+        self.has_syngo = has_syngo
+
+    def get_end(self):
+        last = self.events[-1]
+        return last['_start'] + datetime.timedelta(seconds = last['_duration'])
+
+    def get_fluoro_minutes(self):
+        seconds = sum([e['_duration'] for e in self.events
+                       if e['Irradiation_Event_Type'] == "Fluoroscopy"])
+        return round(seconds/60.0, 1)
+
+    def to_xml(self):
+        care_date = my_utils.python_date_to_care_date(self.start.date())
+        series_uid = _device_observer_uid(self.room[1]) + ".500000." + \
+                     care_date + "." + str(self.number)
+        attrs = [('PatientID', str(self.patient_id)),
+                 ('Gender', 'F' if self.patient_id % 2 else 'M'),
+                 ('SeriesDate', care_date),
+                 ('StudyDate', care_date),
+                 ('SeriesTime', self.start.strftime("%H%M%S") + ".000000"),
+                 ('StudyTime', self.start.strftime("%H%M%S") + ".000000"),
+                 ('SeriesInstanceUID', series_uid),
+                 ('StudyInstanceUID', "2.1.392.112344.212.09793965" + care_date + str(self.number)),
+                 ('Scope_of_Accumulation', "Study"),
+                 ('SeriesDescription', "Radiation Dose Information"),
+                 ('StudyDescription', "Synthetic"),
+                 ('Performing_Physician', ''.join([n[0] for n in self.rad1.split(', ')]))]
+        lines = ['<DoseInfo ' + ' '.join([k + '=' + quoteattr(v) for k, v in attrs]) + '>']
+        lines.append('<Observer_Context Device_Observer_Name=' + quoteattr(self.room[0]) +
+                     ' Device_Observer_UID=' + quoteattr(_device_observer_uid(self.room[1])) +
+                     ' Serial_Number=' + quoteattr(self.room[1]) + '/>')
+        for i, event in enumerate(self.events):
+            event_attrs = [(k, v) for k, v in sorted(event.iteritems()) if not k[0] == '_']
+            event_attrs.append(('Irradiation_Event_UID', series_uid + '.' + str(i)))
+            lines.append('<CT_Acquisition ' + ' '.join([k + '=' + quoteattr(v) for k, v in event_attrs]) + '/>')
+        lines.append('</DoseInfo>')
+        return '\n'.join(lines)
+
+    def to_syngo_dict(self, rand):
+        """Return a dict that can be passed to Parse_Syngo.Syngo"""
+        end = self.get_end()
+        read = end + datetime.timedelta(hours = rand.randint(1, 48))
+        d = {'MPI' : self.patient_id,
+             'MRN' : self.patient_id + 1000000,
+             'ACC' : 50000000 + self.number,
+             'RAD1' : self.rad1,
+             'RAD2' : None,
+             'TECH' : "TECH" + str(self.number % 13),
+             'LOCATION' : self.room[0],
+             'DEPT' : "IR",
+             'DOB' : datetime.date(1930 + self.patient_id % 70, 1 + self.patient_id % 12, 1),
+             'FLUORO' : self.get_fluoro_minutes(),
+             'KAR' : round(sum([float(e['Dose_RP'].split()[0]) for e in self.events])*1000, 1),
+             'KAP' : round(sum([float(e['Dose_Area_Product'].split()[0]) for e in self.events])*1000000, 1),
+             'Ima' : len(self.events),
+             'DLP' : None,
+             'CTDI' : None,
+             'CPTs' : ','.join(self.cpts)}
+        datetimes = (self.start, end, read, read + datetime.timedelta(hours = 1),
+                     self.start - datetime.timedelta(days = 1))
+        for (date_attr, time_attr), dt in zip(Parse_Syngo.Syngo._DATETIME_PAIR_ATTRS, datetimes):
+            d[date_attr] = dt.date()
+            d[time_attr] = dt.time().replace(microsecond = 0)
+        return d
+
+def _make_event(rand, config, start, fluoro_scale):
+    """Return the attribute dict for a single CT_Acquisition element.
+    Keys starting with '_' are bookkeeping and are not written out.
+    """
+    event_type = _weighted_choice(rand, config.event_types)[0]
+    if event_type == "Fluoroscopy":
+        pulse_rate = rand.choice([3.0, 7.5, 7.5, 10.0, 15.0, 15.0, 30.0])
+        pulses = max(1, int(rand.lognormvariate(3.0, 1.0) * fluoro_scale))
+        if rand.random() < config.spot_fraction:
+            protocol = "Spot"
+            pulses = 1
+        else:
+            protocol = "Fluoro"
+        dose_per_pulse = rand.uniform(.00002, .0001)
+    else:
+        pulse_rate = rand.choice([1.0, 2.0, 3.0, 6.0])
+        pulses = rand.randint(5, 60)
+        protocol = "DSA" if event_type == "Stationary Acquisition" else "DynaCT"
+        dose_per_pulse = rand.uniform(.0005, .003)
+    pulse_width = rand.choice([5.0, 8.0, 10.0, 12.5])
+    duration = 0 if pulses == 1 else (pulses - 1)/pulse_rate
+    dose = pulses * dose_per_pulse
+    exposure = pulses * rand.uniform(.5, 3.0)
+    if rand.random() < config.invalid_event_fraction:
+        exposure = 0.0 # makes Event.is_valid() False
+    comment = '<Comment><Time SRData="' + start.strftime("%d-%b-%y %H:%M:%S") + \
+              '"/><iiDiameter SRData="' + str(rand.choice([220, 270, 320, 420, 480])) + \
+              '"/></Comment>'
+    return {'_start' : start,
+            '_duration' : duration,
+            'DateTime_Started' : my_utils.python_datetime_to_care_datetime(start),
+            'Irradiation_Event_Type' : event_type,
+            'Acquisition_Protocol' : protocol,
+            'Acquisition_Plane_in_Irradiation_Event' : "Single Plane",
+            'Target_Region' : rand.choice(["Abdomen", "Chest", "Head", "Pelvis", "Extremity"]),
+            'Fluoro_Mode' : "Pulsed",
+            'Reference_Point_Definition' : "15cm from Isocenter toward Source",
+            'Positioner_Primary_Angle' : "%.1f" % rand.gauss(0, 35),
+            'Positioner_Secondary_Angle' : "%.1f" % rand.gauss(0, 15),
+            'Pulse_Rate' : "%.1f" % pulse_rate,
+            'Number_of_Pulses' : str(min(pulses, 512)), # CARE caps the reported value at 512
+            'Exposure_Time' : "%.1f ms" % (pulses * pulse_width),
+            'Pulse_Width' : "%.1f ms" % pulse_width,
+            'Exposure' : "%.2f uAs" % exposure,
+            'Focal_Spot_Size' : "0.6 mm",
+            'Dose_Area_Product' : "%.7f Gym2" % (dose * rand.uniform(.005, .02)),
+            'Dose_RP' : "%.6f Gy" % dose,
+            'Distance_Source_to_Detector' : "%d mm" % rand.randint(900, 1200),
+            'Distance_Source_to_Isocenter' : "785 mm",
+            'KVP' : "%.1f kV" % rand.uniform(60, 110),
+            'X-Ray_Tube_Current' : "%.1f mA" % rand.uniform(5, 400),
+            'Table_Lateral_Position' : "%d mm" % rand.randint(-150, 150),
+            'Table_Height_Position' : "%d mm" % rand.randint(-250, 0),
+            'Table_Longitudinal_Position' : "%d mm" % rand.randint(-800, 800),
+            'Comment' : comment}
+
+
+def _get_num_proc_events(rand, config):
+    return max(1, int(rand.expovariate(1.0/config.events_per_procedure)))
+
+def generate_procedures(num_events, seed = 0, config = None):
+    """Yield _Synthetic_Procedures in order of start time until at least
+    `num_events` irradiation events have been generated.
+
+    The procedures are spread over config.num_days days, so the number of
+    procedures per day grows with `num_events`.
+    """
+    if config is None:
+        config = Synthetic_Config()
+    rand = random.Random(seed)
+    day_weights = []
+    for d in range(config.num_days):
+        day = config.start_date + datetime.timedelta(days = d)
+        day_weights.append(config.weekend_weight if day.weekday() >= 5 else 1.0)
+    remaining_weight = sum(day_weights)
+    events_so_far = 0
+    number = 0
+    for d, weight in enumerate(day_weights):
+        if events_so_far >= num_events:
+            break
+        day = config.start_date + datetime.timedelta(days = d)
+        events_left = num_events - events_so_far
+        if d == len(day_weights) - 1:
+            # just enough procedures for the events that are left
+            event_counts = []
+            while sum(event_counts) < events_left:
+                event_counts.append(_get_num_proc_events(rand, config))
+        else:
+            # the day's share of the events that are left, so that days
+            # which come up short are made up over the following days
+            # rather than all on the last one
+            expected = float(events_left)/config.events_per_procedure * weight/remaining_weight
+            procs_today = int(round(expected + rand.uniform(-.5, .5)))
+            event_counts = [_get_num_proc_events(rand, config) for i in range(max(0, procs_today))]
+        remaining_weight -= weight
+        starts = sorted([datetime.datetime.combine(day, datetime.time(7)) +
+                         datetime.timedelta(seconds = rand.randint(0, 11*3600))
+                         for i in range(len(event_counts))])
+        for start, num_proc_events in zip(starts, event_counts):
+            if events_so_far >= num_events:
+                break
+            cpts, _, median_fluoro = _weighted_choice(rand, config.cpt_combinations)
+            rad1, _, rad_factor = _weighted_choice(rand, config.radiologists)
+            room = _weighted_choice(rand, config.rooms, weight_index = 2)
+            fluoro_scale = median_fluoro/4.0 * rad_factor
+            num_proc_events = min(num_proc_events, num_events - events_so_far)
+            events = []
+            t = start
+            for i in range(num_proc_events):
+                event = _make_event(rand, config, t, fluoro_scale)
+                events.append(event)
+                pause = rand.lognormvariate(3.0, 1.2)
+                t = t + datetime.timedelta(seconds = int(event['_duration'] + pause) + 1)
+            events_so_far += num_proc_events
+            patient_id = 1000000 + rand.randint(0, 8999999)
+            yield _Synthetic_Procedure(number, patient_id, start, room, rad1,
+                                       cpts, events,
+                                       rand.random() < config.syngo_fraction)
+            number += 1
+
+
+def _write_xml_header(f, first_date, last_date):
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<CARE_Export>\n')
+    f.write('<Query_Criteria Query_Date_From="' + first_date.strftime("%Y-%m-%d") +
+            '" Query_Date_To="' + last_date.strftime("%Y-%m-%d") + '"/>\n')
+
+def _write_syngo_workbook(file_name, syngo_dicts):
+    syngo_procs = [Parse_Syngo.Syngo(d) for d in syngo_dicts]
+    sheets = collections.OrderedDict([("Query", []), ("Data", syngo_procs)])
+    Parse_Syngo.write_syngo_file(file_name, sheets)
+
+XLS_MAX_ROWS = 65535 # an xls sheet has 65536 rows including the heading
+
+def generate_dataset(out_dir, num_events, seed = 0, config = None,
+                     events_per_xml_file = 500000,
+                     syngo_rows_per_file = XLS_MAX_ROWS,
+                     prefix = 'synthetic'):
+    """Write synthetic SR and Syngo files to out_dir
+
+    Parameters:
+        out_dir : directory to write into. created if needed
+        num_events : total number of irradiation events to generate
+        seed : seed for the random number generator
+        config : a Synthetic_Config. defaults to Synthetic_Config()
+        events_per_xml_file : a new xml file is started once a file holds
+            this many events, so that very large data sets are split
+        syngo_rows_per_file : maximum number of Syngo records per workbook
+        prefix : start of every file name written
+
+    Returns:
+        (list of xml file paths, list of Syngo .xls file paths)
+    """
+    if config is None:
+        config = Synthetic_Config()
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    rand = random.Random(seed + 1) # separate stream for the syngo-only data
+    first_date = config.start_date
+    last_date = config.start_date + datetime.timedelta(days = config.num_days)
+    xml_paths = []
+    syngo_paths = []
+    syngo_dicts = []
+    f = None
+    events_in_file = 0
+    extra_number = 10**9
+    def flush_syngo(final = False):
+        while len(syngo_dicts) >= syngo_rows_per_file or (final and syngo_dicts):
+            path = os.path.join(out_dir, prefix + '_syngo_' + str(len(syngo_paths)) + '.xls')
+            _write_syngo_workbook(path, syngo_dicts[:syngo_rows_per_file])
+            del syngo_dicts[:syngo_rows_per_file]
+            syngo_paths.append(path)
+    try:
+        for proc in generate_procedures(num_events, seed, config):
+            if f is None or events_in_file >= events_per_xml_file:
+                if f is not None:
+                    f.write('</CARE_Export>\n')
+                    f.close()
+                path = os.path.join(out_dir, prefix + '_' + str(len(xml_paths)) + '.xml')
+                xml_paths.append(path)
+                f = open(path, 'w')
+                _write_xml_header(f, first_date, last_date)
+                events_in_file = 0
+            f.write(proc.to_xml())
+            f.write('\n')
+            events_in_file += len(proc.events)
+            if proc.has_syngo:
+                syngo_dicts.append(proc.to_syngo_dict(rand))
+            if rand.random() < config.extra_syngo_fraction:
+                # a Syngo record with no corresponding SR data
+                proc.patient_id = proc.patient_id + 1
+                proc.number = extra_number
+                extra_number += 1
+                syngo_dicts.append(proc.to_syngo_dict(rand))
+            flush_syngo()
+        flush_syngo(final = True)
+    finally:
+        if f is not None:
+            f.write('</CARE_Export>\n')
+            f.close()
+    return xml_paths, syngo_paths
+
+
+import sys
+if __name__ == "__main__":
+    out_dir = os.path.abspath(sys.argv[1])
+    num_events = int(float(sys.argv[2]))
+    seed = 0
+    if len(sys.argv) > 3:
+        seed = int(sys.argv[3])
+    xml_paths, syngo_paths = generate_dataset(out_dir, num_events, seed)
+    print '\n'.join(xml_paths + syngo_paths)
@@ -0,0 +1,189 @@
+"""Put large tables in CSV files instead of in the report.
+
+An inquiry's get_tables returns tables (iterables of rows) that the report
+shows inline. A table with one row per procedure or event can make a
+report of hundreds of MB that a browser can't open, so `get_table_outputs`
+streams any table with more than MAX_INLINE_CELLS cells to its own CSV
+file and the report only shows a preview of its first rows, a page at a
+time, with a link to the file.
+
+Tables are read a row at a time, once. A table doesn't have to be a list:
+an inquiry can return a Streamed_Table, whose rows are generated as they
+are written out, so the whole table never has to be in memory. A table
+that the inquiry has already written to a CSV file of its own can be
+returned as a Csv_Table, which links to that file instead of writing
+another copy.
+
+== Usage ==
+
+    for output in get_table_outputs(inq.get_tables(), directory, 'Inq'):
+        if output.csv_path is None:
+            show(output.rows)
+        else:
+            show(output.pages, output.num_rows, output.csv_path)
+
+"""
+import os
+import csv
+
+MAX_INLINE_CELLS = 20000 # bigger tables go in a CSV file
+PREVIEW_ROWS = 200 # rows of a CSV table shown in the report
+PAGE_ROWS = 50 # rows per page of the preview
+
+
+class Streamed_Table(object):
+    """A table whose rows are generated when it is iterated over
+
+    Iterating gives the heading (if any) followed by the rows, like a table
+    that is a list of lists, so it can be used anywhere one can. It may be
+    iterated over more than once.
+    """
+
+    def __init__(self, get_rows, heading = None):
+        """
+        Parameters:
+            get_rows : a function that takes no arguments and returns an
+                iterable of the rows
+            heading : the first row, or None
+        """
+        self._get_rows = get_rows
+        self.heading = heading
+
+    def __iter__(self):
+        if not self.heading is None:
+            yield self.heading
+        for row in self._get_rows():
+            yield row
+
+
+class Csv_Table(object):
+    """A table that is already in a CSV file
+
+    Iterating reads the rows back from the file, as unicode strings. If the
+    table is too big for the report, the report links to the file rather
+    than writing the rows out again.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+
+    def __iter__(self):
+        with open(self.csv_path, 'rb') as f:
+            for row in csv.reader(f):
+                yield [v.decode('utf-8') for v in row]
+
+
+class Table_Output(object):
+    """How to show one table in the report
+
+    Attributes:
+        name : a name for the table that is unique in the report
+        rows : list of every row, if the table is small enough to be shown
+            inline. Otherwise the first PREVIEW_ROWS rows.
+        csv_path : the CSV file with every row, or None if the table is
+            shown inline
+        num_rows : the number of rows in the table
+        num_columns : the number of columns in the widest row
+    """
+
+    def __init__(self, name, rows, csv_path, num_rows, num_columns):
+        self.name = name
+        self.rows = rows
+        self.csv_path = csv_path
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+
+    @property
+    def pages(self):
+        """self.rows split into lists of at most PAGE_ROWS rows"""
+        return [self.rows[i:i + PAGE_ROWS] for i in range(0, len(self.rows), PAGE_ROWS)]
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+def write_csv(rows, path):
+    """Write an iterable of rows to a CSV file a row at a time
+
+    Returns:
+        the number of rows written
+    """
+    num_rows = 0
+    with open(path, 'wb') as f:
+        writer = csv.writer(f)
+        for row in rows:
+            writer.writerow([_encode(v) for v in row])
+            num_rows += 1
+    return num_rows
+
+def get_table_output(table, directory, name, max_inline_cells = None, preview_rows = None):
+    """Read a table once, keeping it inline if it is small or writing it to
+    directory/name.csv (and keeping a preview) if it isn't. A big
+    Csv_Table isn't written again; the output links to its own file.
+
+    Parameters:
+        table : an iterable of rows, e.g. a list of lists, a
+            Streamed_Table or a Csv_Table
+        directory : created if a CSV file has to be written
+        max_inline_cells : defaults to MAX_INLINE_CELLS
+        preview_rows : defaults to PREVIEW_ROWS
+
+    Returns:
+        a Table_Output
+    """
+    if max_inline_cells is None:
+        max_inline_cells = MAX_INLINE_CELLS
+    if preview_rows is None:
+        preview_rows = PREVIEW_ROWS
+    rows = iter(table)
+    kept = []
+    num_cells = 0
+    num_columns = 0
+    for row in rows:
+        row = list(row)
+        kept.append(row)
+        num_cells += len(row)
+        num_columns = max(num_columns, len(row))
+        if num_cells > max_inline_cells:
+            break
+    else:
+        return Table_Output(name, kept, None, len(kept), num_columns)
+    # too big: write what has been read so far, then the rest as it is read
+    preview = kept[:preview_rows]
+    widest = [num_columns]
+    def all_rows():
+        for row in kept:
+            yield row
+        for row in rows:
+            row = list(row)
+            if len(preview) < preview_rows:
+                preview.append(row)
+            widest[0] = max(widest[0], len(row))
+            yield row
+    if isinstance(table, Csv_Table):
+        csv_path = table.csv_path
+        num_rows = sum(1 for row in all_rows())
+    else:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        csv_path = os.path.join(directory, name + '.csv')
+        num_rows = write_csv(all_rows(), csv_path)
+    return Table_Output(name, preview, csv_path, num_rows, widest[0])
+
+def get_table_outputs(tables, directory, name, max_inline_cells = None):
+    """get_table_output for each table returned by an inquiry's get_tables
+
+    Parameters:
+        tables : the return value of get_tables, which may be None
+        directory : where to write CSV files. Created if needed.
+        name : table i is named name + '_' + str(i)
+
+    Returns:
+        a list of Table_Output objects, empty if tables is None
+    """
+    if tables is None:
+        return []
+    return [get_table_output(table, directory, name + '_' + str(i), max_inline_cells)
+            for i, table in enumerate(tables)]
@@ -1,10 +1,16 @@
 import wx
-from srqi.core import my_utils
+import matplotlib
+matplotlib.use('Agg') # figures are drawn in the worker thread and only saved, never shown
+from srqi.core import my_utils, inquiry_registry, inquiry, my_exceptions, progress
 from srqi.gui import report_writer
 import datetime
 import numbers
 import traceback
 import numbers
+import threading
+
+PROGRESS_MAXIMUM = 1000 # the progress dialog's gauge goes from 0 to this
+ABORT_POLL_MS = 250 # how often the progress dialog's abort button is checked
 
 
 class Inquiry_Parameter_Panel(wx.Panel):
@@ -16,7 +22,11 @@ class Inquiry_Parameter_Panel(wx.Panel):
         # add stuff
         sizer = wx.BoxSizer(wx.HORIZONTAL)
         sizer.Add(wx.StaticText(self, 1, self.param.label))
-        if isinstance(self.param.value, datetime.date):
+        if isinstance(self.param, inquiry.Options_Parameter):
+            self.ctrl = wx.Choice(self, choices = [str(o) for o in self.param.get_options()])
+            self.ctrl.SetSelection(self.param.get_options().index(self.param.value))
+            sizer.Add(self.ctrl)
+        elif isinstance(self.param.value, datetime.date):
             self.ctrl = wx.DatePickerCtrl(self, style=wx.DP_DROPDOWN)
             wx_date = my_utils.python_date_to_wx_date(self.param.value)
             self.ctrl.SetValue(wx_date)
@@ -35,6 +45,8 @@ class Inquiry_Parameter_Panel(wx.Panel):
         self.SetSizer(sizer)
             
     def get_value(self):
+        if isinstance(self.ctrl, wx.Choice):
+            return self.param.get_options()[self.ctrl.GetSelection()]
         value = self.ctrl.GetValue()
         if isinstance(value, wx.DateTime):
             value = my_utils.wx_date_to_python_date(value)
@@ -80,7 +92,7 @@ class Inquiry_Panel(wx.CollapsiblePane):
         for param_name in self._inquiry_class.get_parameter_names():
             new_value = self.param_panels[param_name].get_value()
             getattr(self._inquiry_class, param_name).set_value(new_value)
-        return self._inquiry_class
+        return self._inquiry_class.load() # only imported once it is run
 
     def on_change(self, event):
         self.GetParent().Layout()
@@ -90,7 +102,7 @@ class Inquiry_Selection_Panel(wx.Panel):
         wx.Panel.__init__(self, *args, **kwargs)
         sizer = wx.BoxSizer(wx.VERTICAL)
         self.inq_panels = []
-        for inq in my_utils.get_inquiry_classes():
+        for inq in inquiry_registry.get_lazy_inquiries():
             inq_panel = Inquiry_Panel(self, inquiry_class=inq)
             self.inq_panels.append(inq_panel)
             sizer.Add(inq_panel,0)
@@ -117,41 +129,106 @@ class Main_Frame(wx.Frame):
         self.inq_selection_panel = Inquiry_Selection_Panel(self.main_panel, style=wx.RAISED_BORDER)
         sizer.Add(self.data_panel,1,wx.EXPAND)
         sizer.Add(self.inq_selection_panel,2,wx.EXPAND)
-        run_button = wx.Button(self.main_panel, label = "Run")
-        self.Bind(wx.EVT_BUTTON, self.run, run_button)
-        sizer.Add(run_button,0,wx.ALIGN_CENTER)
+        self.run_button = wx.Button(self.main_panel, label = "Run")
+        self.Bind(wx.EVT_BUTTON, self.run, self.run_button)
+        sizer.Add(self.run_button,0,wx.ALIGN_CENTER)
         self.main_panel.SetSizer(sizer)
         self._report_writer = None
-
-    def show_exception(self, e):
+        self._worker = None
+        self._progress = None
+        self._progress_dlg = None
+        self._abort_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_abort_timer, self._abort_timer)
+
+    def show_exception(self, e, tb = None):
+        """
+        Parameters:
+            tb : the formatted traceback of e. defaults to the traceback of
+                the exception being handled
+        """
+        if tb is None:
+            tb = traceback.format_exc()
         dlg = wx.MessageDialog(self.main_panel,
                                        message = "An error occured while attempting to write the report."\
-                                       "\n Error message is: \n" +traceback.format_exc()\
+                                       "\n Error message is: \n" +tb\
                                        +'\n'+ str(e),
                                        style=wx.CANCEL|wx.ICON_EXCLAMATION)
         dlg.ShowModal()
         
 
     def run(self, event):
+        """Parse the data, run the inquiries and write the report in a
+        worker thread, so the window stays responsive. The worker's progress
+        is shown in a progress dialog whose abort button cancels it.
+        """
+        if not self._worker is None:
+            return
         inq_classes = self.inq_selection_panel.get_inquiry_classes()
-        prog_dlg = wx.ProgressDialog(title = "Running inquiries",
-                                     message = "Reading and processing data files",
-                                     maximum = 2,
-                                     parent = self.main_panel,
-                                     style = wx.PD_AUTO_HIDE|wx.PD_CAN_ABORT|wx.PD_ELAPSED_TIME)
         data_paths = self.data_panel.get_file_names()
+        self._progress_dlg = wx.ProgressDialog(title = "Running inquiries",
+                                               message = progress.READING,
+                                               maximum = PROGRESS_MAXIMUM,
+                                               parent = self.main_panel,
+                                               style = wx.PD_CAN_ABORT|wx.PD_ELAPSED_TIME)
+        self._progress = progress.Progress(self.post_progress, progress.PHASES)
+        self._worker = threading.Thread(target = self.run_worker,
+                                        args = (data_paths, inq_classes, self._progress))
+        self._worker.daemon = True
+        self.run_button.Disable()
+        self._abort_timer.Start(ABORT_POLL_MS)
+        self._worker.start()
+
+    def run_worker(self, data_paths, inq_classes, run_progress):
+        """The body of the worker thread started by run. Must not touch the
+        gui except through wx.CallAfter.
+        """
+        error = None
         try:
             if not self._report_writer:
-                self._report_writer = report_writer.Report_Writer(data_paths,inq_classes)
+                self._report_writer = report_writer.Report_Writer(data_paths, inq_classes,
+                                                                  progress = run_progress)
             else:
-                self._report_writer.update(data_paths, inq_classes)
-            cont, _ = prog_dlg.Update(1, "Writing report.")
-            if cont:
-                self._report_writer.write()
+                self._report_writer.update(data_paths, inq_classes, run_progress)
+            self._report_writer.write()
+        except my_exceptions.CancelledError:
+            pass
         except Exception as e:
-            self.show_exception(e)
-            prog_dlg.Update(2, "Done")
-        prog_dlg.Update(2, "Done")
+            error = (e, traceback.format_exc())
+        wx.CallAfter(self.on_run_finished, error)
+
+    def post_progress(self, message, fraction):
+        """Called in the worker thread with each progress update"""
+        wx.CallAfter(self.show_progress, message, fraction)
+
+    def show_progress(self, message, fraction):
+        if self._progress_dlg is None or self._progress.is_cancelled():
+            return
+        value = min(int(fraction*PROGRESS_MAXIMUM), PROGRESS_MAXIMUM - 1) # the dialog closes at the maximum
+        cont, _ = self._progress_dlg.Update(value, message)
+        if not cont:
+            self._progress.cancel()
+            self._progress_dlg.Update(value, "Cancelling...")
+
+    def on_abort_timer(self, event):
+        """Notice a click on the abort button even when the worker is in a
+        long stage that doesn't report any progress
+        """
+        if not self._progress is None:
+            self.show_progress(*self._progress.get_state())
+
+    def on_run_finished(self, error):
+        """Called in the gui thread once the worker thread has finished.
+        error is None or (the exception, its formatted traceback)
+        """
+        self._abort_timer.Stop()
+        self._worker = None
+        self._progress = None
+        if not self._progress_dlg is None:
+            self._progress_dlg.Destroy()
+            self._progress_dlg = None
+        self.run_button.Enable()
+        if not error is None:
+            self.show_exception(*error)
 
 
 class MirqiApp(wx.App):
@@ -3,15 +3,34 @@ import jinja2
 import srqi
 from srqi.core import my_utils
 from srqi.core import srdata
+from srqi.core import table_output
 
+_environments = {} # template folder -> jinja2.Environment
+
+def get_table_outputs(inq):
+    """The table_output.Table_Output of each of an inquiry's tables. Tables
+    too big for the report are written to the tables folder of the output
+    directory.
+    """
+    return table_output.get_table_outputs(inq.get_tables(),
+                                          path.join(my_utils.get_output_directory(), 'tables'),
+                                          inq.__class__.__name__)
+
+def _get_environment(template_folder):
+    """Return the jinja2.Environment for the templates in a folder. The
+    environment keeps the compiled templates, and recompiles one only if
+    its file has changed.
+    """
+    if not template_folder in _environments:
+        env = jinja2.Environment(loader = jinja2.FileSystemLoader(template_folder))
+        env.globals['get_table_outputs'] = get_table_outputs
+        _environments[template_folder] = env
+    return _environments[template_folder]
 
 def _get_report_template():
     TEMPLATE_FOLDER = path.join(srqi.gui.__path__[0], 'templates')
     TEMPLATE_NAME = 'report.html'
-    template_path = path.join(TEMPLATE_FOLDER,TEMPLATE_NAME)
-    with open(template_path, 'r') as f:
-        temp_string = f.read()
-    return jinja2.Template(temp_string)
+    return _get_environment(TEMPLATE_FOLDER).get_template(TEMPLATE_NAME)
 
 
 def write_report(inqs):
@@ -23,18 +42,57 @@ def write_report(inqs):
         f.write(template.render(inquiries= inqs))
 
 import os
+import json
+import hashlib
+from srqi.core import instrumentation, scheduler, incremental, progress
 
 class Report_Writer(object):
     _default_out_dir = srqi.core.my_utils.get_output_directory()
     _default_out_path = path.join(_default_out_dir,
                                  'output.html')
+    _default_performance_path = path.join(_default_out_dir,
+                                          'performance.json')
     _default_template_folder = path.join(srqi.gui.__path__[0], 'templates')
     _default_template_path = path.join(_default_template_folder,'report.html')
+    _default_fragment_dir = path.join(_default_out_dir, 'fragments')
+    SECTION_TEMPLATE_NAME = 'section.html'
+    FRAGMENT_INDEX_NAME = 'index.json'
 
-    def __init__(self, data_paths, inquiry_classes):
+    def __init__(self, data_paths, inquiry_classes, instr = None, progress = None):
+        """
+        Parameters:
+            data_paths : list of paths to data files
+            inquiry_classes : list of Inquiry subclasses to be run
+            instr : optional instrumentation.Instrumentation object. If None,
+                a new one is made. Accessible as self.instrumentation
+            progress : optional progress.Progress object that is told how
+                far parsing, running and writing have got, and can cancel
+                them. Replaces the progress of instr.
+        """
+        if instr is None:
+            instr = instrumentation.Instrumentation()
+        self.instrumentation = instr
+        self.set_progress(progress)
         self.data_paths = data_paths
-        self.procs, self.extra_procs = my_utils.get_procs_from_files(data_paths)
-        self.inqs = [cls(self.procs, extra_procs = self.extra_procs) for cls in inquiry_classes]
+        self.procs, self.extra_procs = my_utils.get_procs_from_files(data_paths,
+                                                                     self.instrumentation)
+        self._scheduler = scheduler.Inquiry_Scheduler(self.procs, self.extra_procs)
+        self.inqs = self._make_inquiries(inquiry_classes)
+
+    def set_progress(self, progress):
+        """Report the progress of the following calls to update and write to
+        a progress.Progress object (if it isn't None)
+        """
+        if not progress is None:
+            self.instrumentation.progress = progress
+
+    def _make_inquiries(self, inquiry_classes):
+        """Run the inquiry classes on the data, sharing intermediate
+        products between them, timing their `run` methods and
+        instrumenting their output methods.
+        """
+        inqs = self._scheduler.run(inquiry_classes, self.instrumentation)
+        return [self.instrumentation.instrument_inquiry(inq) for inq in inqs]
 
     def _update_data(self, data_paths):
         """Make self.procs reflect the data in data_paths
@@ -45,9 +103,12 @@ class Report_Writer(object):
         returns True if an update was actually needed
         """
         if data_paths and not my_utils.same_contents(self.data_paths, data_paths):
-            #new data paths
+            #new data paths. only remembered once they have been read, in
+            #case reading them is cancelled
+            self.procs, self.extra_procs = my_utils.get_procs_from_files(data_paths,
+                                                                         self.instrumentation)
             self.data_paths = data_paths
-            self.procs, self.extra_procs = my_utils.get_procs_from_files(data_paths)
+            self._scheduler = scheduler.Inquiry_Scheduler(self.procs, self.extra_procs)
             return True
         else:
             return False
@@ -55,31 +116,169 @@ class Report_Writer(object):
     def _update_inquiry_objects(self, inquiry_classes, data_changed):
         """Rebuild self.inqs from inquiry_classes
 
-        TODO: if not data_changed, find some way to look for overlap
-        between the inquries that will be generated and the inquiries
-        that we have already generated to avoid repeating analyses
+        If not data_changed, the scheduler still holds the products computed
+        for the previous inquiries, so only new products are computed.
+        TODO: also avoid re-running inquiries that are unchanged.
         """
-        self.inqs = [cls(self.procs, extra_procs = self.extra_procs) for cls in inquiry_classes]
+        self.inqs = self._make_inquiries(inquiry_classes)
 
-    def update(self, data_paths = None, inquiry_classes = None):
+    def update(self, data_paths = None, inquiry_classes = None, progress = None):
+        self.set_progress(progress)
+        self.instrumentation.clear()
         data_changed = self._update_data(data_paths)
         self._update_inquiry_objects(inquiry_classes, data_changed)
                  
 
     def _get_template(self, template_path):
-        with open(template_path, 'r') as f:
-            temp_string = f.read()
-        return jinja2.Template(temp_string)
+        return _get_environment(path.dirname(template_path)).get_template(path.basename(template_path))
+
+    def _get_section_outputs(self, inq):
+        """Call each output method of inq that its section shows, once
+
+        Returns:
+            (text, figures, tables) : what get_text and get_figures return,
+                and the table_output.Table_Output of each table
+        """
+        return inq.get_text(), inq.get_figures(), get_table_outputs(inq)
+
+    def get_section_key(self, inq, section_template, outputs):
+        """Return a hex string that changes whenever the section of the
+        report for inq would: when its name, parameters, text, tables or
+        figures (see figure_output.get_figure_hash) or the section template
+        change.
+
+        Parameters:
+            outputs : what _get_section_outputs returned for inq
+        """
+        from srqi.core import figure_output # imports pyplot, so not at startup
+        text, figures, tables = outputs
+        digest = hashlib.sha1(repr((inq.__class__.__name__, inq.get_name(),
+                                    sorted(inq.get_parameter_values().items()),
+                                    inq.get_parameter_text(), text)))
+        digest.update(repr(incremental.get_file_signature(section_template.filename)))
+        for table in tables:
+            digest.update(repr((table.name, table.rows, table.csv_path,
+                                table.num_rows, table.num_columns)))
+            if not table.csv_path is None:
+                with open(table.csv_path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), ''):
+                        digest.update(block)
+        for fig in figures or ():
+            digest.update(figure_output.get_figure_hash(fig))
+        return digest.hexdigest()
+
+    def _render_section(self, section_template, inq, outputs):
+        text, figures, tables = outputs
+        return section_template.render(inquiry = inq, text = text,
+                                       figure_paths = inq.get_figure_paths(figures),
+                                       tables = tables)
+
+    def _render_sections(self, section_template, fragment_dir):
+        """Render section_template for each inquiry, reusing the fragment
+        saved in fragment_dir by an earlier call if its key (see
+        get_section_key) is the same.
+
+        There is one fragment per inquiry class, since the figures of a
+        section are saved under the name of its class. The figures of a
+        reused fragment are still saved if their files are missing or out
+        of date.
+        """
+        if not os.path.exists(fragment_dir):
+            os.makedirs(fragment_dir)
+        index_path = path.join(fragment_dir, self.FRAGMENT_INDEX_NAME)
+        index = self._read_fragment_index(index_path) # class name -> key of its fragment
+        sections = []
+        for inq in self.inqs:
+            name = inq.__class__.__name__
+            outputs = self._get_section_outputs(inq)
+            key = self.get_section_key(inq, section_template, outputs)
+            fragment_path = path.join(fragment_dir, name + '.html')
+            if index.get(name) == key and os.path.exists(fragment_path):
+                inq.get_figure_paths(outputs[1])
+                with open(fragment_path, 'r') as f:
+                    sections.append(f.read().decode('utf-8'))
+                self.instrumentation.progress.advance("Reused the section for " + name)
+                continue
+            with self.instrumentation.stage(name + " section", 'report'):
+                section = self._render_section(section_template, inq, outputs)
+            # the fragment is only listed in the index once it has been
+            # written, so a run that stops part way (e.g. is cancelled)
+            # never leaves an index entry for a fragment it has replaced
+            if name in index:
+                del index[name]
+                self._write_fragment_index(index_path, index)
+            with open(fragment_path, 'w') as f:
+                f.write(section.encode('utf-8'))
+            index[name] = key
+            self._write_fragment_index(index_path, index)
+            sections.append(section)
+            self.instrumentation.progress.advance("Wrote the section for " + name)
+        return sections
+
+    def _read_fragment_index(self, index_path):
+        """Return the fragment index (see _render_sections), or an empty
+        one if it is missing or can't be read
+        """
+        if not os.path.exists(index_path):
+            return {}
+        try:
+            with open(index_path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _write_fragment_index(self, index_path, index):
+        with open(index_path, 'w') as f:
+            json.dump(index, f, indent = 1, sort_keys = True)
 
     def write(self, template_path = _default_template_path,
-              output_path = _default_out_path):
+              output_path = _default_out_path,
+              show_performance = False,
+              performance_path = _default_performance_path,
+              fragment_dir = _default_fragment_dir):
+        """Render the report
+
+        Each inquiry's section is rendered from section.html (in the same
+        folder as template_path) into its own fragment file, and the
+        report is put together from the fragments. A section that would
+        show the same as in the last call isn't rendered again (see
+        get_section_key). Every inquiry's output methods are still called
+        to find that out.
+
+        Parameters:
+            template_path : path to the jinja2 template
+            output_path : where to write the rendered html
+            show_performance : if True, a "Performance" section with the
+                timings of each stage is added to the end of the report
+            performance_path : where to write the timings as JSON. If None,
+                they are not written.
+            fragment_dir : where to keep the rendered sections. If None,
+                every section is rendered every time.
+        """
         template = self._get_template(template_path)
+        section_template = self._get_template(path.join(path.dirname(template_path),
+                                                        self.SECTION_TEMPLATE_NAME))
         if not os.path.exists(os.path.dirname(output_path)):
             os.makedirs(os.path.dirname(output_path))
-        with open(output_path, 'w') as f:
-            f.write(template.render(inquiries= self.inqs))
-        
-        
-
-
-
+        performance = None
+        if show_performance:
+            performance = self.instrumentation
+        write_progress = self.instrumentation.progress
+        write_progress.start_phase(progress.WRITING, len(self.inqs) + 1)
+        with self.instrumentation.stage("Report rendering", 'report'):
+            if fragment_dir is None:
+                sections = []
+                for inq in self.inqs:
+                    write_progress.check()
+                    sections.append(self._render_section(section_template, inq,
+                                                         self._get_section_outputs(inq)))
+                    write_progress.advance("Wrote the section for " + inq.__class__.__name__)
+            else:
+                sections = self._render_sections(section_template, fragment_dir)
+            with open(output_path, 'w') as f:
+                f.write(template.render(inquiries= self.inqs,
+                                        sections = sections,
+                                        performance = performance).encode('utf-8'))
+        if performance_path:
+            self.instrumentation.write_json(performance_path)
+        write_progress.advance("Wrote " + output_path)
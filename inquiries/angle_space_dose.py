@@ -1,49 +1,136 @@
-from srqi.core import inquiry
+from srqi.core import inquiry, aggregate
+import matplotlib.pyplot as plt
+import numpy as np
 
+PRIMARY_RANGE = (-180, 180) # degrees
+SECONDARY_RANGE = (-90, 90)
+_ANGLE_ATTRIBUTES = ['Positioner_Primary_Angle', 'Positioner_Secondary_Angle', 'Dose_RP']
 
-class Angle_Space_Dose(inquiry.Inquiry):
+
+def get_group(proc, group_by):
+    """Return the name of the group a procedure goes in
+
+    Parameters:
+        proc : an srdata.Procedure
+        group_by : one of the options of Angle_Space_Dose.GROUP_BY
+    """
+    if group_by == 'Room':
+        return proc.get_device_label()
+    elif group_by in ('Physician', 'CPT'):
+        if not proc.has_syngo():
+            return "Unknown " + group_by
+        elif group_by == 'Physician':
+            return proc.get_syngo().rad1
+        return proc.get_syngo().get_cpts_as_string()
+    return "All Procedures"
+
+
+class Angle_Space_Dose(inquiry.Streaming_Inquiry):
     DATE_RANGE_START = inquiry.get_standard_parameter("DATE_RANGE_START")
     DATE_RANGE_END = inquiry.get_standard_parameter("DATE_RANGE_END")
+    BIN_SIZE = inquiry.Inquiry_Parameter(5, "Degrees per Bin")
+    GROUP_BY = inquiry.Options_Parameter(['None', 'Room', 'Physician', 'CPT'],
+                                         "Group Procedures By")
+    PLOT_PROCEDURES = inquiry.Inquiry_Parameter(False, "Plot each procedure?")
+
+    description = """Map where in angle space the dose of procedures is given.
+
+    Adds up the Dose_RP of every irradiation event in bins of its
+    positioner primary and secondary angles, for all of the procedures
+    together or separately for each room, attending physician or set of
+    CPT codes. Angles outside of -180 to 180 (primary) or -90 to 90
+    (secondary) degrees are counted in the bins at the edge.
+
+    Data Required:
+        DICOM-SR .xml files
+        Syngo files (to group by physician or CPT)
+
+    Parameters:
+        Degrees per bin
+        Group procedures by
+        Plot each procedure - also make a figure for every procedure
+    """
+
+    def begin(self):
+        self.primary_edges = aggregate.get_bin_edges(PRIMARY_RANGE[0], PRIMARY_RANGE[1],
+                                                     self.BIN_SIZE.value).tolist()
+        self.secondary_edges = aggregate.get_bin_edges(SECONDARY_RANGE[0], SECONDARY_RANGE[1],
+                                                       self.BIN_SIZE.value).tolist()
+        self._grids = {} # group -> float array [primary bin][secondary bin]
+        self._counts = {} # group -> number of procedures
+        self._procedure_grids = [] # (label, grid) if PLOT_PROCEDURES
+
+    def _get_grids(self, columns, group_ids, num_groups):
+        return aggregate.grid_sums(group_ids,
+                                   columns['Positioner_Primary_Angle'],
+                                   columns['Positioner_Secondary_Angle'],
+                                   columns['Dose_RP'],
+                                   self.primary_edges, self.secondary_edges,
+                                   num_groups)
+
+    def consume(self, sr_procs, extra_procs = ()):
+        sr_procs = [p for p in sr_procs if len(p.get_events()) > 0]
+        if not sr_procs:
+            return
+        groups, proc_group_ids = np.unique([get_group(p, self.GROUP_BY.value) for p in sr_procs],
+                                           return_inverse = True)
+        columns = aggregate.get_event_columns(sr_procs, _ANGLE_ATTRIBUTES)
+        grids = self._get_grids(columns, proc_group_ids[columns['procedure']], len(groups))
+        num_procs = np.bincount(proc_group_ids, minlength = len(groups))
+        for group, grid, n in zip(groups.tolist(), grids, num_procs):
+            self._add(group, grid, int(n))
+        if self.PLOT_PROCEDURES.value:
+            grids = self._get_grids(columns, columns['procedure'], len(sr_procs))
+            for proc, grid in zip(sr_procs, grids):
+                label = "Procedure " + str(proc.SeriesInstanceUID) + " on " + str(proc.StudyDate)
+                self._procedure_grids.append((label, grid))
+
+    def _add(self, group, grid, num_procs):
+        if group in self._grids:
+            self._grids[group] = self._grids[group] + grid
+        else:
+            self._grids[group] = grid
+        self._counts[group] = self._counts.get(group, 0) + num_procs
+
+    def merge(self, other):
+        for group, grid in other._grids.iteritems():
+            self._add(group, grid, other._counts[group])
+        self._procedure_grids += other._procedure_grids
+        return self
+
+    def finish(self):
+        self.groups = sorted(self._grids.keys())
+        self.procedure_counts = dict(self._counts)
 
-    def run(self, sr_procs, context, extra_procs):
-        out = [] #out[proc #][event #][0 or 1, primary or secondary angle]
-        print self.DATE_RANGE_START.value
-        print self.DATE_RANGE_END.value
-        print sr_procs
-        prim_angles = []
-        second_angles = []
-        for p in sr_procs:
-            if len(p.get_events())>0:
-                p_events = [(e.Positioner_Primary_Angle,
-                             e.Positioner_Secondary_Angle, e.Dose_RP) for e in p.get_events()]
-                out.append(p_events)
-                print "yay!"
-                prim_angles = prim_angles + [t[0] for t in p_events]
-                second_angles = second_angles + [t[1] for t in p_events]
-        print "Max prim " + str(max(prim_angles))
-        print "Min prim " + str(min(prim_angles))
-        print "Max second " + str(max(second_angles))
-        print "Min second " + str(min(second_angles))
-        self.data = out
+    def get_tables(self):
+        heading = ["Group", "Number of Procedures", "Total Dose RP (Gy)",
+                   "Primary Angle of Most Dose", "Secondary Angle of Most Dose"]
+        out = [heading]
+        for group in self.groups:
+            grid = self._grids[group]
+            i, j = np.unravel_index(grid.argmax(), grid.shape)
+            out.append([group, self._counts[group], grid.sum(),
+                        (self.primary_edges[i] + self.primary_edges[i+1])/2.0,
+                        (self.secondary_edges[j] + self.secondary_edges[j+1])/2.0])
+        return [out]
 
     def get_figures(self):
-        import matplotlib.pyplot as plt
-        import numpy as np
         figs = []
-        for i,p_events in enumerate(self.data):
-            xs,ys, weights = zip(*p_events)
-            #copied almost verbatem from http://docs.scipy.org/doc/numpy/reference/generated/numpy.histogram2d.html
-            H, xedges ,yedges = np.histogram2d(xs,ys, weights = weights)
-            extent = [yedges[0], yedges[-1], xedges[-1],xedges[0]]
-            fig = plt.figure()
-            plt.imshow(H, extent=extent, aspect='auto', interpolation='nearest')
-            cb = plt.colorbar()
-            cb.set_label("Dose RP (Gy)")
-            plt.title("Procedure #" + str(i) + " starting on "+ str(self.DATE_RANGE_START.value))
-            plt.xlabel("Primary Angle")
-            plt.ylabel("Secondary Angle")
-            figs.append(fig)
+        for group in self.groups:
+            figs.append(self._get_figure(self._grids[group], group))
+        for label, grid in self._procedure_grids:
+            figs.append(self._get_figure(grid, label))
         return figs
-            
-            
 
+    def _get_figure(self, grid, title):
+        extent = [self.primary_edges[0], self.primary_edges[-1],
+                  self.secondary_edges[0], self.secondary_edges[-1]]
+        fig = plt.figure()
+        plt.imshow(grid.transpose(), extent = extent, origin = 'lower',
+                   aspect = 'auto', interpolation = 'nearest')
+        cb = plt.colorbar()
+        cb.set_label("Dose RP (Gy)")
+        plt.title(title)
+        plt.xlabel("Primary Angle")
+        plt.ylabel("Secondary Angle")
+        return fig
@@ -2,8 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 from srqi.core import inquiry
-from srqi.core import my_utils
-import datetime
+from srqi.core import my_utils, products, periods, aggregate, plotting
 
 
 class Average_Fps(inquiry.Inquiry):
@@ -26,32 +25,33 @@ recorded.")
 
     """
 
+    @classmethod
+    def get_required_products(cls):
+        return [products.Product_Request('fluoro_events')]
+
     def run(self, procs, context, extra_procs):
-        events = [p.get_fluoro_events() for p in procs] 
-        events = sum(events, []) #flatten from list of lists into single list of events
+        events = self.get_product('fluoro_events')
         first_time = min(events, key = lambda e: e.DateTime_Started).DateTime_Started
         last_time = max(events, key = lambda e: e.DateTime_Started).get_end_time()
-        events_by_date = my_utils.organize(events, lambda e:e.DateTime_Started.date())
-        current = first_time.date()
+        event_periods = periods.periodize([e.DateTime_Started.date() for e in events],
+                                          'days', self.DAYS_PER_PERIOD.value,
+                                          last = last_time.date())
+        num_periods = len(event_periods)
+        pulses = np.array([e.Number_of_Pulses for e in events], dtype = float)
+        rates = np.array([e.Pulse_Rate for e in events], dtype = float)
+        period_averages, durations = aggregate.average_fps(event_periods.period_ids,
+                                                           pulses, rates, num_periods)
+        sums = aggregate.grouped_sums(event_periods.period_ids, [None, pulses],
+                                      num_groups = num_periods)[:, 0, :]
+        counts = [int(n) for n in sums[:, 0]]
+        frame_counts = sums[:, 1].tolist()
         averages =[]
-        counts = []
-        frame_counts = []
-        start_dates = [current]
-        while current <= last_time.date():
-            es = []
-            period_end = current + datetime.timedelta(days=self.DAYS_PER_PERIOD.value)
-            while current < period_end:
-                if current in events_by_date:
-                    es = es + events_by_date[current]
-                current = current + datetime.timedelta(days=1)
-            start_dates.append(current)
-            counts.append(len(es))
-            frame_counts.append(sum([e.Number_of_Pulses for e in es]))
-            if len(es) > 0:
-                averages.append(my_utils.average_fps(es))
+        for count, average in zip(counts, period_averages.tolist()):
+            if count > 0:
+                averages.append(average)
             else:
                 averages.append(averages[-1])
-        start_dates = start_dates[:-1]
+        start_dates = event_periods.starts
         self.start_dates = start_dates
         self.averages = averages
         self.counts = counts
@@ -69,7 +69,7 @@ recorded.")
 
     def get_figures(self):
         fig = plt.figure()
-        plt.scatter(range(len(self.averages)), self.averages, s= self.counts)
+        plotting.scatter(range(len(self.averages)), self.averages, s= self.counts)
         plt.axis([0,len(self.counts)-1,5,16])
         axes = plt.gca()
         xtick_labels = []
@@ -1,6 +1,6 @@
 from srqi.core import inquiry
 from srqi.core.Parse_Syngo import Syngo
-from srqi.core import my_utils
+from srqi.core import my_utils, table_output
 from os import path
 
 class Combine_Sr_Syngo(inquiry.Inquiry):
@@ -26,7 +26,14 @@ class Combine_Sr_Syngo(inquiry.Inquiry):
         headings += ["SeriesInstanceUID","Total Dose (Gy)(SR)", "Total DAP (Gym2)(SR)", "Pedal Time (s)(SR)",
                      "Fluoro Dose (Gy)(SR)", "Fluoro DAP (Gym2)(SR)", "Fluoro Exposure Time (ms)"]
         headings += ["CPTs"]
-        table = [headings]
+        # one row per procedure, so the rows are only made as they are
+        # written out. The report reads them back from output.csv rather
+        # than making them again.
+        csv_path = path.join(my_utils.get_output_directory(), "output.csv")
+        table_output.write_csv(table_output.Streamed_Table(self._get_rows, headings), csv_path)
+        return [table_output.Csv_Table(csv_path)]
+
+    def _get_rows(self):
         for sr_proc in self.sr_procs:
             if not sr_proc.has_syngo():
                 continue
@@ -47,15 +54,13 @@ class Combine_Sr_Syngo(inquiry.Inquiry):
                     total_fluoro_dose, total_fluoro_DAP, total_fluoro_time]
             #tack the CPTs from the Syngo data on to the end
             row += [syngo.get_cpts_as_string()]
-            table.append(row)
+            yield row
         for syngo in self.extra_syngo:
             row = []
             row += syngo.get_data_list()[:-1]
             row += ['']*7
             row += [syngo.get_cpts_as_string()]
-            table.append(row)
-        my_utils.write_csv(table, path.join(my_utils.get_output_directory(), "output.csv"))
-        return [table]
+            yield row
         
 
         
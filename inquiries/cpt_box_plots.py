@@ -1,4 +1,4 @@
-from srqi.core import inquiry, Parse_Syngo, my_utils
+from srqi.core import inquiry, products, sketches
 import matplotlib.pyplot as plt
 import heapq
 import math
@@ -13,15 +13,28 @@ class Cpt_Box_Plots(inquiry.Inquiry):
     """
     USE_LOG = inquiry.Inquiry_Parameter(True, "Plot log of fluoro times?",
                                         "Fluoro times tend to be lognormally distributed. Procedures with 0 fluoro time will be ignored.")
+    USE_SKETCHES = inquiry.Inquiry_Parameter(False, "Approximate box plots",
+                                             "Compute the box plots from a fixed-size sketch of each procedure type's fluoro times rather than sorting all of them. The table then lists percentiles instead of every fluoro time.")
+    # listed in the table when USE_SKETCHES is set. a literal, so the
+    # inquiry registry can read the class without importing the module
+    PERCENTILES = (0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50,
+                   55, 60, 65, 70, 75, 80, 85, 90, 95, 100)
+
+    @classmethod
+    def get_required_products(cls):
+        if cls.USE_SKETCHES.value:
+            return [products.Product_Request('syngo_fluoro_sketches',
+                                             log = cls.USE_LOG.value)]
+        return [products.Product_Request('syngo_with_fluoro_by_cpt')]
+
     def run(self, procs, context, extra_procs):
-        #extract all syngo procs with fluoro values recorded
-        syngo_procs = [p for p in extra_procs if type(p) == Parse_Syngo.Syngo]
-        for proc in procs:
-            if proc.has_syngo():
-                syngo_procs.append(proc.get_syngo())
-        syngo_procs = [p for p in syngo_procs if not p.fluoro is None]
+        if self.USE_SKETCHES.value:
+            self._run_sketches()
+            return
+        self.sketches = None
+        #all syngo procs with fluoro values recorded, by cpt code combination
+        cpts_to_procs = self.get_product('syngo_with_fluoro_by_cpt')
         #get the fluoro times of the 5 most common cpt code combos
-        cpts_to_procs = my_utils.organize(syngo_procs, lambda x: x.get_cpts_as_string())
         common_cpts = heapq.nlargest(self.NUM_PROCEDURE_TYPES.value,
                        cpts_to_procs.keys(),
                        key = lambda k: len(cpts_to_procs[k]))
@@ -39,16 +52,48 @@ class Cpt_Box_Plots(inquiry.Inquiry):
                 cpts_to_fluoros[cpt] = log_fluoros
         self.lookup = cpts_to_fluoros
 
+    def _run_sketches(self):
+        # procedures with 0 fluoro time are left out when USE_LOG is set
+        fluoro_sketches = self.get_product('syngo_fluoro_sketches',
+                                           log = self.USE_LOG.value)
+        common_cpts = heapq.nlargest(self.NUM_PROCEDURE_TYPES.value,
+                                     fluoro_sketches.keys(),
+                                     key = lambda k: fluoro_sketches[k].get_count())
+        self.sketches = dict([(cpt, fluoro_sketches[cpt]) for cpt in common_cpts])
+        self.lookup = self.sketches
+
+    def _get_box_stats(self):
+        """Statistics for Axes.bxp estimated from self.sketches. Outliers
+        aren't known, so the whiskers end at the furthest value within
+        1.5 IQR or at the min/max.
+        """
+        stats = []
+        for cpt, sketch in self.sketches.iteritems():
+            q1, med, q3 = sketch.quantiles.quantiles([.25, .5, .75])
+            iqr = q3 - q1
+            stats.append({'label' : cpt,
+                          'med' : med, 'q1' : q1, 'q3' : q3,
+                          'whislo' : max(sketch.quantiles.min, q1 - 1.5*iqr),
+                          'whishi' : min(sketch.quantiles.max, q3 + 1.5*iqr),
+                          'fliers' : []})
+        return stats
+
     def get_figures(self):
         fig = plt.figure()
         plt.title("Fluoro Times for Most Common Procedures at BJH")
         plt.xlabel("Procedure CPT codes")
         plt.ylabel("Fluoro time (seconds)")
-        widths = [len(v) for v in self.lookup.values()]
+        if self.sketches is None:
+            widths = [len(v) for v in self.lookup.values()]
+        else:
+            widths = [sketch.get_count() for sketch in self.lookup.values()]
         average_width = sum(widths)/len(widths)
         widths = [float(x)/average_width *.5 for x in widths]
-        plt.boxplot(self.lookup.values(),
-                     widths = widths)
+        if self.sketches is None:
+            plt.boxplot(self.lookup.values(),
+                         widths = widths)
+        else:
+            plt.gca().bxp(self._get_box_stats(), widths = widths)
         labels = self.lookup.keys()
         for cpt in labels:
             cpt.replace(',','\n')
@@ -58,6 +103,13 @@ class Cpt_Box_Plots(inquiry.Inquiry):
 
 
     def get_tables(self):
+        if not self.sketches is None:
+            out = [["CPT Codes", "Number of Procedures"] +
+                   [str(p) + '%' for p in self.PERCENTILES]]
+            for cpt, sketch in self.sketches.iteritems():
+                percentiles = sketch.quantiles.quantiles([p/100.0 for p in self.PERCENTILES])
+                out.append([cpt, sketch.get_count()] + list(percentiles))
+            return [out]
         out = []
         for cpt, f_list in self.lookup.iteritems():
             out.append([cpt] + sorted(f_list))
@@ -1,4 +1,4 @@
-from srqi.core import inquiry
+from srqi.core import inquiry, plotting
 import datetime
 
 #The name of the class must be the same as the file name, except
@@ -43,7 +43,7 @@ class Frame_Count(inquiry.Inquiry): #all inquiries inherit from inquiry.Inquiry
         # saved and rendered
         import matplotlib.pyplot as plt
         fig = plt.figure()
-        plt.scatter(self.start_times, self.frame_counts)
+        plotting.scatter(self.start_times, self.frame_counts)
         plt.title("Frame counts over time.")
         plt.xlabel("Start Time of Procedure")
         plt.ylabel("Number of Frames")
@@ -1,159 +1,282 @@
-from srqi.core import inquiry
+from srqi.core import inquiry, aggregate
 import matplotlib.pyplot as plt
 import numpy as np
+import heapq
 
-def get_accumulation_fig(proc):
+
+class High_Case(object):
+    """What High_Cases keeps about one procedure: its dose and frame totals
+    and the event data for its accumulation plot, but not the procedure
+    itself, so that memory doesn't grow with the number of procedures read.
+
+    Attributes:
+        PatientID, StudyDate, SeriesInstanceUID : from the procedure
+        device : the procedure's srdata.Procedure.get_device()
+        totals : dict with keys 'total dose', 'acquisition dose', 'spot dose',
+            'fluoro dose', 'total frames', 'acquisition frames', 'spot frames'
+            and 'fluoro frames'
+        event_starts : list of the DateTime_Started of each event
+        doses, frames, ii_diameters : arrays of each event's Dose_RP,
+            Number_of_Pulses and iiDiameter
+        is_acquisition, is_spot, is_fluoro : bool arrays of whether each
+            event is a Stationary Acquisition, Spot or Fluoroscopy event
+    """
+    def __init__(self, proc, totals):
+        self.PatientID = proc.PatientID
+        self.StudyDate = proc.StudyDate
+        self.SeriesInstanceUID = proc.SeriesInstanceUID
+        self.device = proc.get_device()
+        self.totals = totals
+        events = proc.get_events()
+        self.event_starts = [e.DateTime_Started for e in events]
+        self.doses = np.array([e.Dose_RP for e in events])
+        self.frames = np.array([e.Number_of_Pulses for e in events])
+        self.ii_diameters = np.array([e.iiDiameter for e in events])
+        self.is_acquisition = np.array([e.Irradiation_Event_Type == 'Stationary Acquisition' for e in events], dtype = bool)
+        self.is_spot = np.array([e.Acquisition_Protocol == 'Spot' for e in events], dtype = bool)
+        self.is_fluoro = np.array([e.Irradiation_Event_Type == 'Fluoroscopy' for e in events], dtype = bool)
+
+    def get_label(self):
+        return "Patient " + str(self.PatientID) + " on " + str(self.StudyDate)
+
+    def get_crossing(self, limit):
+        """Return the index of the event during which the cumulative dose
+        went over limit, or None if it never did
+        """
+        over = np.nonzero(np.cumsum(self.doses) > limit)[0]
+        if len(over) == 0:
+            return None
+        return int(over[0])
+
+
+class Dose_Alert(object):
+    """Passed to the alert handlers when a procedure's cumulative dose goes
+    over High_Cases.LIMIT
+
+    Attributes:
+        case : the High_Case
+        limit : the dose limit
+        time : DateTime_Started of the event during which the limit was
+            crossed
+        dose : the cumulative dose at the end of that event
+    """
+    def __init__(self, case, limit):
+        index = case.get_crossing(limit)
+        self.case = case
+        self.limit = limit
+        self.time = case.event_starts[index]
+        self.dose = float(np.sum(case.doses[:index+1]))
+
+    def __str__(self):
+        return (self.case.get_label() + ": cumulative dose " + str(self.dose) +
+                " Gy passed the limit of " + str(self.limit) + " Gy at " + str(self.time))
+
+_alert_handlers = []
+
+def add_alert_handler(handler):
+    """Call handler(Dose_Alert) whenever High_Cases finds a procedure over
+    its limit. Handlers are called while the procedures are consumed, in
+    the process consuming them, so when running over files in worker
+    processes (streaming.run_streaming_files) they are called in the
+    workers.
+    """
+    _alert_handlers.append(handler)
+
+def remove_alert_handler(handler):
+    _alert_handlers.remove(handler)
+
+
+def get_accumulation_fig(case):
     fig = plt.figure()
-    plt.title("Accumulation During Procedure for Patient " + str(proc.PatientID) + " on " + str(proc.StudyDate))
-    event_starts = [e.DateTime_Started for e in proc.get_events()]   
+    plt.title("Accumulation During Procedure for " + case.get_label())
+    event_starts = case.event_starts
     # plot doses
     dose_ax = plt.subplot(311)
     dose_ax.plot(event_starts,
-                 np.cumsum([e.Dose_RP for e in proc.get_events()])
+                 np.cumsum(case.doses)
                  )
     plt.ylabel('Dose (Gy)')
     # plot frames
     frames_ax = plt.subplot(312, sharex = dose_ax)
     frames_ax.plot(event_starts,
-                   np.cumsum([e.Number_of_Pulses for e in proc.get_events()])
+                   np.cumsum(case.frames)
                    )
     plt.ylabel('# of Frames')
     # plot mag
     mag_ax = plt.subplot(313, sharex = dose_ax)
     mag_ax.plot(event_starts,
-                [e.iiDiameter for e in proc.get_events()])
+                case.ii_diameters)
     plt.ylim((200,500))
     plt.ylabel('iiDiameter')
     # plot the event type on top of the mag plot
-    a_events = [e for e in proc.get_events() if e.Irradiation_Event_Type =='Stationary Acquisition']
-    s_events= [e for e in proc.get_events() if e.Acquisition_Protocol=='Spot']
-    f_events = [e for e in proc.get_fluoro_events()]
-    o_events = [e for e in proc.get_events() if not (e.Irradiation_Event_Type=="Stationary Acquisition" or e.Acquisition_Protocol=="Spot" or e.Irradiation_Event_Type=="Fluoroscopy")]
-    if len(f_events)>0:
-        plt.scatter([e.DateTime_Started for e in f_events],
-                    [e.iiDiameter for e in f_events],
-                    marker='+', c='blue')
-    if len(a_events)>0:
-        collection = plt.scatter([e.DateTime_Started for e in a_events],
-                    [e.iiDiameter for e in a_events],
-                    marker='o', c='red')
-        collection.set_edgecolor('red')
-    if len(s_events)>0:
-        collection = plt.scatter([e.DateTime_Started for e in s_events],
-                    [e.iiDiameter for e in s_events],
-                    marker='o', c='yellow')
-        collection.set_edgecolor('yellow')
-    if len(o_events)>0:
-        collection = plt.scatter([e.DateTime_Started for e in o_events],
-                    [e.iiDiameter for e in o_events],
-                    marker='o', c='cyan')
-        collection.set_edgecolor('cyan')
+    others = ~(case.is_acquisition | case.is_spot | case.is_fluoro)
+    for mask, marker, color in ((case.is_fluoro, '+', 'blue'),
+                                (case.is_acquisition, 'o', 'red'),
+                                (case.is_spot, 'o', 'yellow'),
+                                (others, 'o', 'cyan')):
+        if mask.any():
+            collection = plt.scatter([t for t, m in zip(event_starts, mask) if m],
+                                     case.ii_diameters[mask],
+                                     marker=marker, c=color)
+            if not marker == '+':
+                collection.set_edgecolor(color)
     # format xlabels
     fig.autofmt_xdate()
     return fig
 
 
-class High_Cases(inquiry.Inquiry):
+class High_Cases(inquiry.Streaming_Inquiry):
     NAME = "High Cases"
     description = """Finds and analyzes cases where the dose exceeds a specified limit 
 
+    Every case over the limit is listed. Only the cases with the highest
+    doses, up to the maximum number of cases, are analyzed in detail.
+
     Data required:
         DICOM-SR xml
     """
     LIMIT = inquiry.Inquiry_Parameter(5.0,"Dose Limit", "The doseage above-which cases should be analyzed")
+    MAX_CASES = inquiry.Inquiry_Parameter(20, "Maximum Number of Cases", "The number of highest dose cases analyzed in detail")
     DATE_RANGE_START = inquiry.get_standard_parameter("DATE_RANGE_START")
     DATE_RANGE_END = inquiry.get_standard_parameter("DATE_RANGE_END")
 
+    # (key in High_Case.totals, value, which events)
+    _TOTALS = (('total dose', 'Dose_RP', None),
+               ('acquisition dose', 'Dose_RP', 'acquisition'),
+               ('spot dose', 'Dose_RP', 'spot'),
+               ('fluoro dose', 'Dose_RP', 'fluoro'),
+               ('total frames', 'Number_of_Pulses', None),
+               ('acquisition frames', 'Number_of_Pulses', 'acquisition'),
+               ('spot frames', 'Number_of_Pulses', 'spot'),
+               ('fluoro frames', 'Number_of_Pulses', 'fluoro'))
+
+    def begin(self):
+        self._top = [] # min-heap of (total dose, SeriesInstanceUID, High_Case)
+        self._hits = [] # (total dose, SeriesInstanceUID, summary row) of every case over the limit
+
+    def _push(self, entry):
+        if len(self._top) < self.MAX_CASES.value:
+            heapq.heappush(self._top, entry)
+        elif self._top and entry > self._top[0]:
+            heapq.heapreplace(self._top, entry)
+
+    def consume(self, procs, extra_procs = ()):
+        columns = aggregate.get_event_columns(procs, ['Dose_RP', 'Number_of_Pulses', 'Acquisition_Protocol'])
+        masks = {'acquisition' : columns['Irradiation_Event_Type'] == 'Stationary Acquisition',
+                 'spot' : columns['Acquisition_Protocol'] == 'Spot',
+                 'fluoro' : columns['Irradiation_Event_Type'] == 'Fluoroscopy'}
+        values = []
+        for key, attribute, events in self._TOTALS:
+            if events is None:
+                values.append(columns[attribute])
+            else:
+                values.append(columns[attribute]*masks[events])
+        sums = aggregate.grouped_sums(columns['procedure'], values,
+                                      num_groups = len(procs))[:, 0, :]
+        limit = self.LIMIT.value
+        for proc, proc_sums in zip(procs, sums.tolist()):
+            total_dose = proc_sums[0]
+            over = total_dose > limit
+            if not over and len(self._top) >= self.MAX_CASES.value and \
+                 (not self._top or total_dose <= self._top[0][0]):
+                continue
+            totals = dict([(key, value) for (key, a, e), value in zip(self._TOTALS, proc_sums)])
+            case = High_Case(proc, totals)
+            if over:
+                alert = Dose_Alert(case, limit)
+                self._hits.append((total_dose, case.SeriesInstanceUID,
+                                   [case.PatientID, case.StudyDate, case.device, total_dose,
+                                    totals['total frames'], alert.time]))
+                for handler in _alert_handlers:
+                    handler(alert)
+            self._push((total_dose, case.SeriesInstanceUID, case))
+
+    def merge(self, other):
+        for entry in other._top:
+            self._push(entry)
+        self._hits += other._hits
+        return self
+
+    def finish(self):
+        self.cases = [entry[2] for entry in sorted(self._top, reverse = True)] # highest dose first
+        self.high_cases = [c for c in self.cases if c.totals['total dose'] > self.LIMIT.value]
+        self.over_limit = [entry[2] for entry in sorted(self._hits, reverse = True)]
+        self.num_over_limit = len(self.over_limit)
 
-    def run(self, procs, context, extra_procs):
-            high_cases = {}
-            for proc in procs:
-                total_dose = sum([e.Dose_RP for e in proc.get_events()])
-                if  total_dose > self.LIMIT.value:
-                    high_cases[proc] = {'total dose' : total_dose}
-
-            for proc in high_cases.keys():
-                high_cases[proc]['acquisition dose'] = sum([e.Dose_RP for e in proc.get_events() if e.Irradiation_Event_Type =='Stationary Acquisition'])
-                high_cases[proc]['spot dose'] = sum([e.Dose_RP for e in proc.get_events() if e.Acquisition_Protocol=='Spot'])
-                high_cases[proc]['fluoro dose'] = sum([e.Dose_RP for e in proc.get_fluoro_events()])
-                high_cases[proc]['acquisition frames'] = sum([e.Number_of_Pulses for e in proc.get_events() if e.Irradiation_Event_Type =='Stationary Acquisition'])
-                high_cases[proc]['spot frames'] = sum([e.Number_of_Pulses for e in proc.get_events() if e.Acquisition_Protocol=='Spot'])
-                high_cases[proc]['fluoro frames'] = sum([e.Number_of_Pulses for e in proc.get_fluoro_events()])
-                high_cases[proc]['total frames'] = sum([e.Number_of_Pulses for e in proc.get_events()])
-            self.high_cases = high_cases
-
-            
     def get_text(self):
-        if len(self.high_cases) == 0:
+        if self.num_over_limit == 0:
             return "No cases exceeding the dose limit found in the specified date range."
+        elif self.num_over_limit > len(self.high_cases):
+            return ("Found " + str(self.num_over_limit) + " cases exceeding the dose limit. " +
+                    "All of them are listed in the last table, but only the " +
+                    str(len(self.high_cases)) + " with the highest dose are analyzed in detail.")
         else:
             return ''
 
     def get_figures(self):
-        hc = self.high_cases
         figs = []
 
         pies = []
-        for proc in hc.keys():
+        for case in self.high_cases:
+            hc = case.totals
             # Pie chart of dosages by modality
             fig = plt.figure()
-            plt.title("Dose (Gy) By Modality Patient " + str(proc.PatientID) + " on " + str(proc.StudyDate))
+            plt.title("Dose (Gy) By Modality " + case.get_label())
             def my_autopct(pct):
-                total=hc[proc]['total dose']
+                total=hc['total dose']
                 val=pct*total/100.0
                 return '{p:.2f}%  ({v:.3f} Gy)'.format(p=pct,v=val)
-            other_dose = hc[proc]['total dose'] - hc[proc]['spot dose'] - hc[proc]['acquisition dose'] - hc[proc]['fluoro dose']
+            other_dose = hc['total dose'] - hc['spot dose'] - hc['acquisition dose'] - hc['fluoro dose']
             if other_dose <0:
                 other_dose = 0
-            plt.pie((hc[proc]['acquisition dose'],
-                     hc[proc]['spot dose'],
-                     hc[proc]['fluoro dose'],
+            plt.pie((hc['acquisition dose'],
+                     hc['spot dose'],
+                     hc['fluoro dose'],
                      other_dose),
                     labels = ('acquisition','spot','fluoro ', 'other'),
                     autopct = my_autopct)
             figs.append(fig)
             # Pie chart of frame counts by modality
             fig = plt.figure()
-            plt.title("Frame Count by Modality for Patient " + str(proc.PatientID) + " on " + str(proc.StudyDate))
+            plt.title("Frame Count by Modality for " + case.get_label())
             def my_autopct(pct):
-                total=hc[proc]['total frames']
+                total=hc['total frames']
                 val=pct*total/100.0
                 return '{p:.2f}%  ({v:.0f})'.format(p=pct,v=val)
-            other_frames = hc[proc]['total frames'] - (hc[proc]['spot frames'] + hc[proc]['acquisition frames'] + hc[proc]['fluoro frames'])
+            other_frames = hc['total frames'] - (hc['spot frames'] + hc['acquisition frames'] + hc['fluoro frames'])
             if other_frames < 0:
                 other_frames = 0
-            plt.pie((hc[proc]['acquisition frames'],
-                     hc[proc]['spot frames'],
-                     hc[proc]['fluoro frames'],
+            plt.pie((hc['acquisition frames'],
+                     hc['spot frames'],
+                     hc['fluoro frames'],
                      other_frames),
                     labels = ('acquisition','spot','fluoro', 'other'),
                     autopct = my_autopct)
             figs.append(fig)
             # dose/frame accumulation plot
-            figs.append(get_accumulation_fig(proc))
+            figs.append(get_accumulation_fig(case))
         return figs
         
                 
     def get_tables(self):
         out = []
-        hc = self.high_cases
-        for proc in self.high_cases.keys():
-            heading = ["Patient " + str(proc.PatientID) + " on " + str(proc.StudyDate),
+        for case in self.high_cases:
+            hc = case.totals
+            heading = [case.get_label(),
                        'fluoro','acqusition','spot', 'other','total']
-            doses = ['Dose (Gy)', hc[proc]['fluoro dose'],
-                     hc[proc]['acquisition dose'],
-                     hc[proc]['spot dose'],
-                     hc[proc]['total dose'] - hc[proc]['acquisition dose'] - hc[proc]['spot dose'] - hc[proc]['fluoro dose'],
-                     hc[proc]['total dose']]
-            frames = ['Frame Count', hc[proc]['fluoro frames'],
-                      hc[proc]['acquisition frames'],
-                      hc[proc]['spot frames'],
-                      hc[proc]['total frames'] - hc[proc]['spot frames'] - hc[proc]['acquisition frames'] - hc[proc]['fluoro frames'],
-                      hc[proc]['total frames']
+            doses = ['Dose (Gy)', hc['fluoro dose'],
+                     hc['acquisition dose'],
+                     hc['spot dose'],
+                     hc['total dose'] - hc['acquisition dose'] - hc['spot dose'] - hc['fluoro dose'],
+                     hc['total dose']]
+            frames = ['Frame Count', hc['fluoro frames'],
+                      hc['acquisition frames'],
+                      hc['spot frames'],
+                      hc['total frames'] - hc['spot frames'] - hc['acquisition frames'] - hc['fluoro frames'],
+                      hc['total frames']
                       ]
             out.append([heading, doses, frames])
+        if self.over_limit:
+            out.append([["Patient", "Study Date", "Machine", "Total Dose (Gy)", "Total Frames", "Time Limit Exceeded"]] +
+                       self.over_limit)
         return out
-        
-
-            
-    
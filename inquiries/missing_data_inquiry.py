@@ -1,10 +1,11 @@
-from srqi.core import inquiry, my_utils
+from srqi.core import inquiry, my_utils, daily_volume, plotting, srdata
 import datetime
+import numpy as np
 import matplotlib.pyplot as plt
 
 
 
-class Missing_Data_Inquiry(inquiry.Inquiry):
+class Missing_Data_Inquiry(inquiry.Streaming_Inquiry):
 
     description = """Plot to look for days from which you might be missing data
 
@@ -13,49 +14,120 @@ class Missing_Data_Inquiry(inquiry.Inquiry):
     A sudden decline in the number of procedures over a period of a few days
     may suggest that you are missing SR data for those days.
 
+    Each machine (told apart by its Device_Observer_UID) is also checked
+    on its own. A day is flagged as a possible gap if the machine has at
+    most Gap Threshold percent of the procedures it usually has on that
+    weekday, where usually is the median of the same weekday over the
+    previous Weeks in Baseline weeks. Days when the machine usually has
+    fewer than five procedures aren't checked, since a day without any is
+    then likely to be chance. Runs of flagged days are listed in a table.
+
     Data Required:
         DICOM-SR xml
 
     Parameters:
         Start Date - exclude any procedures that occured before this date
+        Weeks in Baseline
+        Gap Threshold
 
     """
     NAME = u'Missing Data Inquiry'
     START_DATE = inquiry.Inquiry_Parameter(datetime.date.today()-datetime.timedelta(days=365*2), "Start Date")
+    BASELINE_WEEKS = inquiry.Inquiry_Parameter(4, "Weeks in Baseline")
+    GAP_PERCENT = inquiry.Inquiry_Parameter(25, "Gap Threshold (% of usual procedures)")
+
+    def begin(self):
+        self._daily_counts = {} # device -> daily_volume.Daily_Counts
+        self._device_names = {} # device -> Device_Observer_Name
 
-    def run(self, procs, context, extra_procs):
-        DAYS_PER_PERIOD = 1
+    def consume(self, procs, extra_procs = ()):
         procs = [p for p in procs if p.StudyDate >= self.START_DATE.value]
-        if len(procs) ==0:
+        if not procs:
+            return
+        ordinals = np.array([p.StudyDate.toordinal() for p in procs], dtype = int)
+        device_list, device_ids = srdata.index_devices(procs, self._device_names)
+        first = ordinals.min()
+        counts = daily_volume.daily_counts(ordinals, device_ids, len(device_list),
+                                           first, ordinals.max() - first + 1)
+        for device, device_counts in zip(device_list, counts):
+            if not device in self._daily_counts:
+                self._daily_counts[device] = daily_volume.Daily_Counts()
+            self._daily_counts[device].add_counts(first, device_counts)
+
+    def merge(self, other):
+        for device, daily_counts in other._daily_counts.iteritems():
+            if device in self._daily_counts:
+                self._daily_counts[device].merge(daily_counts)
+            else:
+                self._daily_counts[device] = daily_counts
+            if not device in self._device_names:
+                self._device_names[device] = other._device_names[device]
+        return self
+
+    def finish(self):
+        self.devices = sorted(self._daily_counts.keys())
+        self.gaps = []
+        self._device_table = np.zeros((len(self.devices), 0), dtype = int)
+        self._baseline = np.zeros((len(self.devices), 0))
+        if len(self._daily_counts) ==0:
             self.counts = []
             self.starts = []
             return
-        orgd_procs = my_utils.organize(procs, key = lambda x: x.StudyDate)
-        delta = datetime.timedelta(days = DAYS_PER_PERIOD)
-        start = min(procs, key = lambda p:p.StudyDate).StudyDate
-        last_proc = max(procs, key = lambda p: p.StudyDate)
-        counts = []
-        starts = []
-        one_day = datetime.timedelta(days=1)
-        while start < last_proc.StudyDate:
-            count =0
-            starts.append(start)
-            current = start
-            while current < start + delta:
-                if current in orgd_procs:
-                    count = count + len(orgd_procs[current])
-                current = current + one_day
-            counts.append(count)
-            start = start+delta
-        self.counts = counts
-        self.starts = starts
+        first = min([c.first for c in self._daily_counts.values()])
+        # the last day isn't counted
+        last = max([c.first + len(c.counts) for c in self._daily_counts.values()]) - 1
+        num_days = last - first
+        self.starts = [datetime.date.fromordinal(first + i) for i in range(num_days)]
+        # device_table[device, day]
+        device_table = np.array([self._daily_counts[d].get_counts(first, num_days)
+                                 for d in self.devices], dtype = int)
+        self.counts = [int(c) for c in device_table.sum(axis = 0)]
+        baseline = daily_volume.weekday_baseline(device_table, self.BASELINE_WEEKS.value)
+        gaps = daily_volume.find_gaps(device_table, baseline, self.GAP_PERCENT.value/100.0)
+        for device, start, end in gaps:
+            self.gaps.append((self.devices[device], self.starts[start], self.starts[end],
+                              float(baseline[device, start:end+1].sum()),
+                              int(device_table[device, start:end+1].sum())))
+        self._device_table = device_table
+        self._baseline = baseline
+
+    def get_device_label(self, device):
+        return srdata.get_device_label(device, self._device_names.get(device))
 
     def get_tables(self):
-        return [my_utils.transposed([ ["Period Start Date"] + self.starts, ["Procedure Count"] +self.counts])]
+        out = [my_utils.transposed([ ["Period Start Date"] + self.starts, ["Procedure Count"] +self.counts])]
+        if self.gaps:
+            gap_table = [["Machine", "First Day", "Last Day", "Number of Days",
+                          "Usual Number of Procedures", "Number of Procedures"]]
+            for device, start, end, usual, found in self.gaps:
+                gap_table.append([self.get_device_label(device), start, end,
+                                  (end - start).days + 1, usual, found])
+            out.append(gap_table)
+        return out
 
     def get_figures(self):
         if len(self.counts) <= 0 :
             return []
+        figs = [self._get_figure(self.counts, "Number of Procedure Records Per Day")]
+        if len(self.devices) == 1:
+            self._mark_gaps(0)
+        else:
+            for i, device in enumerate(self.devices):
+                figs.append(self._get_figure(self._device_table[i],
+                                             "Procedure Records Per Day on " + self.get_device_label(device)))
+                self._mark_gaps(i)
+        return figs
+
+    def _mark_gaps(self, i):
+        """Draw the usual number of procedures of self.devices[i] and its
+        gaps on the current figure
+        """
+        plt.plot(self.starts, self._baseline[i], 'g-')
+        for device, start, end, usual, found in self.gaps:
+            if device == self.devices[i]:
+                plt.axvspan(start, end + datetime.timedelta(days = 1), color = 'y', alpha = .5)
+
+    def _get_figure(self, counts, title):
         fig = plt.figure()
         colors = []
         for day in self.starts:
@@ -63,15 +135,18 @@ class Missing_Data_Inquiry(inquiry.Inquiry):
                 colors.append('r')
             else:
                 colors.append('b')
-        plt.scatter(self.starts,self.counts,c=colors)
-        plt.title("Number of Procedure Records Per Day")
+        plotting.scatter(self.starts,counts,c=colors)
+        plt.title(title)
         plt.xlabel("Days (red = weekends)")
         plt.ylabel("Number of Procedures Records")
         fig.autofmt_xdate()
-        return [fig]
+        return fig
 
     def get_text(self):
-        return "Found a total of " + str(sum(self.counts)) + " procedures over " + str(len(self.starts)) +" days."
+        out = "Found a total of " + str(sum(self.counts)) + " procedures over " + str(len(self.starts)) +" days."
+        if self.gaps:
+            out += " Found " + str(len(self.gaps)) + " possible gaps in the data (highlighted in yellow, with the usual number of procedures in green)."
+        return out
                 
 from srqi.gui import report_writer
 from srqi.core import my_utils
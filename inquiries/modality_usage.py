@@ -1,4 +1,6 @@
-from srqi.core import inquiry, my_utils
+from srqi.core import inquiry, aggregate
+import datetime
+import numpy as np
 
 def get_period_sum(period, val_func, event_types = ()):
     """
@@ -21,7 +23,9 @@ def get_period_sum(period, val_func, event_types = ()):
     return total
 
 
-class Modality_Usage(inquiry.Inquiry):
+_EVENT_TYPES = ("Fluoroscopy", "Stationary Acquisition")
+
+class Modality_Usage(inquiry.Streaming_Inquiry):
     name = "Modality Usage"
     description = """Describe amount of usage of different modalities across data set
 
@@ -34,31 +38,67 @@ class Modality_Usage(inquiry.Inquiry):
     """
     PERIOD_LEN = inquiry.get_standard_parameter('PERIOD_LEN')
 
-    def run(self, sr_procs, context, extra_procs):
-        sr_procs, period_starts = my_utils.periodize_by_date(sr_procs,
-                                                      self.PERIOD_LEN.value,
-                                                      date_key = lambda p:p.StudyDate)
-        events_by_period = []
-        for period in sr_procs:
-            period_events = []
-            for proc in period:
-                period_events = period_events + proc.get_events()
-            events_by_period.append(period_events)
-        self.events_by_period = events_by_period
-        self.period_starts = period_starts
-        get_dose = lambda e:e.Dose_RP
-        self.fluoro_doses = [get_period_sum(period,get_dose,"Fluoroscopy") for period in self.events_by_period]
-        self.acquisition_doses = [get_period_sum(period,
-                                            get_dose,"Stationary Acquisition") for period in self.events_by_period]
-        self.total_doses = [get_period_sum(period,get_dose) for period in self.events_by_period]
-        get_frames = lambda e:e.Number_of_Pulses
-        self.fluoro_frames = [get_period_sum(period,get_frames, "Fluoroscopy") for period in self.events_by_period]
-        self.acquisition_frames = [get_period_sum(period, get_frames, "Stationary Acquisition") for period in self.events_by_period]
-        self.total_frames = [get_period_sum(period, get_frames) for period in self.events_by_period]
-        count = lambda e:1
-        self.fluoro_events = [get_period_sum(period, count, "Fluoroscopy") for period in self.events_by_period]
-        self.acquisition_events = [get_period_sum(period, count, "Stationary Acquisition") for period in self.events_by_period]
-        self.total_events = [get_period_sum(period,count) for period in self.events_by_period]
+    def begin(self):
+        # self._daily[date][category, column] where the category is 0 for
+        # all events or 1 + the index in _EVENT_TYPES and the columns are
+        # dose, frames and number of events
+        self._daily = {}
+
+    def consume(self, sr_procs, extra_procs = ()):
+        if not len(sr_procs):
+            return
+        # every procedure's day counts, even if it has no events
+        days, proc_day_ids = np.unique([p.StudyDate for p in sr_procs], return_inverse = True)
+        columns = aggregate.get_event_columns(sr_procs, ['Dose_RP', 'Number_of_Pulses'])
+        sums = aggregate.grouped_sums(proc_day_ids[columns['procedure']],
+                                      [columns['Dose_RP'], columns['Number_of_Pulses'], None],
+                                      columns['Irradiation_Event_Type'],
+                                      _EVENT_TYPES,
+                                      num_groups = len(days))
+        for date, day in zip(days, sums):
+            if date in self._daily:
+                self._daily[date] = self._daily[date] + day
+            else:
+                self._daily[date] = day
+
+    def merge(self, other):
+        for date, day in other._daily.iteritems():
+            if date in self._daily:
+                self._daily[date] = self._daily[date] + day
+            else:
+                self._daily[date] = day
+        return self
+
+    def finish(self):
+        """Sum the daily totals into periods of PERIOD_LEN days
+        starting from the first day with any procedures
+        """
+        period_len = self.PERIOD_LEN.value
+        dates = sorted(self._daily.keys())
+        if dates:
+            first = dates[0]
+            num_periods = (dates[-1] - first).days/period_len + 1
+        else:
+            first = None
+            num_periods = 0
+        self.period_starts = [first + datetime.timedelta(days = i*period_len) for i in range(num_periods)]
+        periods = aggregate.sum_by_group([self._daily[date] for date in dates],
+                                         [(date - first).days/period_len for date in dates],
+                                         num_periods)
+        periods = periods.reshape((num_periods, len(_EVENT_TYPES) + 1, 3))
+        fluoro = 1 + _EVENT_TYPES.index("Fluoroscopy")
+        acquisition = 1 + _EVENT_TYPES.index("Stationary Acquisition")
+        column = lambda category, i: periods[:, category, i].tolist()
+        self.fluoro_doses = column(fluoro, 0)
+        self.acquisition_doses = column(acquisition, 0)
+        self.total_doses = column(0, 0)
+        self.fluoro_frames = column(fluoro, 1)
+        self.acquisition_frames = column(acquisition, 1)
+        self.total_frames = column(0, 1)
+        count = lambda category: [int(n) for n in column(category, 2)]
+        self.fluoro_events = count(fluoro)
+        self.acquisition_events = count(acquisition)
+        self.total_events = count(0)
 
     def get_figures(self):
         import matplotlib.pyplot as plt
@@ -77,7 +117,7 @@ class Modality_Usage(inquiry.Inquiry):
         fig = plt.figure()
         plt.title("Number of Events Per Period")
         plt.bar(self.period_starts,
-                [len(period) for period in self.events_by_period],
+                self.total_events,
                 align = 'center')
         plt.xlabel("Period Start")
         plt.ylabel("Number of Events")
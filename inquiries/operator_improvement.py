@@ -1,7 +1,7 @@
-from srqi.core import inquiry, Parse_Syngo, my_utils
+from srqi.core import inquiry, Parse_Syngo, my_utils, products, sketches
 import matplotlib.pyplot as plt
 import numpy as np
-import collections
+import itertools
 import math
 
 
@@ -65,6 +65,73 @@ def sort_by_rads_helper(procs, procs_per_window):
     return rad1_to_procs
 
 
+@products.register_product('operator_cpt_to_procs', params = ['min_reps'])
+def _operator_cpt_to_procs(procs, extra_procs, min_reps):
+    return get_procedures_helper(procs, extra_procs, min_reps)
+
+@products.register_product('operator_rad1_to_procs',
+                           requires = ['operator_cpt_to_procs'],
+                           params = ['min_reps', 'procs_per_window'])
+def _operator_rad1_to_procs(procs, extra_procs, cpt_to_procs, min_reps, procs_per_window):
+    all_procs = list(itertools.chain.from_iterable(cpt_to_procs.values()))
+    return sort_by_rads_helper(all_procs, procs_per_window)
+
+@products.register_product('operator_cpt_stats',
+                           requires = ['operator_cpt_to_procs'],
+                           params = ['min_reps'])
+def _operator_cpt_stats(procs, extra_procs, cpt_to_procs, min_reps):
+    """Fluoro time statistics for each procedure type
+
+    Returns:
+        a dict mapping 'medians', 'std_devs', 'means', 'log_fluoros',
+            'log_means' and 'log_devs' to dicts mapping cpt code
+            combination strings to the statistic
+    """
+    medians = {}
+    std_devs = {}
+    means = {}
+    log_fluoros = {}
+    log_means  = {}
+    log_devs = {}
+    for cpt, p_list in cpt_to_procs.iteritems():
+        fluoro_list = [p.fluoro for p in p_list]
+        medians[cpt] = float(np.median(fluoro_list))
+        std_devs[cpt] = np.std(fluoro_list)
+        means[cpt] = np.mean(fluoro_list)
+        log_fluoros[cpt] = [math.log(x) if not x ==0 else math.log(.5) for x in fluoro_list]
+        log_means[cpt] = np.mean(log_fluoros[cpt])#default to .5 since that is the lowest number that won't be rounded down to 0
+        log_devs[cpt] = np.std(log_fluoros[cpt])
+    return {'medians' : medians,
+            'std_devs' : std_devs,
+            'means' : means,
+            'log_fluoros' : log_fluoros,
+            'log_means' : log_means,
+            'log_devs' : log_devs}
+
+@products.register_product('operator_cpt_sketch_stats',
+                           requires = ['operator_cpt_to_procs'],
+                           params = ['min_reps'])
+def _operator_cpt_sketch_stats(procs, extra_procs, cpt_to_procs, min_reps):
+    """Same as 'operator_cpt_stats', but computed from a sketch of each
+    procedure type's fluoro times (see core.sketches), so the medians are
+    approximate. 'log_fluoros' is empty.
+    """
+    raw = sketches.Grouped_Sketch()
+    logs = sketches.Grouped_Sketch()
+    for cpt, p_list in cpt_to_procs.iteritems():
+        for p in p_list:
+            raw.add(cpt, p.fluoro)
+            logs.add(cpt, math.log(p.fluoro) if not p.fluoro ==0 else math.log(.5))
+    stats = {'medians' : {}, 'std_devs' : {}, 'means' : {},
+             'log_fluoros' : {}, 'log_means' : {}, 'log_devs' : {}}
+    for cpt, sketch in raw.items():
+        stats['medians'][cpt] = sketch.quantile(.5)
+        stats['std_devs'][cpt] = sketch.moments.get_std()
+        stats['means'][cpt] = sketch.moments.get_mean()
+        stats['log_means'][cpt] = logs[cpt].moments.get_mean()
+        stats['log_devs'][cpt] = logs[cpt].moments.get_std()
+    return stats
+
 def get_procedure_windows(procs, procs_per_window, step_size ):
     """
     Parameters:
@@ -83,6 +150,36 @@ def get_procedure_windows(procs, procs_per_window, step_size ):
             windows.append(window)
     return windows
 
+def get_sorted_windows(values, procs_per_window, step_size):
+    """Same windows as get_procedure_windows, but for an array of values
+    and computed all at once from a strided view of the array
+
+    Arguments:
+        values : 1-D array of values (e.g. fluoro times) in order
+        procs_per_window : an int
+        step_size : number of values between the starts of windows
+
+    Returns:
+        (windows, first) where windows is a 2-D array with one sorted
+            window per row and first is an array of the index in values of
+            the first value of each sorted window (the earliest of the
+            smallest values, as the stable sort in get_procedure_windows
+            would put first)
+    """
+    values = np.ascontiguousarray(values, dtype = float)
+    if len(values) < procs_per_window:
+        return np.empty((0, procs_per_window)), np.empty(0, dtype = int)
+    num_windows = (len(values) - procs_per_window)//step_size + 1
+    stride = values.strides[0]
+    view = np.lib.stride_tricks.as_strided(values,
+                                           shape = (num_windows, procs_per_window),
+                                           strides = (step_size*stride, stride),
+                                           writeable = False)
+    order = np.argsort(view, axis = 1, kind = 'mergesort')
+    windows = np.take_along_axis(view, order, axis = 1)
+    first = order[:, 0] + np.arange(num_windows)*step_size
+    return windows, first
+
 def _get_metric(proc, medians, normalize_penalty, clamp,
                 use_log, log_fluoros, log_means, log_devs):
     fluoro = float(proc.fluoro)
@@ -103,6 +200,73 @@ def _get_metric(proc, medians, normalize_penalty, clamp,
             metric = med#clamp at 2x median value
     return metric
 
+def get_metrics(fluoros, medians, log_means, log_devs,
+                normalize_penalty, clamp, use_log):
+    """Same as _get_metric, but for arrays of procedures at once
+
+    Arguments:
+        fluoros : array of the procedures' fluoro times
+        medians, log_means, log_devs : arrays of the statistics of each
+            procedure's cpt code combination, in the same order as fluoros
+        normalize_penalty, clamp, use_log : bools
+
+    Returns:
+        an array of metrics
+    """
+    fluoros = np.asarray(fluoros, dtype = float)
+    if use_log:
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            metrics = (fluoros - log_means)/log_devs
+        if clamp: # clamp at 2 std devs
+            metrics = np.where(metrics > 2, 2, metrics)
+    else:
+        metrics = fluoros - medians
+        if normalize_penalty:
+            positive = medians > 0
+            metrics = np.where(positive, metrics/np.where(positive, medians, 1), metrics)
+            if clamp:#clamp at 2x median value
+                metrics = np.where(positive & (metrics > 1), 1, metrics)
+        if clamp:
+            metrics = np.where(metrics > medians, medians, metrics)
+    return metrics
+
+def get_window_means(values, dates, group_lengths, window):
+    """Means of sliding windows over consecutive groups of values
+
+    Windows don't cross from one group into the next. A window is only
+    reported where it ends on the last value of a date, so each group has
+    at most one window per date.
+
+    Arguments:
+        values : array of values, groups one after another
+        dates : array of the dates of the values. only compared for
+            equality with neighbours.
+        group_lengths : list of the number of values in each group
+        window : number of values in each window
+
+    Returns:
+        a list with one (indices of the last value of each window,
+            array of window means) pair per group
+    """
+    n = len(values)
+    lengths = np.asarray(group_lengths, dtype = int)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    cum = np.concatenate(([0.], np.cumsum(values)))
+    last_of_date = np.ones(n, dtype = bool)
+    if n > 1:
+        last_of_date[:-1] = dates[:-1] != dates[1:]
+    last_of_date[ends[lengths > 0] - 1] = True
+    position = np.arange(n) - np.repeat(starts, lengths)
+    window_ends = np.nonzero(last_of_date & (position >= window - 1))[0]
+    means = (cum[window_ends + 1] - cum[window_ends + 1 - window])/window
+    bounds = np.searchsorted(window_ends, ends)
+    out = []
+    for i in range(len(lengths)):
+        lo = bounds[i-1] if i > 0 else 0
+        out.append((window_ends[lo:bounds[i]], means[lo:bounds[i]]))
+    return out
+
 class Operator_Improvement(inquiry.Inquiry):
     MIN_REPS = inquiry.Inquiry_Parameter(500, "Minimum procedure count",
                                          "The minimum number of times a procedure with the same CPT codes must occur to be considered to have a reasonable distribution")
@@ -113,28 +277,50 @@ class Operator_Improvement(inquiry.Inquiry):
     NORMALIZE_PENALTY = inquiry.Inquiry_Parameter(True, "Normalize penalties",
                                                   "Divide penalties by the median to account for greater variation in longer procedures.")
     USE_LOG = inquiry.Inquiry_Parameter(True, "Use Lognormal Z-score")
+    USE_SKETCHES = inquiry.Inquiry_Parameter(False, "Approximate medians",
+                                             "Estimate the median fluoro time of each procedure type from a fixed-size sketch rather than sorting all of them.")
+
+    @classmethod
+    def _get_stats_product(cls):
+        if cls.USE_SKETCHES.value:
+            return 'operator_cpt_sketch_stats'
+        return 'operator_cpt_stats'
+
+    @classmethod
+    def get_required_products(cls):
+        return [products.Product_Request('operator_rad1_to_procs',
+                                         min_reps = cls.MIN_REPS.value,
+                                         procs_per_window = cls.PROCS_PER_WINDOW.value),
+                products.Product_Request(cls._get_stats_product(),
+                                         min_reps = cls.MIN_REPS.value)]
                                         
     def run(self, procs, context, extra_procs):
-        cpt_to_procs = get_procedures_helper(procs, extra_procs, self.MIN_REPS.value)
-        # calculate statistics for each procedure type
-        medians = {}
-        std_devs = {}
-        means = {}
-        log_fluoros = {}
-        log_means  = {}
-        log_devs = {}
-        for cpt, p_list in cpt_to_procs.iteritems():
-            fluoro_list = [p.fluoro for p in p_list]
-            medians[cpt] = float(np.median(fluoro_list))
-            std_devs[cpt] = np.std(fluoro_list)
-            means[cpt] = np.mean(fluoro_list)
-            log_fluoros[cpt] = [math.log(x) if not x ==0 else math.log(.5) for x in fluoro_list]
-            log_means[cpt] = np.mean(log_fluoros[cpt])#default to .5 since that is the lowest number that won't be rounded down to 0
-            log_devs[cpt] = np.std(log_fluoros[cpt])
+        # statistics for each procedure type
+        stats = self.get_product(self._get_stats_product(),
+                                 min_reps = self.MIN_REPS.value)
+        medians = stats['medians']
+        log_fluoros = stats['log_fluoros']
+        log_means = stats['log_means']
+        log_devs = stats['log_devs']
         # organize by rad1 and sort by date
-        rad1_to_procs = sort_by_rads_helper( sum(cpt_to_procs.values(),[]), self.PROCS_PER_WINDOW.value )
+        rad1_to_procs = self.get_product('operator_rad1_to_procs',
+                                         min_reps = self.MIN_REPS.value,
+                                         procs_per_window = self.PROCS_PER_WINDOW.value)
         self._the_meat(rad1_to_procs, medians, log_fluoros, log_means, log_devs)
         self.medians = medians
+
+    def get_sweep_summary(self):
+        all_metrics = [m for out in self.lookup.values() for d, m in out]
+        final_metrics = [out[-1][1] for out in self.lookup.values() if out]
+        summary = [("Operators", len(self.lookup)),
+                   ("Windows", len(all_metrics))]
+        if all_metrics:
+            summary += [("Mean Metric", float(np.mean(all_metrics))),
+                        ("Metric Std Dev", float(np.std(all_metrics)))]
+        if final_metrics:
+            summary += [("Min Final Metric", min(final_metrics)),
+                        ("Max Final Metric", max(final_metrics))]
+        return summary
     
     def _the_meat(self, rad1_to_procs, medians, log_fluoros, log_means, log_devs):
         """Set self.lookup, which is the meat of self.run
@@ -145,38 +331,35 @@ class Operator_Improvement(inquiry.Inquiry):
                 Syngo procedures
             medians : dictionary mapping a cpt code set (a string) to a float
         """
+        rad1s = rad1_to_procs.keys()
+        all_procs = list(itertools.chain.from_iterable(rad1_to_procs[rad1] for rad1 in rad1s))
+        lengths = [len(rad1_to_procs[rad1]) for rad1 in rad1s]
+        # look up the statistics of every procedure's cpt codes at once
+        cpts = sorted(medians.keys())
+        cpt_index = dict([(cpt, i) for i, cpt in enumerate(cpts)])
+        proc_cpts = np.array([cpt_index[p.get_cpts_as_string()] for p in all_procs], dtype = int)
+        stat_array = lambda stat: np.array([stat[cpt] for cpt in cpts], dtype = float)[proc_cpts]
+        proc_medians = stat_array(medians)
+        fluoros = np.array([p.fluoro for p in all_procs], dtype = float)
+        dates = np.empty(len(all_procs), dtype = object)
+        dates[:] = [p.dos_start for p in all_procs]
         # calculate raw deviations
-        raw_devs = {}
-        for rad1, p_list in rad1_to_procs.iteritems():
-            devs = []
-            for p in p_list:
-                med = medians[p.get_cpts_as_string()]
-                devs.append(p.fluoro-med)
-            raw_devs[rad1] = devs
-        self.raw_devs = raw_devs
+        raw_devs = fluoros - proc_medians
         # calculate metrics
+        if self.USE_LOG.value:
+            metrics = get_metrics(fluoros, None, stat_array(log_means), stat_array(log_devs),
+                                  self.NORMALIZE_PENALTY.value, self.CLAMP.value, True)
+        else:
+            metrics = get_metrics(fluoros, proc_medians, None, None,
+                                  self.NORMALIZE_PENALTY.value, self.CLAMP.value, False)
+        windows = get_window_means(metrics, dates, lengths, self.PROCS_PER_WINDOW.value)
+        self.raw_devs = {}
         rad1_to_out = {}
-        for rad1, p_list in rad1_to_procs.iteritems():
-            out = []
-            metric_queue = collections.deque()
-            cum_metric = 0
-            for i, proc in enumerate(p_list):
-                
-                metric = _get_metric(proc, medians = medians,
-                                     normalize_penalty = self.NORMALIZE_PENALTY,
-                                     clamp = self.CLAMP,
-                                     use_log = self.USE_LOG,
-                                     log_fluoros = log_fluoros,
-                                     log_means = log_means,
-                                     log_devs = log_devs)
-                cum_metric += metric
-                metric_queue.append(metric)
-                if len(metric_queue)>=self.PROCS_PER_WINDOW.value:
-                    if len(metric_queue) > self.PROCS_PER_WINDOW.value:
-                        cum_metric -= metric_queue.popleft()
-                    if i == len(p_list)-1 or not (proc.dos_start == p_list[i+1].dos_start):
-                        out.append((proc.dos_start, cum_metric/self.PROCS_PER_WINDOW.value))
-            rad1_to_out[rad1] = out
+        start = 0
+        for rad1, length, (window_ends, means) in zip(rad1s, lengths, windows):
+            self.raw_devs[rad1] = raw_devs[start:start + length].tolist()
+            rad1_to_out[rad1] = zip(dates[window_ends].tolist(), means.tolist())
+            start += length
         self.lookup = rad1_to_out #rad1_to_out[rad1][window_number] = (date, metric value)
 
 
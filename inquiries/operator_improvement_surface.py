@@ -1,6 +1,8 @@
-from srqi.core import inquiry
-from srqi.inquiries.operator_improvement import get_procedures_helper, sort_by_rads_helper, get_procedure_windows
+from srqi.core import inquiry, products
+from srqi.inquiries.operator_improvement import get_sorted_windows
 import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.collections import PolyCollection
 from matplotlib.colors import colorConverter
@@ -17,36 +19,62 @@ class Operator_Improvement_Surface(inquiry.Inquiry):
                                                  "Number of procedures that should be considered in the sliding window calculation of the operators performance metric.")
     STEP_SIZE = inquiry.Inquiry_Parameter(400, "Step size",
                                           "Number of procedures between the beginnings of each window. ")
+
+    @classmethod
+    def get_required_products(cls):
+        return [products.Product_Request('operator_rad1_to_procs',
+                                         min_reps = cls.MIN_REPS.value,
+                                         procs_per_window = cls.PROCS_PER_WINDOW.value)]
     
     def run(self, procs, context, extra_procs):
-        cpt_to_procs = get_procedures_helper(procs, extra_procs, self.MIN_REPS.value)
+        cpt_to_procs = self.get_product('operator_cpt_to_procs',
+                                        min_reps = self.MIN_REPS.value)
         self.included_cpts = cpt_to_procs.keys() # just used to print
-        self.rad1_to_procs = sort_by_rads_helper(sum(cpt_to_procs.values(),[]), self.PROCS_PER_WINDOW.value)
+        self.rad1_to_procs = self.get_product('operator_rad1_to_procs',
+                                              min_reps = self.MIN_REPS.value,
+                                              procs_per_window = self.PROCS_PER_WINDOW.value)
+
+    def _get_ecdf_windows(self, procs):
+        """Return (2-D array of sorted fluoro times, one window per row,
+        list of the labels of the windows)
+        """
+        fluoros = np.array([p.fluoro for p in procs], dtype = float)
+        windows, first = get_sorted_windows(fluoros, self.PROCS_PER_WINDOW.value,
+                                            self.STEP_SIZE.value)
+        return windows, [str(procs[i].dos_start) for i in first]
 
     def get_figures(self):
         from matplotlib.collections import LineCollection
         figs = []
         ys = [(1.0/self.PROCS_PER_WINDOW.value)*(i+1) for i in range(self.PROCS_PER_WINDOW.value)]
-        all_xs = []
-        for rad1, procs in self.rad1_to_procs.iteritems():
-            windows = get_procedure_windows(procs, self.PROCS_PER_WINDOW.value,
-                                   self.STEP_SIZE.value)
-            all_xs = []
-            for window in windows:
-                all_xs.append([p.fluoro for p in window])
+        rads = self.rad1_to_procs.items()
+        # numpy releases the GIL while sorting, so the windows of different
+        # radiologists can be computed at the same time
+        if len(rads) > 1:
+            pool = ThreadPool(min(len(rads), multiprocessing.cpu_count()))
+            try:
+                all_windows = pool.map(lambda (rad1, procs): self._get_ecdf_windows(procs), rads)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            all_windows = [self._get_ecdf_windows(procs) for rad1, procs in rads]
+        for (rad1, procs), (windows, labels) in zip(rads, all_windows):
+            # segments[window][point] = (fluoro time, fraction below it)
+            segments = np.dstack((windows, np.tile(ys, (len(windows), 1))))
             #the matplotlib part
             fig = plt.figure()
             ax = plt.gca()
             ax.set_xlim(0,10)
             ax.set_ylim(0,1)
-            line_segments= LineCollection([zip(xs,ys) for xs in all_xs])
-            line_segments.set_array(np.array(range(len(all_xs))))
+            line_segments= LineCollection(segments)
+            line_segments.set_array(np.arange(len(windows)))
             ax.add_collection(line_segments)
             plt.title(rad1)
             plt.xlabel("Fluoro Time")
             plt.ylabel("Fraction of Procedures Below Fluoro Time")
             colorbar = fig.colorbar(line_segments, ticks = range(len(windows)))#ticks = ?
-            colorbar.set_ticklabels([str(window[0].dos_start) for window in windows])
+            colorbar.set_ticklabels(labels)
             colorbar.set_label("Window Start Date")
             figs.append(fig)
         return figs
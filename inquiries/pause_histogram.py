@@ -1,50 +1,149 @@
 from srqi.core import inquiry
-from srqi.core import my_utils
+from srqi.core import my_utils, my_exceptions, aggregate, sketches
 import matplotlib.pyplot as plt
-import math
+import numpy as np
+import csv
+import os
+import tempfile
 
+LOG_BINS_PER_DECADE = 100
+LINEAR_BIN_WIDTH = 1.0 # seconds
 
-class Pause_Histogram(inquiry.Inquiry):
+
+def get_pauses(procedure_ids, starts, ends):
+    """Find the pauses between consecutive events of the same procedure
+
+    Parameters:
+        procedure_ids : array of the procedure of each event
+        starts : array of the start time of each event, in seconds
+        ends : array of the end time of each event, in seconds
+
+    Returns:
+        (pauses, indices) where pauses is an array of the time in seconds
+            from the end of each event to the start of the next event in
+            the same procedure, and indices is an array of the index of
+            that next event in the arrays passed in
+    """
+    order = np.lexsort((starts, procedure_ids))
+    same_procedure = procedure_ids[order][1:] == procedure_ids[order][:-1]
+    pauses = starts[order][1:] - ends[order][:-1]
+    return pauses[same_procedure], order[1:][same_procedure]
+
+def _check_part(path):
+    if not os.path.exists(path):
+        raise my_exceptions.DataMissingError("The pauses written so far were in " + path +
+                                             ", which is missing. Run Pause_Histogram again from the start.")
+
+
+class Pause_Histogram(inquiry.Streaming_Inquiry):
     NUM_BINS = inquiry.Inquiry_Parameter(30, "Number of Bins in Histogram")
     USE_LOG = inquiry.Inquiry_Parameter(True, "Plot log of pauses?")
+    WRITE_PAUSES = inquiry.Inquiry_Parameter(False, "Write every pause to pauses.csv?",
+                                             "Write the length of every pause, with the Irradiation_Event_UID of the event after it, to pauses.csv in the output directory")
 
     description = """Show a histogram of the length of pauses between fluoro events in procedures.
 
+    The pauses are counted in fine bins as the procedures are read, and
+    the bins are combined into the number of bins asked for, so the
+    pauses themselves aren't kept in memory. They can be written to a
+    file instead.
+
     Data Required:
         DICOM-SR .xml files
 
     """
 
-    def run(self, sr_procs, context, extra_procs):
-        pauses = []
-        irradiation_ids = []
-        for p in sr_procs:
-            events = p.get_events()
-            for i in range(1,len(events)):
-                irradiation_ids.append(events[i].Irradiation_Event_UID)
-                pause = my_utils.total_seconds(events[i].get_start_time()-events[i-1].get_end_time())
-                if self.USE_LOG.value:
-                    pause = math.log(pause)
-                pauses.append(pause)
-        self.pauses = pauses
-        self.irradiation_ids = irradiation_ids
+    def begin(self):
+        if self.USE_LOG.value:
+            self._histogram = sketches.Histogram_Sketch(bins_per_decade = LOG_BINS_PER_DECADE)
+        else:
+            self._histogram = sketches.Histogram_Sketch(bin_width = LINEAR_BIN_WIDTH)
+        self._pause_files = [] # files of (uid, pause) rows written by consume
+
+    def consume(self, sr_procs, extra_procs = ()):
+        attributes = ['DateTime_Started', 'Number_of_Pulses', 'Pulse_Rate']
+        if self.WRITE_PAUSES.value:
+            attributes.append('Irradiation_Event_UID')
+        columns = aggregate.get_event_columns(sr_procs, attributes)
+        if not len(columns['procedure']):
+            return
+        microseconds = columns['DateTime_Started'].astype('datetime64[us]').astype(np.int64)
+        starts = (microseconds - microseconds.min())/1e6
+        ends = starts + aggregate.get_durations(columns['Number_of_Pulses'], columns['Pulse_Rate'])
+        pauses, indices = get_pauses(columns['procedure'], starts, ends)
+        self._histogram.extend(pauses)
+        if self.WRITE_PAUSES.value:
+            self._write_pauses(columns['Irradiation_Event_UID'][indices], pauses)
+
+    def _write_pauses(self, uids, pauses):
+        # a temporary file, unless the state is kept for more to be
+        # consumed, in which case the file is kept with it
+        if not self._pause_files:
+            directory = self.state_directory
+            if not directory is None and not os.path.exists(directory):
+                os.makedirs(directory)
+            handle, path = tempfile.mkstemp('.csv', 'pauses', directory)
+            os.close(handle)
+            self._pause_files.append(path)
+        _check_part(self._pause_files[0])
+        with open(self._pause_files[0], 'ab') as f:
+            csv.writer(f).writerows(zip(uids, pauses.tolist()))
+
+    def merge(self, other):
+        self._histogram.merge(other._histogram)
+        self._pause_files += other._pause_files
+        return self
+
+    def get_state_files(self):
+        return list(self._pause_files)
+
+    def finish(self):
+        edges, counts = self._histogram.get_histogram(self.NUM_BINS.value)
+        self.bin_edges = edges.tolist()
+        self.counts = counts.tolist()
+        self.num_pauses = self._histogram.count + self._histogram.non_positive
+        self.num_non_positive = self._histogram.non_positive
+        self.pause_file = None
+        if self.WRITE_PAUSES.value:
+            self.pause_file = os.path.join(my_utils.get_output_directory(), 'pauses.csv')
+            with open(self.pause_file, 'wb') as out:
+                csv.writer(out).writerow(["Irradiation Event UID", "Pause Length (seconds)"])
+                for path in self._pause_files:
+                    _check_part(path)
+                    with open(path, 'rb') as part:
+                        for line in part:
+                            out.write(line)
+        if self.state_directory is None:
+            # nothing more will be consumed, so the parts aren't needed
+            for path in self._pause_files:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._pause_files = []
 
     def get_figures(self):
         fig = plt.figure()
-        plt.hist(self.pauses, bins =self.NUM_BINS.value)
+        edges = np.array(self.bin_edges)
+        plt.bar(edges[:-1], self.counts, width = np.diff(edges), align = 'edge')
+        if self.USE_LOG.value:
+            plt.gca().set_xscale('log')
         plt.xlabel("Duration (Seconds)")
         plt.ylabel("Number of Pauses")
         plt.title("Duration of Intra-Procedure Pauses")
         return [fig]
 
     def get_tables(self):
-        out = [["Irradiation Event UID", "Pause Length (seconds)", "Cumulative Percentage"]]
-        p_list = sorted(zip(self.irradiation_ids, self.pauses), key = lambda x:x[1])
-        for i in range(len(p_list)):
-            out.append((p_list[i][0], p_list[i][1],
-                        float(i)/(len(self.pauses)-1)
-                        ))
+        out = [["Pause Length From (seconds)", "To (seconds)", "Number of Pauses", "Cumulative Percentage"]]
+        total = float(sum(self.counts))
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            out.append((self.bin_edges[i], self.bin_edges[i+1], count, cumulative/total))
         return [out]
-            
-
 
+    def get_text(self):
+        out = "Found " + str(self.num_pauses) + " pauses."
+        if self.num_non_positive:
+            out += " " + str(self.num_non_positive) + " of them had no length (the next event started before the last ended) and are not plotted."
+        if self.pause_file:
+            out += " Every pause is listed in " + self.pause_file + "."
+        return out
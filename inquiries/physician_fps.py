@@ -2,7 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 
-from srqi.core import inquiry, my_utils, my_exceptions
+from srqi.core import inquiry, my_utils, my_exceptions, aggregate
 
 class Physician_Fps(inquiry.Inquiry):
     NAME = u'Physician FPS'
@@ -34,42 +34,56 @@ class Physician_Fps(inquiry.Inquiry):
         procs = [p for p in procs if p.is_pure()]
         if not len(procs) > 0:
             raise my_exceptions.UnmetRequirementError("Unable to pair any SR Data with Syngo data")
-        procs_by_attending = my_utils.organize(procs, lambda x: x.get_syngo().rad1.replace(',',''))
+        attendings = [p.get_syngo().rad1.replace(',','') for p in procs]
+        attending_list = sorted(set(attendings))
+        attending_index = dict([(a, i) for i, a in enumerate(attending_list)])
 
         first_time = min(procs, key = lambda x: x.get_start_time()).get_start_time()
         last_start_time = max(procs, key = lambda x: x.get_start_time()).get_start_time()
         self.num_periods = int((last_start_time - first_time).days/DAYS_PER_PERIOD)
         self.first_time = first_time
         self.last_start_time =last_start_time
-        
-        out = {}
-        for attending, procs in procs_by_attending.iteritems():
-            events = [p.get_events() for p in procs]
-            events = sum(events, [])# flatten from list of lists to list of events
-            events = [e for e in events if e.Irradiation_Event_Type == "Fluoroscopy"]
-            events_by_period = my_utils.organize(events,
-                                                 lambda e: int((e.get_start_time() - first_time).days/DAYS_PER_PERIOD))
-            out[attending] = events_by_period            
+
+        columns = aggregate.get_event_columns(procs, ['Number_of_Pulses', 'Pulse_Rate', 'DateTime_Started'])
+        fluoro = columns['Irradiation_Event_Type'] == "Fluoroscopy"
+        proc_attendings = np.array([attending_index[a] for a in attendings], dtype = int)
+        event_attendings = proc_attendings[columns['procedure'][fluoro]]
+        starts = columns['DateTime_Started'][fluoro].astype('datetime64[us]')
+        days = (starts - np.datetime64(first_time, 'us')).astype('timedelta64[D]').astype(int)
+        event_periods = days//DAYS_PER_PERIOD
+        # one group per (attending, period)
+        periods_per_attending = event_periods.max() + 1 if len(event_periods) else 0
+        num_groups = len(attending_list)*periods_per_attending
+        groups = event_attendings*periods_per_attending + event_periods
+        averages, durations = aggregate.average_fps(groups,
+                                                    columns['Number_of_Pulses'][fluoro],
+                                                    columns['Pulse_Rate'][fluoro],
+                                                    num_groups)
+        counts = np.bincount(groups, minlength = num_groups)
+        averages = averages.reshape((len(attending_list), periods_per_attending))
+        counts = counts.reshape((len(attending_list), periods_per_attending))
+        self.averages = {} # averages[attending][period_number] --> average fps
+        self.counts = {} # counts[attending][period_number] --> number of fluoro events
+        for a, attending in enumerate(attending_list):
+            in_period = np.nonzero(counts[a])[0]
+            self.averages[attending] = dict(zip(in_period.tolist(), averages[a, in_period].tolist()))
+            self.counts[attending] = dict(zip(in_period.tolist(), counts[a, in_period].tolist()))
         import datetime
         start = self.first_time.date()
         self.period_starts = [start + datetime.timedelta(days=i*DAYS_PER_PERIOD) for i in range(self.num_periods)]
-        self.lookup = out #lookup[attending][period_number] --> [events]
 
         
 
     def get_tables(self):
-        attending_list = sorted(self.lookup.keys())
+        attending_list = sorted(self.averages.keys())
         dimension = (self.num_periods ,len(attending_list))
         average_table =np.zeros(dimension).tolist()
         count_table = np.zeros(dimension).tolist()
         for a, attending in enumerate(attending_list):
             for period in range(self.num_periods-1):
-                if period in self.lookup[attending]:
-                    events = self.lookup[attending][period]
-                    count = len(events)
-                    average = my_utils.average_fps(events)
-                    count_table[period][a] = count
-                    average_table[period][a] = average
+                if period in self.averages[attending]:
+                    count_table[period][a] = self.counts[attending][period]
+                    average_table[period][a] = self.averages[attending][period]
                 else:
                     count_table[period][a] = 0
                     average_table[period][a] = ''
@@ -82,19 +96,15 @@ class Physician_Fps(inquiry.Inquiry):
 
     def get_figures(self):
         figs = []
-        for a, attending in enumerate(sorted(self.lookup.keys())):
+        for a, attending in enumerate(sorted(self.averages.keys())):
             fig = plt.figure()
             plt.axis([0,self.num_periods,5,16])
             plt.xlabel('Period Number')
             plt.ylabel('Average FPS')
             plt.title(attending)
-            x = []
-            y = []
-            s = []
-            for period, events in self.lookup[attending].iteritems():
-                x.append(period)
-                y.append(my_utils.average_fps(events))
-                s.append(len(events))
+            x = sorted(self.averages[attending].keys())
+            y = [self.averages[attending][period] for period in x]
+            s = [self.counts[attending][period] for period in x]
             plt.scatter(x,y,s=s,label=attending)
             plt.plot(x,y,color='red')
             plt.gca().set_xticklabels(self.period_starts)
@@ -1,4 +1,4 @@
-from srqi.core import inquiry, my_utils, my_exceptions
+from srqi.core import inquiry, my_utils, my_exceptions, occupancy, srdata
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import numpy as np
@@ -6,7 +6,7 @@ import datetime
 
 
 
-class Room_Usage(inquiry.Inquiry):
+class Room_Usage(inquiry.Streaming_Inquiry):
     resolution = inquiry.Inquiry_Parameter(600, "Seconds Per Period")
     description = """Visualizes distribution of fluoro machine usage in a week
 
@@ -18,52 +18,95 @@ class Room_Usage(inquiry.Inquiry):
     day of the week.
 
 
+    The machines are told apart by the Device_Observer_UID (or Serial
+    Number) of each procedure. The first table and plot are for all of
+    them together, and if there is more than one each gets its own plot.
+
     Data Required:
-        DICOM-SR xml - assumes that all procedures are from a single fluoro machine.
+        DICOM-SR xml
 
     Parameters:
         Seconds per period
 
     """
 
-    def _add_period(self, table, weekday, start_seconds, end_seconds):
-        """table[weekday][block]
-        start_seconds and end_seconds are ints
-        """
-        first_block = int(start_seconds/self.resolution.value)
-        last_block = int((end_seconds-1)/self.resolution.value)
-        for block in range(first_block, last_block+1):
-            table[weekday][block] = table[weekday][block] +1
-        
-    def run(self, procs, context, extra_procs):
-        num_blocks = 24*60*60 / self.resolution.value # if day isn't evenly divisible, last block will be slightly longer
-        table = []
-        for i in range(7):
-            table.append([0]*num_blocks)
-        #table[weekday][block]
+    def begin(self):
+        self._tables = {} # device -> int array [weekday][block]
+        self._device_names = {} # device -> Device_Observer_Name
+        self._device_counts = {} # device -> number of procedures
+
+    def consume(self, procs, extra_procs = ()):
+        start_times = []
+        end_times = []
+        timed_procs = []
         for proc in procs:
             try:
-                start_time= proc.get_start_time()
+                start_times.append(proc.get_start_time())
             except my_exceptions.DataMissingError:
                 continue
-            start_seconds = (start_time.hour * 60 + start_time.minute)*60
-            end_time = proc.get_end_time()
-            end_seconds = (end_time.hour * 60 + end_time.minute)*60
-            if start_time.weekday() == end_time.weekday():
-                self._add_period(table,start_time.weekday(), start_seconds,end_seconds)
-            elif (start_time.weekday()+1)%7 == end_time.weekday():
-                self._add_period(table,start_time.weekday(),start_seconds,86400)#86400= number of seconds in a day
-                self._add_period(table,end_time.weekday(),0,end_seconds)
+            end_times.append(proc.get_end_time())
+            timed_procs.append(proc)
+        if not timed_procs:
+            return
+        device_list, device_ids = srdata.index_devices(timed_procs, self._device_names)
+        counts = occupancy.weekly_occupancy(occupancy.get_week_seconds(start_times, True),
+                                            occupancy.get_week_seconds(end_times, True),
+                                            self.resolution.value,
+                                            device_ids, len(device_list))
+        num_procs = np.bincount(device_ids, minlength = len(device_list))
+        for device, table, n in zip(device_list, counts, num_procs):
+            if device in self._tables:
+                self._tables[device] = self._tables[device] + table
             else:
-                raise RuntimeError("This should not have happened")
-        self._table = table
+                self._tables[device] = table
+            self._device_counts[device] = self._device_counts.get(device, 0) + int(n)
 
+    def merge(self, other):
+        for device, table in other._tables.iteritems():
+            if device in self._tables:
+                self._tables[device] = self._tables[device] + table
+            else:
+                self._tables[device] = table
+            self._device_counts[device] = self._device_counts.get(device, 0) + other._device_counts[device]
+            if not device in self._device_names:
+                self._device_names[device] = other._device_names[device]
+        return self
+
+    def finish(self):
+        num_blocks = occupancy.get_blocks_per_day(self.resolution.value)
+        self.devices = sorted(self._tables.keys())
+        total = np.zeros((7, num_blocks), dtype = int)
+        for table in self._tables.values():
+            total = total + table
+        self._table = total.tolist() #table[weekday][block] over all devices
+
+    def get_device_label(self, device):
+        return srdata.get_device_label(device, self._device_names.get(device))
 
     def get_tables(self):
-        return [my_utils.transposed(self._table)]
+        out = [my_utils.transposed(self._table)]
+        if len(self.devices) > 1:
+            heading = ["Machine", "Number of Procedures", "Hours In Use", "Busiest Weekday"]
+            weekdays = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
+            device_table = [heading]
+            for device in self.devices:
+                table = self._tables[device]
+                device_table.append([self.get_device_label(device),
+                                     self._device_counts[device],
+                                     table.sum()*self.resolution.value/3600.0,
+                                     weekdays[int(table.sum(axis = 1).argmax())]])
+            out.append(device_table)
+        return out
 
     def get_figures(self):
-        a = np.array(self._table)
+        figs = [self._get_figure(np.array(self._table), "Usage of Fluoro Machine")]
+        if len(self.devices) > 1:
+            for device in self.devices:
+                figs.append(self._get_figure(self._tables[device],
+                                             "Usage of " + self.get_device_label(device)))
+        return figs
+
+    def _get_figure(self, a, title):
         fig = plt.figure()
         ax = fig.add_subplot(111)
         cax = ax.matshow(a.transpose(), cmap=cm.get_cmap('gray_r'), aspect='auto')
@@ -74,9 +117,6 @@ class Room_Usage(inquiry.Inquiry):
 
         #change the labels
         old_labels = [0,0,20,40,60,80,100,120,140]
-        old_yticklabels = plt.gca().get_yticklabels()
-        print [y.get_text() for y in old_yticklabels]
-        print dir(old_yticklabels[0])
         new_labels = []
         for x in old_labels:
                 seconds = x*self.resolution.value
@@ -86,10 +126,10 @@ class Room_Usage(inquiry.Inquiry):
                 new_labels.append(str(datetime.time(hour = hours, minute = minutes, second=seconds)))
         plt.gca().set_yticklabels(new_labels)
         plt.gca().set_xticklabels(['','Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'], size='small')
-        plt.title("Usage of Fluoro Machine")
+        plt.title(title)
         plt.xlabel("Day of week (Monday - Sunday)")
         plt.ylabel("Time of Day (block number)")
-        return [fig]
+        return fig
 
 
 from srqi.gui import report_writer
@@ -1,9 +1,8 @@
 from srqi.core import inquiry
-from srqi.core import Parse_Syngo, my_utils
+from srqi.core import my_utils, products, sketches, distribution_fit, plotting
 from datetime import date
 import matplotlib.pyplot as plt
-from scipy.stats import anderson
-import math
+import os
 
 def get_count_fig(date_bins, sprocs, sprocs_with_fluoro):    
     fig = plt.figure()
@@ -13,27 +12,51 @@ def get_count_fig(date_bins, sprocs, sprocs_with_fluoro):
     with_fluoro_counts , _ , _ = plt.hist([p.dos_start.toordinal() for p in sprocs_with_fluoro],
                        bins=date_bins.value)
     fig = plt.figure()
-    plt.scatter(bin_edges[1:], counts, c='r')
-    plt.scatter(bin_edges[1:], with_fluoro_counts, c='b')
+    plotting.scatter(bin_edges[1:], counts, c='r')
+    plotting.scatter(bin_edges[1:], with_fluoro_counts, c='b')
     fig.autofmt_xdate()
     return (counts, with_fluoro_counts, bin_edges, fig)
     
 
 class Syngo_Stats(inquiry.Inquiry):
     date_bins = inquiry.Inquiry_Parameter(50, "Number of date bins")
+    USE_SKETCHES = inquiry.Inquiry_Parameter(False, "Use moment sketches",
+                                             "Test the log fluoro times for normality with the Jarque-Bera test, computed from running moments, instead of the Anderson-Darling test, which needs every fluoro time.")
     description = """A simple inquiry for some basic descriptions of
     the amount of Syngo data present in a data set.
+
+    The fluoro times of each CPT code combination are tested for
+    lognormality (and normality) with the Anderson-Darling test. The
+    results are saved in the fit_cache folder of the output directory, so
+    they aren't recomputed for the same data.
     """
 
+    @classmethod
+    def get_required_products(cls):
+        out = [products.Product_Request('syngo_by_cpt')]
+        if cls.USE_SKETCHES.value:
+            out.append(products.Product_Request('syngo_fluoro_sketches',
+                                                log = True, zero_value = .5))
+        return out
+
     def run(self, procs, context, extra_procs):
-        sprocs = [p.get_syngo() for p in procs if p.has_syngo()]
-        sprocs += [e for e in extra_procs if isinstance(e, Parse_Syngo.Syngo)]
+        sprocs = self.get_product('syngo_procs')
         self.sprocs = sprocs
         sprocs_with_fluoro = [p for p in sprocs if not p.fluoro is None]
         self.counts, self.with_fluoro_counts, self.bin_edges, self.count_fig = get_count_fig(self.date_bins,
                                                                     self.sprocs,
                                                                     sprocs_with_fluoro)    
-        self.sprocs_by_cpt = my_utils.organize(sprocs, lambda x:x.get_cpts_as_string())
+        self.sprocs_by_cpt = self.get_product('syngo_by_cpt')
+        self.fluoro_sketches = None
+        self.fluoro_fits = None
+        if self.USE_SKETCHES.value:
+            self.fluoro_sketches = self.get_product('syngo_fluoro_sketches',
+                                                    log = True, zero_value = .5)
+        else:
+            groups = distribution_fit.group_values([p.get_cpts_as_string() for p in sprocs_with_fluoro],
+                                                   [p.fluoro if not p.fluoro == 0 else .5 for p in sprocs_with_fluoro])
+            cache = distribution_fit.Fit_Cache(os.path.join(my_utils.get_output_directory(), 'fit_cache'))
+            self.fluoro_fits = cache.fit(groups)
 
     def get_figures(self):
         return (self.count_fig,)
@@ -45,18 +68,39 @@ class Syngo_Stats(inquiry.Inquiry):
                         "Procedures with Recorded Fluoro Time")] +\
                         zip(self.bin_edges[1:], self.counts, self.with_fluoro_counts)
         #break down by cpt code
+        if not self.fluoro_sketches is None:
+            return (count_table, self._get_sketch_cpt_table())
         cpt_table = [("CPT Code Combination","Number of Procedures",
-                      "Number of Procedures with Fluoro", "Anderson Value", "Critical Values", "P-values")]
+                      "Number of Procedures with Fluoro", "Anderson Value", "Critical Values", "P-values",
+                      "Anderson Value (Not Logged)")]
         for cpt, sprocs in self.sprocs_by_cpt.iteritems():
-            cpt_table += [['"'+cpt+'"', len(sprocs), len([p for p in sprocs if not p.fluoro is None])]]
-            fluoros = [p.fluoro if not p.fluoro ==0 else .5 for p in sprocs if not p.fluoro is None] 
-            try:
-                fit_statistic = anderson([math.log(float(x)) for x in fluoros],
-                                    dist='norm')
-            except ZeroDivisionError:
-                fit_statistics = None
-            cpt_table[-1] += [fit_statistic[0], list(fit_statistic[1]),list(fit_statistic[2])]
+            fit = self.fluoro_fits.get(cpt)
+            if fit is None:
+                cpt_table.append(['"'+cpt+'"', len(sprocs), 0, '', '', '', ''])
+                continue
+            cpt_table.append(['"'+cpt+'"', len(sprocs), fit.count])
+            if fit.lognormal is None:
+                cpt_table[-1] += ['', '', '']
+            else:
+                cpt_table[-1] += [fit.lognormal.statistic, fit.lognormal.critical_values,
+                                  fit.lognormal.significance_levels]
+            if fit.normal is None:
+                cpt_table[-1].append('')
+            else:
+                cpt_table[-1].append(fit.normal.statistic)
         return (count_table, cpt_table)
+
+    def _get_sketch_cpt_table(self):
+        cpt_table = [("CPT Code Combination","Number of Procedures",
+                      "Number of Procedures with Fluoro", "Jarque-Bera Value", "P-value")]
+        for cpt, sprocs in self.sprocs_by_cpt.iteritems():
+            if cpt in self.fluoro_sketches:
+                sketch = self.fluoro_sketches[cpt]
+                statistic, p_value = sketch.moments.jarque_bera()
+                cpt_table.append(['"'+cpt+'"', len(sprocs), sketch.get_count(), statistic, p_value])
+            else:
+                cpt_table.append(['"'+cpt+'"', len(sprocs), 0, '', ''])
+        return cpt_table
         
         
 
@@ -0,0 +1,111 @@
+import unittest
+import tempfile
+import shutil
+import numpy as np
+from srqi.core import aggregate, synthetic_data, srdata, my_utils
+from srqi.inquiries import modality_usage
+
+_EVENT_TYPES = ("Fluoroscopy", "Stationary Acquisition")
+
+
+class Test_Grouped_Sums(unittest.TestCase):
+
+    def test_sums(self):
+        group_ids = [0, 0, 1, 2, 2, 2]
+        values = [1., 2., 3., 4., 5., 6.]
+        categories = ['a', 'b', 'a', 'c', 'b', 'b']
+        sums = aggregate.grouped_sums(group_ids, [values, None], categories,
+                                      ('a', 'b'), num_groups = 4)
+        self.assertEqual(sums.shape, (4, 3, 2))
+        self.assertEqual(sums[:, 0, 0].tolist(), [3., 3., 15., 0.])
+        self.assertEqual(sums[:, 1, 0].tolist(), [1., 3., 0., 0.])
+        self.assertEqual(sums[:, 2, 0].tolist(), [2., 0., 11., 0.])
+        self.assertEqual(sums[:, 0, 1].tolist(), [2., 1., 3., 0.])
+        self.assertEqual(sums[:, 2, 1].tolist(), [1., 0., 2., 0.])
+
+    def test_no_categories(self):
+        sums = aggregate.grouped_sums([1, 1, 0], [[1., 2., 4.]])
+        self.assertEqual(sums.shape, (2, 1, 1))
+        self.assertEqual(sums[:, 0, 0].tolist(), [4., 3.])
+
+    def test_sum_by_group(self):
+        out = aggregate.sum_by_group([[1, 2], [3, 4], [5, 6]], [1, 0, 1], 3)
+        self.assertEqual(out.tolist(), [[3, 4], [6, 8], [0, 0]])
+
+    def test_grid_sums(self):
+        rand = np.random.RandomState(4)
+        xs = rand.uniform(-200, 200, 1000)
+        ys = rand.uniform(-100, 100, 1000)
+        weights = rand.uniform(0, 1, 1000)
+        group_ids = rand.randint(0, 3, 1000)
+        x_edges = aggregate.get_bin_edges(-180, 180, 7)
+        y_edges = aggregate.get_bin_edges(-90, 90, 7)
+        self.assertEqual(x_edges[-1], 184)
+        sums = aggregate.grid_sums(group_ids, xs, ys, weights, x_edges, y_edges, 4)
+        self.assertEqual(sums.shape, (4, len(x_edges) - 1, len(y_edges) - 1))
+        for group in range(3):
+            mine = group_ids == group
+            # values outside the grid go in the bins at its edge
+            expected, _, _ = np.histogram2d(np.clip(xs[mine], -180, 183),
+                                            np.clip(ys[mine], -90, 92),
+                                            bins = (x_edges, y_edges),
+                                            weights = weights[mine])
+            self.assertTrue(np.allclose(expected, sums[group]))
+        self.assertEqual(sums[3].sum(), 0)
+
+    def test_grid_sums_missing(self):
+        sums = aggregate.grid_sums([0, 0], [1., np.nan], [1., 1.], [2., 3.], [0, 2], [0, 2])
+        self.assertEqual(sums.tolist(), [[[2.]]])
+
+
+class Test_Event_Aggregates(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        xml_paths, _ = synthetic_data.generate_dataset(cls.out_dir, 500, seed = 5)
+        cls.procs = srdata.process_files(xml_paths, [])[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+
+    def test_matches_get_period_sum(self):
+        columns = aggregate.get_event_columns(self.procs, ['Dose_RP', 'Number_of_Pulses'])
+        sums = aggregate.grouped_sums(columns['procedure'],
+                                      [columns['Dose_RP'], columns['Number_of_Pulses'], None],
+                                      columns['Irradiation_Event_Type'],
+                                      _EVENT_TYPES, num_groups = len(self.procs))
+        for i, proc in enumerate(self.procs):
+            events = proc.get_events()
+            for j, types in enumerate([()] + [(t,) for t in _EVENT_TYPES]):
+                self.assertAlmostEqual(sums[i, j, 0],
+                                       modality_usage.get_period_sum(events, lambda e:e.Dose_RP, types))
+                self.assertEqual(sums[i, j, 1],
+                                 modality_usage.get_period_sum(events, lambda e:e.Number_of_Pulses, types))
+                self.assertEqual(sums[i, j, 2],
+                                 modality_usage.get_period_sum(events, lambda e:1, types))
+
+    def test_average_fps(self):
+        columns = aggregate.get_event_columns(self.procs, ['Number_of_Pulses', 'Pulse_Rate'])
+        fluoro = columns['Irradiation_Event_Type'] == "Fluoroscopy"
+        averages, durations = aggregate.average_fps(columns['procedure'][fluoro],
+                                                    columns['Number_of_Pulses'][fluoro],
+                                                    columns['Pulse_Rate'][fluoro],
+                                                    num_groups = len(self.procs))
+        for i, proc in enumerate(self.procs):
+            events = proc.get_fluoro_events()
+            seconds = [my_utils.total_seconds(e.get_duration()) for e in events]
+            self.assertAlmostEqual(durations[i], sum(seconds), places = 5)
+            if sum(seconds) > 0:
+                expected = sum([s*e.Pulse_Rate for s, e in zip(seconds, events)])/sum(seconds)
+                self.assertAlmostEqual(averages[i], expected, places = 5)
+                self.assertAlmostEqual(my_utils.average_fps(events), expected, places = 5)
+            else:
+                self.assertTrue(np.isnan(averages[i]))
+
+    def test_get_durations(self):
+        self.assertEqual(aggregate.get_durations([1, 1, 11], [0, 15, 5]).tolist(), [0, 0, 2])
+
+if __name__ == '__main__':
+    unittest.main()
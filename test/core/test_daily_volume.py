@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from srqi.core import daily_volume
+
+
+class Test_Daily_Volume(unittest.TestCase):
+
+    def test_daily_counts(self):
+        rand = np.random.RandomState(8)
+        ordinals = rand.randint(1000, 1100, 500)
+        group_ids = rand.randint(0, 3, 500)
+        counts = daily_volume.daily_counts(ordinals, group_ids, 3, 1010, 50)
+        self.assertEqual(counts.shape, (3, 50))
+        for group in range(3):
+            for day in range(50):
+                self.assertEqual(counts[group, day],
+                                 ((ordinals == 1010 + day) & (group_ids == group)).sum())
+
+    def test_merge(self):
+        rand = np.random.RandomState(9)
+        ordinals = rand.randint(0, 300, 1000)
+        whole = daily_volume.Daily_Counts()
+        whole.extend(ordinals)
+        merged = daily_volume.Daily_Counts()
+        for chunk in np.array_split(ordinals, 7):
+            part = daily_volume.Daily_Counts()
+            part.extend(chunk)
+            merged.merge(part)
+        self.assertEqual(whole.first, merged.first)
+        self.assertEqual(whole.counts.tolist(), merged.counts.tolist())
+        self.assertEqual(np.bincount(ordinals, minlength = 310)[-20:].tolist(),
+                         whole.get_counts(290, 20).tolist())
+
+    def test_gaps(self):
+        # ten procedures on weekdays, none on weekends, for two machines
+        weekdays = np.arange(70)%7 < 5 # starting on a monday
+        counts = np.array([10*weekdays, 10*weekdays])
+        counts[1, 37:40] = [0, 1, 0] # wed-fri of the sixth week
+        counts[1, 50] = 5 # half a day isn't a gap
+        baseline = daily_volume.weekday_baseline(counts, 4)
+        self.assertTrue(np.isnan(baseline[:, :28]).all())
+        self.assertEqual(baseline[0, 28:].tolist(), (10.*weekdays[28:]).tolist())
+        gaps = daily_volume.find_gaps(counts, baseline, .25)
+        self.assertEqual(gaps, [(1, 37, 39)])
+        # a whole week missing is still a gap the next week
+        counts[0, 42:49] = 0
+        gaps = daily_volume.find_gaps(counts, daily_volume.weekday_baseline(counts, 4), .25)
+        self.assertEqual(gaps, [(0, 42, 46), (1, 37, 39)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from scipy.stats import anderson
+from srqi.core import distribution_fit
+
+
+class Test_Distribution_Fit(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_group_values(self):
+        groups = distribution_fit.group_values(['b', 'a', 'b', 'c', 'a'], [1, 2, 3, 4, 5])
+        self.assertEqual(sorted(groups.keys()), ['a', 'b', 'c'])
+        self.assertEqual(groups['a'].tolist(), [2, 5])
+        self.assertEqual(groups['b'].tolist(), [1, 3])
+        self.assertEqual(groups['c'].tolist(), [4])
+        self.assertEqual(distribution_fit.group_values([], []), {})
+
+    def test_fit_values(self):
+        values = np.random.RandomState(6).lognormal(1, .5, 200)
+        fit = distribution_fit.fit_values(values)
+        self.assertEqual(200, fit.count)
+        self.assertAlmostEqual(anderson(values, 'norm')[0], fit.normal.statistic)
+        self.assertAlmostEqual(anderson(np.log(values), 'norm')[0], fit.lognormal.statistic)
+        self.assertTrue(fit.lognormal.statistic < fit.normal.statistic)
+        self.assertTrue(distribution_fit.fit_values([3.]).normal is None)
+        self.assertTrue(distribution_fit.fit_values([2., 2.]).normal is None)
+        fit = distribution_fit.fit_values([-1., 0., 1.])
+        self.assertTrue(fit.lognormal is None)
+        self.assertFalse(fit.normal is None)
+
+    def test_pool_and_cache(self):
+        rand = np.random.RandomState(7)
+        num_groups = distribution_fit.MIN_POOL_GROUPS + 10
+        keys = rand.randint(0, num_groups, 20*num_groups)
+        groups = distribution_fit.group_values(keys.tolist(), rand.lognormal(size = len(keys)))
+        serial = distribution_fit.fit_groups(groups, processes = 1)
+        cache = distribution_fit.Fit_Cache(self.directory)
+        pooled = cache.fit(groups, processes = 2)
+        self.assertEqual(sorted(serial.keys()), sorted(pooled.keys()))
+        for key in serial:
+            self.assertEqual(serial[key].lognormal.statistic, pooled[key].lognormal.statistic)
+        fingerprint = distribution_fit.get_fingerprint(groups)
+        self.assertTrue(os.path.exists(cache.get_path(fingerprint)))
+        self.assertEqual(len(cache.load(fingerprint)), len(groups))
+        groups[keys[0]] = groups[keys[0]][1:]
+        self.assertNotEqual(fingerprint, distribution_fit.get_fingerprint(groups))
+        self.assertTrue(cache.load(distribution_fit.get_fingerprint(groups)) is None)
+
+if __name__ == '__main__':
+    unittest.main()
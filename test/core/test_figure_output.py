@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+import shutil
+import os
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from srqi.core import figure_output
+
+
+def _make_figure(ys, title = "A Figure"):
+    fig = plt.figure()
+    plt.plot(range(len(ys)), ys)
+    plt.scatter(range(len(ys)), ys, c = 'r')
+    plt.title(title)
+    return fig
+
+
+class Test_Figure_Output(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        plt.close('all')
+
+    def test_hash(self):
+        first = figure_output.get_figure_hash(_make_figure([1, 2, 3]))
+        self.assertEqual(first, figure_output.get_figure_hash(_make_figure([1, 2, 3])))
+        self.assertNotEqual(first, figure_output.get_figure_hash(_make_figure([1, 2, 4])))
+        self.assertNotEqual(first, figure_output.get_figure_hash(_make_figure([1, 2, 3], "B")))
+        self.assertNotEqual(first, figure_output.get_figure_hash(_make_figure([1, 2, 3]), dpi = 50))
+
+    def _save(self, values, processes = 1):
+        figs = [_make_figure([v, v + 1]) for v in values]
+        paths = [os.path.join(self.directory, 'fig' + str(i) + '.png') for i in range(len(figs))]
+        return paths, figure_output.save_figures(figs, paths, processes = processes)
+
+    def test_skip_unchanged(self):
+        paths, saved = self._save([1, 2, 3])
+        self.assertEqual(paths, saved)
+        self.assertTrue(all([os.path.exists(p) for p in paths]))
+        self.assertEqual(plt.get_fignums(), []) # closed
+        paths, saved = self._save([1, 5, 3])
+        self.assertEqual([paths[1]], saved)
+        os.remove(paths[0])
+        paths, saved = self._save([1, 5, 3])
+        self.assertEqual([paths[0]], saved)
+
+    def test_pool(self):
+        values = range(figure_output.MIN_POOL_FIGURES + 1)
+        paths, saved = self._save(values, processes = 2)
+        self.assertEqual(paths, saved)
+        self.assertTrue(all([os.path.getsize(p) > 0 for p in paths]))
+        paths, saved = self._save(values, processes = 2)
+        self.assertEqual([], saved)
+
+if __name__ == '__main__':
+    unittest.main()
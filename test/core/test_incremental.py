@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import shutil
+import os
+import datetime
+from srqi.core import synthetic_data, srdata, incremental, instrumentation
+from srqi.inquiries.modality_usage import Modality_Usage
+from srqi.inquiries.missing_data_inquiry import Missing_Data_Inquiry
+from srqi.inquiries.room_usage import Room_Usage
+
+CLASSES = [Modality_Usage, Missing_Data_Inquiry, Room_Usage]
+
+
+class Test_Incremental(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        cls.xml_paths, _ = synthetic_data.generate_dataset(cls.data_dir, 3000, seed = 5,
+                                                           events_per_xml_file = 1000)
+        cls.procs = srdata.process_files(cls.xml_paths, [])[0]
+        cls.old_start = Missing_Data_Inquiry.START_DATE.value
+        Missing_Data_Inquiry.START_DATE.set_value(datetime.date(2000,1,1))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.data_dir)
+        Missing_Data_Inquiry.START_DATE.set_value(cls.old_start)
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.store = incremental.Aggregate_Store(os.path.join(self.store_dir, 'aggregates'))
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def _consumed(self, instr):
+        return sorted([r.name for r in instr.get_records('ingest')])
+
+    def _check_same_as_run(self, inqs):
+        for inq_cls, inq in zip(CLASSES, inqs):
+            self.assertEqual(inq_cls(self.procs).get_tables(), inq.get_tables())
+
+    def test_only_new_files_read(self):
+        self.assertTrue(len(self.xml_paths) > 2)
+        self.store.refresh(CLASSES, self.xml_paths[:-1])
+        instr = instrumentation.Instrumentation(sample_memory = False)
+        inqs = self.store.refresh(CLASSES, self.xml_paths, instrumentation = instr)
+        self.assertEqual(["consume " + os.path.basename(self.xml_paths[-1])],
+                         self._consumed(instr))
+        self._check_same_as_run(inqs)
+        # nothing new
+        instr.clear()
+        self._check_same_as_run(self.store.refresh(CLASSES, self.xml_paths,
+                                                   instrumentation = instr))
+        self.assertEqual([], self._consumed(instr))
+
+    def test_parameter_change_rebuilds(self):
+        self.store.refresh([Room_Usage], self.xml_paths)
+        old = Room_Usage.resolution.value
+        Room_Usage.resolution.set_value(1200)
+        try:
+            instr = instrumentation.Instrumentation(sample_memory = False)
+            inq = self.store.refresh([Room_Usage], self.xml_paths, instrumentation = instr)[0]
+            self.assertEqual(len(self.xml_paths), len(self._consumed(instr)))
+            self.assertEqual(Room_Usage(self.procs).get_tables(), inq.get_tables())
+        finally:
+            Room_Usage.resolution.set_value(old)
+
+    def test_changed_file_rebuilds(self):
+        self.store.refresh([Room_Usage], self.xml_paths[:2])
+        # forget about the second file, as if it had been replaced
+        instr = instrumentation.Instrumentation(sample_memory = False)
+        self.store.refresh([Room_Usage], self.xml_paths[:1], instrumentation = instr)
+        self.assertEqual(1, len(self._consumed(instr)))
+        self.assertEqual(1, len(self.store.load(Room_Usage).files))
@@ -0,0 +1,92 @@
+import unittest
+import tempfile
+import shutil
+import os
+import datetime
+from srqi.core import inquiry_registry, inquiry, my_utils
+import srqi.inquiries
+
+
+class Test_Inquiry_Registry(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.lazy = inquiry_registry.get_lazy_inquiries(srqi.inquiries)
+        cls.classes = my_utils.get_inquiry_classes(srqi.inquiries)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_module(self, source):
+        path = os.path.join(self.tmp_dir, 'an_inquiry.py')
+        with open(path, 'w') as f:
+            f.write(source)
+        return path
+
+    def test_same_as_classes(self):
+        self.assertEqual([c.__name__ for c in self.classes],
+                         [l.__name__ for l in self.lazy])
+        for lazy, cls in zip(self.lazy, self.classes):
+            self.assertEqual(cls.get_parameter_names(), lazy.get_parameter_names())
+            # other tests change the values of the classes' parameters,
+            # so only the types of the values can be compared
+            for a, b in zip(lazy.get_parameters(), cls.get_parameters()):
+                self.assertEqual((type(b), type(b.value), b.label, b.description, b.weight),
+                                 (type(a), type(a.value), a.label, a.description, a.weight))
+            self.assertEqual(cls.get_name(), lazy.get_name())
+
+    def test_all_inquiries_lazy(self):
+        # every inquiry that ships with srqi can be listed without
+        # importing its module
+        for lazy in inquiry_registry.get_lazy_inquiries(srqi.inquiries):
+            try:
+                inquiry_registry.read_inquiry_metadata(lazy.path, lazy.__name__)
+            except inquiry_registry.Not_Lazy_Error as e:
+                self.fail(lazy.__name__ + " can't be read lazily: " + str(e))
+            self.assertFalse(lazy.is_loaded(), lazy.__name__)
+
+    def test_read_metadata(self):
+        path = self._write_module(
+            "from srqi.core import inquiry\n"
+            "import datetime as dt\n"
+            "import numpy as np\n"
+            "class An_Inquiry(inquiry.Inquiry):\n"
+            "    NAME = 'An inquiry'\n"
+            "    description = 'Does things'\n"
+            "    START = inquiry.Inquiry_Parameter(dt.date(2012,1,1) + dt.timedelta(days = 2), 'Start')\n"
+            "    PERIOD_LEN = inquiry.get_standard_parameter('PERIOD_LEN')\n"
+            "    def get_description(cls):\n"
+            "        return np.nothing\n")
+        metadata = inquiry_registry.read_inquiry_metadata(path, 'An_Inquiry')
+        self.assertEqual('Does things', metadata['description'])
+        self.assertEqual('An inquiry', metadata['NAME'])
+        self.assertEqual(['PERIOD_LEN', 'START'], sorted(metadata['parameters'].keys()))
+        self.assertEqual(datetime.date(2012,1,3), metadata['parameters']['START'].value)
+        self.assertEqual(['get_description'], metadata['overridden'])
+
+    def test_not_lazy(self):
+        path = self._write_module(
+            "from srqi.core import inquiry\n"
+            "import numpy as np\n"
+            "class An_Inquiry(inquiry.Inquiry):\n"
+            "    N = inquiry.Inquiry_Parameter(np.int64(3), 'N')\n")
+        self.assertRaises(inquiry_registry.Not_Lazy_Error,
+                          inquiry_registry.read_inquiry_metadata, path, 'An_Inquiry')
+
+    def test_load(self):
+        lazy = inquiry_registry.Lazy_Inquiry('srqi.inquiries', 'pause_histogram',
+                                             os.path.join(os.path.dirname(srqi.inquiries.__file__),
+                                                          'pause_histogram.py'))
+        from srqi.inquiries.pause_histogram import Pause_Histogram
+        old = Pause_Histogram.NUM_BINS.value
+        try:
+            lazy.NUM_BINS.set_value(old + 7)
+            self.assertEqual(old, Pause_Histogram.NUM_BINS.value)
+            self.assertTrue(lazy.load() is Pause_Histogram)
+            self.assertEqual(old + 7, Pause_Histogram.NUM_BINS.value)
+            self.assertTrue(lazy.NUM_BINS is Pause_Histogram.NUM_BINS)
+        finally:
+            Pause_Histogram.NUM_BINS.set_value(old)
@@ -0,0 +1,54 @@
+import unittest
+import os
+import json
+import tempfile
+import shutil
+from srqi.core import instrumentation
+
+class Test_Instrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.instr = instrumentation.Instrumentation(sample_interval = .001)
+
+    def test_nested_stages(self):
+        with self.instr.stage("outer", 'ingest'):
+            with self.instr.stage("inner", 'ingest') as record:
+                record.count = 10
+        outer, inner = self.instr.get_records()
+        self.assertEqual(outer.depth, 0)
+        self.assertEqual(inner.depth, 1)
+        self.assertTrue(outer.seconds >= inner.seconds)
+        self.assertEqual(inner.count, 10)
+        self.assertEqual(self.instr.get_total_seconds(), outer.seconds)
+
+    def test_stage_recorded_on_exception(self):
+        try:
+            with self.instr.stage("broken"):
+                raise ValueError("oops")
+        except ValueError:
+            pass
+        self.assertFalse(self.instr.get_records()[0].seconds is None)
+
+    def test_wrap(self):
+        timed = self.instr.wrap(lambda x: x*2, "double", 'inquiry')
+        self.assertEqual(timed(2), 4)
+        self.assertEqual([r.name for r in self.instr.get_records('inquiry')], ["double"])
+
+    def test_stage_or_null(self):
+        with instrumentation.stage_or_null(None, "nothing") as record:
+            record.count = 1
+        self.assertEqual(self.instr.get_records(), [])
+
+    def test_write_json(self):
+        with self.instr.stage("a"):
+            pass
+        out_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(out_dir, 'perf.json')
+            self.instr.write_json(path)
+            with open(path) as f:
+                d = json.load(f)
+        finally:
+            shutil.rmtree(out_dir)
+        self.assertEqual([s['name'] for s in d['stages']], ["a"])
+        self.assertEqual(len(self.instr.get_table()), 2)
@@ -0,0 +1,62 @@
+import unittest
+import datetime
+import numpy as np
+from srqi.core import occupancy
+
+DAY = occupancy.SECONDS_PER_DAY
+WEEK = occupancy.SECONDS_PER_WEEK
+
+
+def _brute_force(starts, ends, resolution, device_ids, num_devices):
+    """Check every block of the week against every interval"""
+    blocks_per_day = DAY//resolution
+    out = np.zeros((num_devices, 7, blocks_per_day), dtype = int)
+    for start, end, device in zip(starts, ends, device_ids):
+        if end <= start:
+            end = end + WEEK
+        for weekday in range(7):
+            for block in range(blocks_per_day):
+                block_start = weekday*DAY + block*resolution
+                if block == blocks_per_day - 1:
+                    block_end = (weekday + 1)*DAY
+                else:
+                    block_end = block_start + resolution
+                # the interval, or the part of it that wrapped into next week
+                if (block_start < end and block_end > start) or \
+                   (block_start + WEEK < end and block_end + WEEK > start):
+                    out[device, weekday, block] += 1
+    return out
+
+
+class Test_Occupancy(unittest.TestCase):
+
+    def test_against_brute_force(self):
+        rand = np.random.RandomState(2)
+        starts = rand.randint(0, WEEK, 300)
+        # mostly short, some past midnight and past the end of the week
+        durations = rand.randint(1, 3*DAY, 300)
+        durations[:200] = rand.randint(1, 4*3600, 200)
+        starts[:10] = WEEK - 600
+        ends = (starts + durations)%WEEK
+        device_ids = rand.randint(0, 3, 300)
+        for resolution in (600, 3600, 7*3600):
+            expected = _brute_force(starts, ends, resolution, device_ids, 3)
+            counts = occupancy.weekly_occupancy(starts, ends, resolution, device_ids, 3)
+            self.assertEqual(counts.tolist(), expected.tolist())
+
+    def test_single_device(self):
+        # Sunday 23:00 to Monday 01:00
+        counts = occupancy.weekly_occupancy([WEEK - 3600], [3600], 3600)
+        self.assertEqual(counts.shape, (1, 7, 24))
+        self.assertEqual(counts.sum(), 2)
+        self.assertEqual(counts[0, 6, 23], 1)
+        self.assertEqual(counts[0, 0, 0], 1)
+
+    def test_get_week_seconds(self):
+        monday = datetime.datetime(2011, 1, 3, 0, 0, 0)
+        times = [monday, monday + datetime.timedelta(days = 6, hours = 1, seconds = 30)]
+        self.assertEqual(occupancy.get_week_seconds(times).tolist(), [0, 6*DAY + 3630])
+        self.assertEqual(occupancy.get_week_seconds(times, True).tolist(), [0, 6*DAY + 3600])
+
+if __name__ == '__main__':
+    unittest.main()
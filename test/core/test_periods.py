@@ -0,0 +1,79 @@
+import unittest
+from datetime import date, timedelta
+from srqi.core import periods, my_utils
+
+
+class Test_Periods(unittest.TestCase):
+
+    def setUp(self):
+        # out of order, with a repeated date and gaps
+        self.dates = [date(2011,3,2), date(2011,1,3), date(2011,1,9),
+                      date(2011,1,3), date(2011,2,14), date(2011,6,30)]
+
+    def _dates_in_groups(self, result):
+        return [[self.dates[i] for i in indices] for indices in result.get_groups()]
+
+    def test_days(self):
+        result = periods.periodize(self.dates, 'days', 7)
+        self.assertEqual(result.starts[0], date(2011,1,3))
+        self.assertEqual(result.starts[-1], date(2011,6,27))
+        self.assertEqual(len(result), 26)
+        groups = result.get_groups()
+        self.assertEqual(groups[0].tolist(), [1, 3, 2])
+        self.assertEqual(groups[1].tolist(), [])
+        self.assertEqual(sum([len(g) for g in groups]), len(self.dates))
+        self.assertEqual(result.get_counts().sum(), len(self.dates))
+
+    def test_iso_week(self):
+        result = periods.periodize(self.dates, 'iso_week')
+        for start in result.starts:
+            self.assertEqual(start.weekday(), 0)
+        for start, dates in zip(result.starts, self._dates_in_groups(result)):
+            for d in dates:
+                self.assertEqual(d.isocalendar()[:2], start.isocalendar()[:2])
+        # Sunday the 9th is in the same ISO week as Monday the 3rd
+        self.assertEqual(self._dates_in_groups(result)[0],
+                         [date(2011,1,3), date(2011,1,3), date(2011,1,9)])
+
+    def test_month(self):
+        result = periods.periodize(self.dates, 'month')
+        self.assertEqual(result.starts, [date(2011,m,1) for m in range(1,7)])
+        self.assertEqual(result.get_counts().tolist(), [3, 1, 1, 0, 0, 1])
+        result = periods.periodize(self.dates, 'month', 4)
+        self.assertEqual(result.starts, [date(2011,1,1), date(2011,5,1)])
+
+    def test_fiscal_quarter(self):
+        result = periods.periodize(self.dates, 'fiscal_quarter')
+        self.assertEqual(result.starts, [date(2011,1,1), date(2011,4,1)])
+        result = periods.periodize(self.dates, 'fiscal_quarter', fiscal_year_start = 8)
+        self.assertEqual(result.starts, [date(2010,11,1), date(2011,2,1), date(2011,5,1)])
+        self.assertEqual(result.get_counts().tolist(), [3, 2, 1])
+        self.assertEqual(periods.get_period_start(date(2011,12,31), 'fiscal_quarter', 11),
+                         date(2011,11,1))
+
+    def test_first_and_last(self):
+        result = periods.periodize(self.dates, 'days', 1, first = date(2011,1,9),
+                                   last = date(2011,3,1))
+        self.assertEqual(result.starts[-1], date(2011,3,1))
+        self.assertEqual(result.period_ids.tolist(), [-1, -1, 0, -1, 36, -1])
+        self.assertEqual([g.tolist() for g in result.get_groups() if len(g)], [[2], [4]])
+        result = periods.periodize(self.dates, 'days', 1, last = date(2010,1,1))
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.get_groups(), [])
+
+    def test_empty(self):
+        result = periods.periodize([], 'month')
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.get_counts().tolist(), [])
+
+    def test_bad_kind(self):
+        self.assertRaises(ValueError, periods.periodize, self.dates, 'fortnight')
+
+    def test_periodize_by_date(self):
+        items = range(len(self.dates))
+        lists, starts = my_utils.periodize_by_date(items, 30, lambda i: self.dates[i])
+        self.assertEqual(starts, [date(2011,1,3) + timedelta(days = 30*i) for i in range(6)])
+        self.assertEqual(lists, [[1, 3, 2], [4, 0], [], [], [], [5]])
+
+if __name__ == '__main__':
+    unittest.main()
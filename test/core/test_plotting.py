@@ -0,0 +1,52 @@
+import unittest
+import datetime
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from srqi.core import plotting
+
+
+class Test_Plotting(unittest.TestCase):
+
+    def tearDown(self):
+        plt.close('all')
+
+    def test_decimate(self):
+        rand = np.random.RandomState(10)
+        xs = rand.uniform(0, 100, 10000)
+        ys = rand.normal(size = 10000)
+        keep = plotting.decimate(xs, ys, 200)
+        self.assertTrue(len(keep) <= 200)
+        self.assertEqual(keep.tolist(), sorted(set(keep.tolist())))
+        # the extremes are always kept
+        self.assertTrue(ys.argmax() in keep)
+        self.assertTrue(ys.argmin() in keep)
+        self.assertEqual(plotting.decimate(xs[:50], ys[:50], 200).tolist(), range(50))
+
+    def test_scatter(self):
+        days = [datetime.date(2011, 1, 1) + datetime.timedelta(days = i%365) for i in range(5000)]
+        values = range(5000)
+        plt.figure()
+        out = plotting.scatter(days, values, max_points = 10000)
+        self.assertEqual(len(out.get_offsets()), 5000)
+        plt.figure()
+        out = plotting.scatter(days, values, max_points = 1000)
+        self.assertTrue(isinstance(out, matplotlib.collections.PolyCollection)) # hexbin
+        self.assertEqual(sum(out.get_array()), 5000)
+        plt.figure()
+        out = plotting.scatter(days, values, max_points = 1000, c = ['r', 'b']*2500, s = values)
+        self.assertTrue(len(out.get_offsets()) <= 1000)
+        self.assertEqual(len(out.get_sizes()), len(out.get_offsets()))
+        # two series with their own colors stay apart
+        plt.figure()
+        red = plotting.scatter(days, values, max_points = 1000, c = 'r', label = 'red')
+        blue = plotting.scatter(days, values[::-1], max_points = 1000, c = 'b', label = 'blue')
+        for out, color in ((red, (1, 0, 0, 1)), (blue, (0, 0, 1, 1))):
+            self.assertTrue(len(out.get_offsets()) <= 1000)
+            self.assertEqual(tuple(out.get_facecolors()[0]), color)
+        self.assertEqual(['red', 'blue'], plt.gca().get_legend_handles_labels()[1])
+        self.assertEqual(1, len(plt.gcf().axes)) # no colorbars
+
+if __name__ == '__main__':
+    unittest.main()
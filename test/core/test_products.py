@@ -0,0 +1,74 @@
+import unittest
+from srqi.core import products, scheduler, inquiry, my_exceptions
+
+calls = []
+
+@products.register_product('test_numbers', params = ['n'])
+def _numbers(procs, extra_procs, n):
+    calls.append(('test_numbers', n))
+    return range(n)
+
+@products.register_product('test_total', requires = ['test_numbers'], params = ['n', 'scale'])
+def _total(procs, extra_procs, numbers, n, scale):
+    calls.append(('test_total', n, scale))
+    return sum(numbers)*scale
+
+@products.register_product('test_loop', requires = ['test_loop'])
+def _loop(procs, extra_procs, loop):
+    return None
+
+class _Total_Inquiry(inquiry.Inquiry):
+    SCALE = inquiry.Inquiry_Parameter(1, "Scale")
+
+    @classmethod
+    def get_required_products(cls):
+        return [products.Product_Request('test_total', n = 4, scale = cls.SCALE.value)]
+
+    def run(self, procs, context, extra_procs):
+        self.total = self.get_product('test_total', n = 4, scale = self.SCALE.value)
+
+class _Other_Total_Inquiry(_Total_Inquiry):
+    SCALE = inquiry.Inquiry_Parameter(2, "Scale")
+
+
+class Test_Products(unittest.TestCase):
+
+    def setUp(self):
+        del calls[:]
+
+    def test_request_equality(self):
+        self.assertEqual(products.Product_Request('a', x = 1, y = 2),
+                         products.Product_Request('a', y = 2, x = 1))
+        self.assertNotEqual(products.Product_Request('a', x = 1),
+                            products.Product_Request('a', x = 2))
+
+    def test_build_levels(self):
+        levels = products.get_build_levels([products.Product_Request('test_total', n = 3, scale = 1),
+                                            products.Product_Request('test_total', n = 3, scale = 5)])
+        self.assertEqual([[products.Product_Request('test_numbers', n = 3)]], levels[:1])
+        self.assertEqual(2, len(levels[1]))
+
+    def test_circular(self):
+        self.assertRaises(my_exceptions.BadInquiryError, products.get_build_levels,
+                          [products.Product_Request('test_loop')])
+
+    def test_unknown_product(self):
+        store = products.Product_Store([], [])
+        self.assertRaises(my_exceptions.BadInquiryError, store.get, 'no_such_product')
+
+    def test_on_demand(self):
+        inq = _Total_Inquiry([], extra_procs = [])
+        self.assertEqual(6, inq.total)
+        self.assertEqual([('test_numbers', 4), ('test_total', 4, 1)], calls)
+
+    def test_scheduler_shares_products(self):
+        s = scheduler.Inquiry_Scheduler([], [], threads = 2)
+        inqs = s.run([_Total_Inquiry, _Other_Total_Inquiry, _Total_Inquiry])
+        self.assertEqual([6, 12, 6], [inq.total for inq in inqs])
+        # the numbers are only computed once, and each total only once
+        self.assertEqual(1, calls.count(('test_numbers', 4)))
+        self.assertEqual(1, calls.count(('test_total', 4, 1)))
+        self.assertEqual(1, calls.count(('test_total', 4, 2)))
+        # running again on the same data computes nothing new
+        s.run([_Other_Total_Inquiry])
+        self.assertEqual(3, len(calls))
@@ -0,0 +1,48 @@
+import unittest
+from srqi.core import progress, instrumentation, my_exceptions
+
+class Test_Progress(unittest.TestCase):
+
+    def setUp(self):
+        self.updates = []
+        self.progress = progress.Progress(lambda m, f: self.updates.append((m, f)),
+                                          ['a', 'b'])
+
+    def test_fraction(self):
+        self.progress.start_phase('a', 4)
+        self.progress.advance("one")
+        self.assertEqual(self.updates[-1], ("one", .125))
+        self.progress.start_phase('b', 2)
+        self.assertEqual(self.progress.get_fraction(), .5)
+        self.progress.advance(steps = 2)
+        self.assertEqual(self.progress.get_state(), ('b', 1.0))
+        # a phase that isn't listed is counted on its own
+        self.progress.start_phase('c', 2)
+        self.progress.advance()
+        self.assertEqual(self.progress.get_fraction(), .5)
+
+    def test_cancel(self):
+        self.progress.check()
+        self.progress.cancel()
+        self.assertTrue(self.progress.is_cancelled())
+        self.assertRaises(my_exceptions.CancelledError, self.progress.check)
+        self.assertRaises(my_exceptions.CancelledError, self.progress.start_phase, 'a', 1)
+
+    def test_instrumentation_stages(self):
+        instr = instrumentation.Instrumentation(sample_memory = False, progress = self.progress)
+        self.assertTrue(progress.get_progress(instr) is self.progress)
+        with instr.stage("Parse XML"):
+            pass
+        self.assertEqual(self.updates[-1][0], "Parse XML")
+        self.progress.cancel()
+        def cancelled_stage():
+            with instr.stage("Never run"):
+                pass
+        self.assertRaises(my_exceptions.CancelledError, cancelled_stage)
+        self.assertEqual(["Parse XML"], [r.name for r in instr.get_records()])
+
+    def test_get_progress_null(self):
+        null = progress.get_progress(None)
+        null.start_phase('a', 1)
+        null.advance()
+        null.check()
@@ -0,0 +1,136 @@
+import unittest
+import cPickle
+import math
+import tempfile
+import shutil
+import numpy as np
+from srqi.core import sketches, synthetic_data, Parse_Syngo
+
+
+class Test_Quantile_Sketch(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.random.RandomState(0).lognormal(1, 1, 200000)
+        self.sorted_values = np.sort(self.values)
+        self.qs = np.linspace(.01, .99, 99)
+
+    def _max_rank_error(self, sketch):
+        ranks = np.searchsorted(self.sorted_values, sketch.quantiles(self.qs),
+                                side = 'right')/float(len(self.values))
+        return np.abs(ranks - self.qs).max()
+
+    def test_exact_when_small(self):
+        sketch = sketches.Quantile_Sketch()
+        for v in [5, 1, 4, 2, 3]:
+            sketch.update(v)
+        self.assertEqual([1, 3, 5], list(sketch.quantiles([0, .5, 1])))
+
+    def test_accuracy(self):
+        sketch = sketches.Quantile_Sketch()
+        sketch.extend(self.values)
+        self.assertEqual(len(self.values), sketch.count)
+        self.assertTrue(sketch.get_size() < 1000)
+        self.assertTrue(self._max_rank_error(sketch) < .02)
+        self.assertEqual(self.values.min(), sketch.quantile(0))
+        self.assertEqual(self.values.max(), sketch.quantile(1))
+
+    def test_merge(self):
+        parts = [sketches.Quantile_Sketch(seed = i) for i in range(8)]
+        for i, part in enumerate(parts):
+            for v in self.values[i::8][:1000]:
+                part.update(v) # some one at a time
+            part.extend(self.values[i::8][1000:])
+        merged = parts[0]
+        for part in parts[1:]:
+            merged.merge(cPickle.loads(cPickle.dumps(part, cPickle.HIGHEST_PROTOCOL)))
+        self.assertEqual(len(self.values), merged.count)
+        self.assertTrue(self._max_rank_error(merged) < .02)
+
+
+class Test_Moment_Sketch(unittest.TestCase):
+
+    def test_moments(self):
+        values = np.random.RandomState(1).gamma(2, 3, 10000)
+        sketch = sketches.Moment_Sketch()
+        for chunk in np.array_split(values, 7):
+            part = sketches.Moment_Sketch()
+            part.extend(chunk)
+            sketch.merge(part)
+        self.assertAlmostEqual(values.mean(), sketch.get_mean())
+        self.assertAlmostEqual(values.std(), sketch.get_std())
+        dev = values - values.mean()
+        skew = (dev**3).mean()/values.std()**3
+        kurtosis = (dev**4).mean()/values.std()**4 - 3
+        self.assertAlmostEqual(skew, sketch.get_skewness())
+        self.assertAlmostEqual(kurtosis, sketch.get_kurtosis())
+        statistic, p_value = sketch.jarque_bera()
+        self.assertAlmostEqual(len(values)/6.0*(skew**2 + kurtosis**2/4), statistic, 6)
+        self.assertTrue(p_value < .01) # gamma isn't normal
+
+    def test_update(self):
+        sketch = sketches.Moment_Sketch()
+        for v in [1, 2, 3, 4]:
+            sketch.update(v)
+        self.assertEqual(2.5, sketch.get_mean())
+        self.assertEqual(1.25, sketch.get_variance())
+
+
+class Test_Histogram_Sketch(unittest.TestCase):
+
+    def test_linear(self):
+        values = np.random.RandomState(3).exponential(20, 5000)
+        sketch = sketches.Histogram_Sketch(bin_width = 1.0)
+        for chunk in np.array_split(values, 5):
+            part = sketches.Histogram_Sketch(bin_width = 1.0)
+            part.extend(chunk)
+            sketch.merge(part)
+        edges, counts = sketch.get_histogram()
+        expected, _ = np.histogram(values, bins = edges)
+        self.assertEqual(expected.tolist(), counts.tolist())
+        edges, counts = sketch.get_histogram(30)
+        self.assertTrue(len(counts) <= 30)
+        self.assertEqual(len(values), counts.sum())
+        expected, _ = np.histogram(values, bins = edges)
+        self.assertEqual(expected.tolist(), counts.tolist())
+
+    def test_log(self):
+        sketch = sketches.Histogram_Sketch(bins_per_decade = 10)
+        sketch.extend([-1, 0, .5, 1, 9.9, 10, 150])
+        self.assertEqual(2, sketch.non_positive)
+        self.assertEqual(5, sketch.count)
+        edges, counts = sketch.get_histogram(4)
+        self.assertAlmostEqual(10**-.4, edges[0])
+        expected, _ = np.histogram([.5, 1, 9.9, 10, 150], bins = edges)
+        self.assertEqual(expected.tolist(), counts.tolist())
+        self.assertRaises(ValueError, sketch.merge, sketches.Histogram_Sketch(bin_width = 1))
+
+
+class Test_Syngo_Sketches(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        _, cls.syngo_paths = synthetic_data.generate_dataset(cls.out_dir, 4000, seed = 2,
+                                                             syngo_rows_per_file = 40)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+
+    def test_merged_files(self):
+        self.assertTrue(len(self.syngo_paths) > 1)
+        merged = None
+        for path in self.syngo_paths:
+            sketch = sketches.sketch_syngo_fluoros(Parse_Syngo.parse_syngo_file(path),
+                                                   log = True, zero_value = .5)
+            merged = sketch if merged is None else merged.merge(sketch)
+        syngo_procs = Parse_Syngo.parse_syngo_files(self.syngo_paths)
+        whole = sketches.sketch_syngo_fluoros(syngo_procs, log = True, zero_value = .5)
+        self.assertEqual(sorted(whole.keys()), sorted(merged.keys()))
+        for cpt, sketch in whole.items():
+            fluoros = [math.log(p.fluoro or .5) for p in syngo_procs
+                       if p.get_cpts_as_string() == cpt and not p.fluoro is None]
+            self.assertEqual(len(fluoros), merged[cpt].get_count())
+            self.assertAlmostEqual(np.mean(fluoros), merged[cpt].moments.get_mean())
+            # few enough that nothing has been compacted
+            self.assertEqual(sorted(fluoros)[(len(fluoros)-1)//2], merged[cpt].quantile(.5))
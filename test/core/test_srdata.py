@@ -1,5 +1,5 @@
 import unittest
-from srqi.core import my_utils
+from srqi.core import my_utils, srdata
 
 class Testsrdata(unittest.TestCase):
 
@@ -59,3 +59,26 @@ class Testsrdata(unittest.TestCase):
                     print "End: " +str(e.get_end_time())"""
 
 
+class _Fake_Proc(object):
+    def __init__(self, device, name):
+        self.device = device
+        self.Device_Observer_Name = name
+
+    def get_device(self):
+        return self.device
+
+class Test_Devices(unittest.TestCase):
+
+    def test_get_device_label(self):
+        self.assertEqual("Unknown Machine", srdata.get_device_label(None, "ROOM 1"))
+        self.assertEqual("ROOM 1 (1.2.3)", srdata.get_device_label("1.2.3", "ROOM 1"))
+        self.assertEqual("1.2.3", srdata.get_device_label("1.2.3", ""))
+
+    def test_index_devices(self):
+        procs = [_Fake_Proc('b', "ROOM B"), _Fake_Proc('a', None),
+                 _Fake_Proc('b', "RENAMED"), _Fake_Proc(None, None)]
+        names = {'a' : "ROOM A"}
+        devices, device_ids = srdata.index_devices(procs, names)
+        self.assertEqual([None, 'a', 'b'], devices)
+        self.assertEqual([2, 1, 2, 0], device_ids.tolist())
+        self.assertEqual({'a' : "ROOM A", 'b' : "ROOM B", None : None}, names)
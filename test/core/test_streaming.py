@@ -0,0 +1,65 @@
+import unittest
+import tempfile
+import shutil
+import datetime
+from srqi.core import synthetic_data, srdata, streaming, inquiry, my_exceptions
+from srqi.inquiries.modality_usage import Modality_Usage
+from srqi.inquiries.missing_data_inquiry import Missing_Data_Inquiry
+from srqi.inquiries.pause_histogram import Pause_Histogram
+from srqi.inquiries.room_usage import Room_Usage
+
+STREAMING_CLASSES = [Modality_Usage, Missing_Data_Inquiry, Pause_Histogram, Room_Usage]
+
+def _outputs(inq):
+    """Everything an inquiry reports, as comparable values"""
+    return inq.get_tables(), [(k, v) for k, v in sorted(vars(inq).items())
+                              if not k.startswith('_')]
+
+class _Not_Streaming(inquiry.Inquiry):
+    def run(self, procs, context, extra_procs):
+        pass
+
+
+class Test_Streaming(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        cls.xml_paths, _ = synthetic_data.generate_dataset(cls.out_dir, 3000, seed = 3,
+                                                           events_per_xml_file = 1000)
+        cls.procs = srdata.process_files(cls.xml_paths, [])[0]
+        cls.old_start = Missing_Data_Inquiry.START_DATE.value
+        Missing_Data_Inquiry.START_DATE.set_value(datetime.date(2000,1,1))
+        Pause_Histogram.USE_LOG.set_value(False)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+        Missing_Data_Inquiry.START_DATE.set_value(cls.old_start)
+        Pause_Histogram.USE_LOG.set_value(True)
+
+    def _check_same_as_run(self, streamed):
+        self.assertEqual(len(STREAMING_CLASSES), len(streamed))
+        for inq_cls, inq in zip(STREAMING_CLASSES, streamed):
+            self.assertTrue(isinstance(inq, inq_cls))
+            self.assertEqual(_outputs(inq_cls(self.procs)), _outputs(inq))
+
+    def test_chunks(self):
+        chunks = list(srdata.iter_procedure_chunks(self.xml_paths, chunk_size = 10))
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all([len(c) <= 10 for c in chunks]))
+        self.assertEqual([p.SeriesInstanceUID for p in self.procs],
+                         [p.SeriesInstanceUID for c in chunks for p in c])
+
+    def test_run_streaming(self):
+        chunks = srdata.iter_procedure_chunks(self.xml_paths, chunk_size = 10)
+        self._check_same_as_run(streaming.run_streaming(STREAMING_CLASSES, chunks))
+
+    def test_run_streaming_files(self):
+        self.assertTrue(len(self.xml_paths) > 1)
+        self._check_same_as_run(streaming.run_streaming_files(STREAMING_CLASSES, self.xml_paths,
+                                                              processes = 2))
+
+    def test_not_streaming(self):
+        self.assertRaises(my_exceptions.BadInquiryError, streaming.run_streaming,
+                          [_Not_Streaming], [])
@@ -0,0 +1,72 @@
+import unittest
+import os
+from srqi.core import sweep, products, inquiry, Parse_Syngo
+from srqi.inquiries import operator_improvement
+from srqi import test
+
+calls = []
+
+@products.register_product('test_sweep_numbers', params = ['n'])
+def _numbers(procs, extra_procs, n):
+    calls.append(n)
+    return range(n)
+
+class _Scaled_Inquiry(inquiry.Inquiry):
+    N = inquiry.Inquiry_Parameter(4, "N")
+    SCALE = inquiry.Inquiry_Parameter(1, "Scale")
+
+    @classmethod
+    def get_required_products(cls):
+        return [products.Product_Request('test_sweep_numbers', n = cls.N.value)]
+
+    def run(self, procs, context, extra_procs):
+        self.total = sum(self.get_product('test_sweep_numbers', n = self.N.value))*self.SCALE.value
+
+    def get_sweep_summary(self):
+        return [("Total", self.total)]
+
+
+class Test_Sweep(unittest.TestCase):
+
+    def setUp(self):
+        del calls[:]
+
+    def test_expand_grid(self):
+        self.assertEqual([{'A' : 1, 'B' : 'x'}, {'A' : 1, 'B' : 'y'},
+                          {'A' : 2, 'B' : 'x'}, {'A' : 2, 'B' : 'y'}],
+                         sweep.expand_grid({'B' : ['x', 'y'], 'A' : [1, 2]}))
+
+    def test_shared_products(self):
+        result = sweep.run_sweep(_Scaled_Inquiry, {'N' : [3, 4], 'SCALE' : [1, 2, 3]},
+                                 [], [], threads = 3)
+        self.assertEqual([['N', 'SCALE', 'Total'],
+                          [3, 1, 3], [3, 2, 6], [3, 3, 9],
+                          [4, 1, 6], [4, 2, 12], [4, 3, 18]],
+                         result.get_table())
+        # the product only depends on N, so it is only computed once per N
+        self.assertEqual([3, 4], sorted(calls))
+        # the class itself is untouched
+        self.assertEqual(4, _Scaled_Inquiry.N.value)
+        self.assertEqual(1, _Scaled_Inquiry.SCALE.value)
+
+    def test_bad_parameter(self):
+        self.assertRaises(ValueError, sweep.run_sweep, _Scaled_Inquiry,
+                          {'NOT_A_PARAMETER' : [1]}, [], [])
+
+    def test_operator_improvement(self):
+        data_file = os.path.join(os.path.dirname(test.__file__), 'data',
+                                 'test_operator_improvement.xls')
+        syngo_procs = Parse_Syngo.parse_syngo_file(data_file)
+        inq_cls = sweep.make_variant(operator_improvement.Operator_Improvement,
+                                     {'MIN_REPS' : 4, 'CLAMP' : False,
+                                      'NORMALIZE_PENALTY' : False})
+        result = sweep.run_sweep(inq_cls, {'PROCS_PER_WINDOW' : [2, 3],
+                                           'USE_LOG' : [True, False]},
+                                 [], syngo_procs)
+        self.assertEqual(4, len(result.runs))
+        for values, inq in result.runs:
+            single_cls = sweep.make_variant(inq_cls, values)
+            self.assertEqual(single_cls([], extra_procs = syngo_procs).lookup, inq.lookup)
+        table = result.get_table()
+        self.assertEqual(['PROCS_PER_WINDOW', 'USE_LOG', 'Operators'], table[0][:3])
+        self.assertEqual(5, len(table))
@@ -0,0 +1,71 @@
+import unittest
+import tempfile
+import shutil
+import os
+from srqi.core import synthetic_data, srdata
+
+class Test_Synthetic_Data(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        cls.num_events = 2000
+        cls.xml_paths, cls.syngo_paths = synthetic_data.generate_dataset(
+            os.path.join(cls.out_dir, 'a'), cls.num_events, seed = 7,
+            events_per_xml_file = 1000, syngo_rows_per_file = 30)
+        cls.procs, cls.extra_procs = srdata.process_files(cls.xml_paths,
+                                                          cls.syngo_paths)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+
+    def test_event_count(self):
+        # procedures that aren't real are dropped by process_files,
+        # but synthetic procedures are all real
+        self.assertEqual(self.num_events,
+                         sum([len(p._events) for p in self.procs]))
+
+    def test_observer_context(self):
+        config = synthetic_data.Synthetic_Config()
+        serials = set([room[1] for room in config.rooms])
+        for p in self.procs:
+            self.assertTrue(p.Serial_Number in serials)
+            self.assertTrue(p.get_device().endswith(p.Serial_Number))
+            self.assertTrue(p.Device_Observer_Name)
+
+    def test_files_split(self):
+        self.assertTrue(len(self.xml_paths) > 1)
+        self.assertTrue(len(self.syngo_paths) > 1)
+
+    def test_syngo_matched(self):
+        matched = len([p for p in self.procs if p.has_syngo()])
+        self.assertTrue(matched > .8*len(self.procs))
+        self.assertTrue(len(self.extra_procs) > 0)
+
+    def test_reproducible(self):
+        xml_paths, _ = synthetic_data.generate_dataset(
+            os.path.join(self.out_dir, 'b'), self.num_events, seed = 7,
+            events_per_xml_file = 1000, syngo_rows_per_file = 30)
+        for p1, p2 in zip(self.xml_paths, xml_paths):
+            with open(p1) as f1:
+                with open(p2) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+    def test_config(self):
+        config = synthetic_data.Synthetic_Config(event_types = [("Fluoroscopy", 1)],
+                                                 rooms = [("ONLY ROOM", "1", 1)])
+        procs = list(synthetic_data.generate_procedures(500, 1, config))
+        self.assertEqual(set(["Fluoroscopy"]),
+                         set([e['Irradiation_Event_Type'] for p in procs for e in p.events]))
+        self.assertRaises(ValueError, synthetic_data.Synthetic_Config, not_a_setting = 1)
+
+    def test_no_last_day_spike(self):
+        procs = list(synthetic_data.generate_procedures(20000, 11))
+        per_day = {}
+        for p in procs:
+            per_day[p.start.date()] = per_day.get(p.start.date(), 0) + 1
+        last_day = max(per_day.keys())
+        busiest = max([n for day, n in per_day.items() if day != last_day])
+        self.assertTrue(per_day[last_day] <= busiest)
+        self.assertEqual(20000, sum([len(p.events) for p in procs]))
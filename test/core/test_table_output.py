@@ -0,0 +1,68 @@
+import unittest
+import tempfile
+import shutil
+import os
+import csv
+from srqi.core import table_output
+
+
+class Test_Table_Output(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_inline(self):
+        table = [["a", "b"], [1, 2], [3, 4]]
+        outputs = table_output.get_table_outputs([table], self.directory, 'Inq', 10)
+        self.assertEqual(1, len(outputs))
+        self.assertTrue(outputs[0].csv_path is None)
+        self.assertEqual(table, outputs[0].rows)
+        self.assertEqual([], os.listdir(self.directory))
+        self.assertEqual([], table_output.get_table_outputs(None, self.directory, 'Inq'))
+
+    def test_streamed_to_csv(self):
+        made = []
+        def get_rows():
+            for i in range(1000):
+                made.append(i)
+                yield [i, u'\xb5' + str(i)] + [0]*(i%3)
+        table = table_output.Streamed_Table(get_rows, ["Number", "Name"])
+        self.assertEqual(["Number", "Name"], iter(table).next())
+        output = table_output.get_table_output(table, self.directory, 'Inq_0', 100)
+        self.assertEqual(os.path.join(self.directory, 'Inq_0.csv'), output.csv_path)
+        self.assertEqual(1001, output.num_rows)
+        self.assertEqual(4, output.num_columns)
+        self.assertEqual(table_output.PREVIEW_ROWS, len(output.rows))
+        self.assertEqual(["Number", "Name"], output.rows[0])
+        self.assertEqual([0, u'\xb50'], output.rows[1])
+        self.assertEqual([len(p) for p in output.pages],
+                         [table_output.PAGE_ROWS]*(table_output.PREVIEW_ROWS//table_output.PAGE_ROWS))
+        self.assertEqual(range(1000), made) # each row made once
+        with open(output.csv_path, 'rb') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(1001, len(rows))
+        self.assertEqual(['999', '\xc2\xb5999'], rows[-1])
+
+    def test_csv_table(self):
+        csv_path = os.path.join(self.directory, 'output.csv')
+        rows = [["Number", "Name"]] + [[i, u'\xb5' + str(i)] for i in range(1000)]
+        table_output.write_csv(rows, csv_path)
+        table = table_output.Csv_Table(csv_path)
+        tables_dir = os.path.join(self.directory, 'tables')
+        output = table_output.get_table_output(table, tables_dir, 'Inq_0', 100)
+        # linked to, not written again
+        self.assertEqual(csv_path, output.csv_path)
+        self.assertFalse(os.path.exists(tables_dir))
+        self.assertEqual(1001, output.num_rows)
+        self.assertEqual(2, output.num_columns)
+        self.assertEqual(table_output.PREVIEW_ROWS, len(output.rows))
+        self.assertEqual([u'0', u'\xb50'], output.rows[1])
+        output = table_output.get_table_output(table, tables_dir, 'Inq_0')
+        self.assertTrue(output.csv_path is None)
+        self.assertEqual([[unicode(v) for v in row] for row in rows], output.rows)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
+import tempfile
+import shutil
+import os
 from srqi.gui import report_writer
-from srqi.inquiries import missing_data_inquiry, average_fps
-from srqi.core import my_utils
+from srqi.inquiries import missing_data_inquiry, average_fps, pause_histogram
+from srqi.core import my_utils, synthetic_data, progress, my_exceptions
 
 class Test_Report_Writer(unittest.TestCase):
     
@@ -35,3 +38,140 @@ class Test_Report_Writer(unittest.TestCase):
         report_writer.write_report([self.inq2, self.inq1])
 
 
+class Test_Incremental_Write(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        cls.xml_paths, _ = synthetic_data.generate_dataset(cls.out_dir, 500, seed = 13)
+        cls.inq_classes = [missing_data_inquiry.Missing_Data_Inquiry, pause_histogram.Pause_Histogram]
+        cls.old_bins = pause_histogram.Pause_Histogram.NUM_BINS.value
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+        pause_histogram.Pause_Histogram.NUM_BINS.set_value(cls.old_bins)
+
+    def _get_rendered(self, writer):
+        """Names of the inquiries whose sections were rendered"""
+        return [r.name.split(' ')[0] for r in writer.instrumentation.get_records('report')
+                if r.name.endswith(' section')]
+
+    def test_fragments(self):
+        writer = report_writer.Report_Writer(self.xml_paths, self.inq_classes)
+        output_path = os.path.join(self.out_dir, 'report', 'output.html')
+        fragment_dir = os.path.join(self.out_dir, 'report', 'fragments')
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        self.assertEqual(['Missing_Data_Inquiry', 'Pause_Histogram'], self._get_rendered(writer))
+        with open(output_path) as f:
+            first = f.read()
+        self.assertTrue('Pause_Histogram' in first)
+
+        writer.update(self.xml_paths, self.inq_classes)
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        self.assertEqual([], self._get_rendered(writer))
+        with open(output_path) as f:
+            self.assertEqual(first, f.read())
+
+        pause_histogram.Pause_Histogram.NUM_BINS.set_value(self.old_bins + 1)
+        writer.update(self.xml_paths, self.inq_classes)
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        self.assertEqual(['Pause_Histogram'], self._get_rendered(writer))
+
+    def test_changed_output(self):
+        # the key follows what a section shows, so a change made outside
+        # the inquiry's own module (here, its text) is still picked up
+        writer = report_writer.Report_Writer(self.xml_paths, self.inq_classes)
+        output_path = os.path.join(self.out_dir, 'changed', 'output.html')
+        fragment_dir = os.path.join(self.out_dir, 'changed', 'fragments')
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        writer.update(self.xml_paths, self.inq_classes)
+        writer.inqs[0].get_text = lambda: "Some other text"
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        self.assertEqual(['Missing_Data_Inquiry'], self._get_rendered(writer))
+        with open(output_path) as f:
+            self.assertTrue("Some other text" in f.read())
+        # the figures of a reused section are saved again if they are missing
+        figure_path = os.path.join(my_utils.get_output_directory(), 'Pause_Histogram0.png')
+        os.remove(figure_path)
+        writer.update(self.xml_paths, self.inq_classes)
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        self.assertEqual(['Missing_Data_Inquiry'], self._get_rendered(writer))
+        self.assertTrue(os.path.exists(figure_path))
+
+    def test_interrupted_write(self):
+        output_path = os.path.join(self.out_dir, 'interrupted', 'output.html')
+        fragment_dir = os.path.join(self.out_dir, 'interrupted', 'fragments')
+        inq_classes = [pause_histogram.Pause_Histogram, missing_data_inquiry.Missing_Data_Inquiry]
+        pause_histogram.Pause_Histogram.NUM_BINS.set_value(self.old_bins)
+        writer = report_writer.Report_Writer(self.xml_paths, inq_classes)
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        with open(output_path) as f:
+            first = f.read()
+        # stop right after the new Pause_Histogram fragment is written
+        def listener(message, fraction):
+            if message == "Wrote the section for Pause_Histogram":
+                raise RuntimeError("stopped")
+        pause_histogram.Pause_Histogram.NUM_BINS.set_value(self.old_bins + 1)
+        writer.update(self.xml_paths, inq_classes, progress.Progress(listener))
+        self.assertRaises(RuntimeError, writer.write, output_path = output_path,
+                          performance_path = None, fragment_dir = fragment_dir)
+        # back to the old parameters: the replaced fragment isn't reused
+        pause_histogram.Pause_Histogram.NUM_BINS.set_value(self.old_bins)
+        writer.update(self.xml_paths, inq_classes, progress.Progress())
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        self.assertEqual(['Pause_Histogram'], self._get_rendered(writer))
+        with open(output_path) as f:
+            self.assertEqual(first, f.read())
+        # a corrupt index means every section is rendered again
+        with open(os.path.join(fragment_dir, writer.FRAGMENT_INDEX_NAME), 'w') as f:
+            f.write('{"Pause_Histogram" : ')
+        writer.update(self.xml_paths, inq_classes)
+        writer.write(output_path = output_path, performance_path = None,
+                     fragment_dir = fragment_dir)
+        self.assertEqual(['Pause_Histogram', 'Missing_Data_Inquiry'], self._get_rendered(writer))
+
+
+class Test_Progress(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        cls.xml_paths, _ = synthetic_data.generate_dataset(cls.out_dir, 200, seed = 5)
+        cls.inq_classes = [missing_data_inquiry.Missing_Data_Inquiry, average_fps.Average_Fps]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+
+    def test_progress(self):
+        updates = []
+        run_progress = progress.Progress(lambda m, f: updates.append((m, f)), progress.PHASES)
+        writer = report_writer.Report_Writer(self.xml_paths, self.inq_classes,
+                                             progress = run_progress)
+        writer.write(output_path = os.path.join(self.out_dir, 'output.html'),
+                     performance_path = None, fragment_dir = None)
+        fractions = [f for m, f in updates]
+        self.assertEqual(fractions, sorted(fractions))
+        self.assertEqual(fractions[-1], 1.0)
+        messages = [m for m, f in updates]
+        for phase in progress.PHASES:
+            self.assertTrue(phase in messages)
+        self.assertTrue('Average_Fps.run' in messages)
+
+    def test_cancel(self):
+        run_progress = progress.Progress()
+        def listener(message, fraction):
+            if message == progress.RUNNING:
+                run_progress.cancel()
+        run_progress.listener = listener
+        self.assertRaises(my_exceptions.CancelledError, report_writer.Report_Writer,
+                          self.xml_paths, self.inq_classes, progress = run_progress)
@@ -0,0 +1,56 @@
+import unittest
+import tempfile
+import shutil
+import datetime
+import numpy as np
+from srqi.core import synthetic_data, srdata, streaming
+from srqi.inquiries import angle_space_dose
+
+
+class Test_Angle_Space_Dose(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        xml_paths, syngo_paths = synthetic_data.generate_dataset(cls.out_dir, 2000, seed = 12)
+        cls.procs = srdata.process_files(xml_paths, syngo_paths)[0]
+        inq_cls = angle_space_dose.Angle_Space_Dose
+        cls.old_values = (inq_cls.GROUP_BY.value, inq_cls.DATE_RANGE_START.value)
+        inq_cls.DATE_RANGE_START.set_value(datetime.date(2000,1,1))
+        cls.inq_cls = inq_cls
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+        group_by, start = cls.old_values
+        cls.inq_cls.GROUP_BY.set_value(group_by)
+        cls.inq_cls.DATE_RANGE_START.set_value(start)
+
+    def test_total(self):
+        self.inq_cls.GROUP_BY.set_value('None')
+        inq = self.inq_cls(self.procs)
+        self.assertEqual(inq.groups, ["All Procedures"])
+        events = [e for p in self.procs for e in p.get_events()]
+        expected, _, _ = np.histogram2d([e.Positioner_Primary_Angle for e in events],
+                                        [e.Positioner_Secondary_Angle for e in events],
+                                        bins = (inq.primary_edges, inq.secondary_edges),
+                                        weights = [e.Dose_RP for e in events])
+        self.assertTrue(np.allclose(expected, inq._grids["All Procedures"]))
+        self.assertEqual(inq.procedure_counts["All Procedures"],
+                         len([p for p in self.procs if p.get_events()]))
+
+    def test_groups_and_chunks(self):
+        self.inq_cls.GROUP_BY.set_value('Physician')
+        whole = self.inq_cls(self.procs)
+        self.assertTrue(len(whole.groups) > 1)
+        total = sum([whole._grids[g].sum() for g in whole.groups])
+        self.assertAlmostEqual(total, sum([e.Dose_RP for p in self.procs for e in p.get_events()]))
+        chunks = [self.procs[i:i+25] for i in range(0, len(self.procs), 25)]
+        chunked = streaming.run_streaming([self.inq_cls], chunks)[0]
+        self.assertEqual(whole.groups, chunked.groups)
+        self.assertEqual(whole.procedure_counts, chunked.procedure_counts)
+        for group in whole.groups:
+            self.assertTrue(np.allclose(whole._grids[group], chunked._grids[group]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import tempfile
+import shutil
+import datetime
+from srqi.core import synthetic_data, srdata, streaming
+from srqi.inquiries import high_cases
+
+
+class Test_High_Cases(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        xml_paths, _ = synthetic_data.generate_dataset(cls.out_dir, 3000, seed = 11)
+        cls.procs = srdata.process_files(xml_paths, [])[0]
+        inq_cls = high_cases.High_Cases
+        cls.old_values = (inq_cls.LIMIT.value, inq_cls.MAX_CASES.value,
+                          inq_cls.DATE_RANGE_START.value)
+        inq_cls.LIMIT.set_value(.5)
+        inq_cls.MAX_CASES.set_value(5)
+        inq_cls.DATE_RANGE_START.set_value(datetime.date(2000,1,1))
+        cls.inq_cls = inq_cls
+        cls.doses = sorted([sum([e.Dose_RP for e in p.get_events()]) for p in cls.procs],
+                           reverse = True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+        limit, max_cases, start = cls.old_values
+        cls.inq_cls.LIMIT.set_value(limit)
+        cls.inq_cls.MAX_CASES.set_value(max_cases)
+        cls.inq_cls.DATE_RANGE_START.set_value(start)
+
+    def test_top_cases(self):
+        inq = self.inq_cls(self.procs)
+        self.assertEqual(len(inq.cases), 5)
+        self.assertEqual([c.totals['total dose'] for c in inq.cases], self.doses[:5])
+        num_over = len([d for d in self.doses if d > .5])
+        self.assertTrue(num_over > 5)
+        self.assertEqual(inq.num_over_limit, num_over)
+        # every case over the limit is listed, not just the top ones
+        summary = inq.get_tables()[-1]
+        self.assertEqual(num_over + 1, len(summary))
+        self.assertEqual([row[3] for row in summary[1:]], self.doses[:num_over])
+        for case in inq.high_cases:
+            self.assertTrue(case.totals['total dose'] > .5)
+            self.assertTrue(case.totals['fluoro dose'] <= case.totals['total dose'])
+
+    def test_chunks(self):
+        whole = self.inq_cls(self.procs)
+        chunks = [self.procs[i:i+10] for i in range(0, len(self.procs), 10)]
+        chunked = streaming.run_streaming([self.inq_cls], chunks)[0]
+        self.assertEqual([c.SeriesInstanceUID for c in whole.cases],
+                         [c.SeriesInstanceUID for c in chunked.cases])
+        self.assertEqual(whole.num_over_limit, chunked.num_over_limit)
+        self.assertEqual(whole.get_tables(), chunked.get_tables())
+
+    def test_alerts(self):
+        alerts = []
+        high_cases.add_alert_handler(alerts.append)
+        try:
+            inq = self.inq_cls(self.procs)
+        finally:
+            high_cases.remove_alert_handler(alerts.append)
+        self.assertEqual(len(alerts), inq.num_over_limit)
+        for alert in alerts:
+            self.assertTrue(alert.dose > .5)
+            index = alert.case.event_starts.index(alert.time)
+            self.assertTrue(sum(alert.case.doses[:index]) <= .5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,10 @@ from srqi.core import my_utils, Parse_Syngo
 from srqi.inquiries import operator_improvement
 from srqi import test
 import os
-from datetime import date
+import random
+import collections
+import itertools
+from datetime import date, timedelta
 
 wind_size =3.0
 class Test_Operator_Improvement(unittest.TestCase):
@@ -85,6 +88,28 @@ class Test_Operator_Improvement(unittest.TestCase):
         self.assertEqual(sorted([1,1,4]), [p.fluoro for p in stew_windows[1]])
         self.assertEqual(sorted([4,1,2]), [p.fluoro for p in stew_windows[2]])
         self.assertEqual(len(stew_windows),3)
+
+    def test_get_sorted_windows(self):
+        STEP_SIZE = 2
+        cpt_to_procs = operator_improvement.get_procedures_helper([],
+                                                                  self.syngo_procs,
+                                                                  self.inq_cls.MIN_REPS.value)
+        syngo_procs = sum(cpt_to_procs.values(),[])
+        rad1_to_procs = operator_improvement.sort_by_rads_helper(syngo_procs,
+                                                                 self.inq_cls.PROCS_PER_WINDOW.value)
+        for proc_list in rad1_to_procs.values():
+            windows = operator_improvement.get_procedure_windows(proc_list,
+                                                                 self.inq_cls.PROCS_PER_WINDOW.value,
+                                                                 STEP_SIZE)
+            sorted_windows, first = operator_improvement.get_sorted_windows([p.fluoro for p in proc_list],
+                                                                            self.inq_cls.PROCS_PER_WINDOW.value,
+                                                                            STEP_SIZE)
+            self.assertEqual(len(windows), len(sorted_windows))
+            for window, row, i in zip(windows, sorted_windows, first):
+                self.assertEqual([p.fluoro for p in window], list(row))
+                self.assertTrue(window[0] is proc_list[i])
+        sorted_windows, first = operator_improvement.get_sorted_windows([1,2], 3, STEP_SIZE)
+        self.assertEqual(sorted_windows.shape, (0,3))
         
         
 
@@ -100,6 +125,95 @@ class Test_Operator_Improvement(unittest.TestCase):
         return not failed
     
 
+
+class _Fake_Proc(object):
+    def __init__(self, rad1, cpts, fluoro, dos_start):
+        self.rad1 = rad1
+        self.cpts = cpts
+        self.fluoro = fluoro
+        self.dos_start = dos_start
+
+    def get_cpts_as_string(self):
+        return self.cpts
+
+def _loop_lookup(inq_cls, rad1_to_procs, medians, log_fluoros, log_means, log_devs):
+    """The per-procedure loop _the_meat used before it was vectorized"""
+    rad1_to_out = {}
+    for rad1, p_list in rad1_to_procs.iteritems():
+        out = []
+        metric_queue = collections.deque()
+        cum_metric = 0
+        for i, proc in enumerate(p_list):
+            metric = operator_improvement._get_metric(proc, medians = medians,
+                                                      normalize_penalty = inq_cls.NORMALIZE_PENALTY,
+                                                      clamp = inq_cls.CLAMP,
+                                                      use_log = inq_cls.USE_LOG,
+                                                      log_fluoros = log_fluoros,
+                                                      log_means = log_means,
+                                                      log_devs = log_devs)
+            cum_metric += metric
+            metric_queue.append(metric)
+            if len(metric_queue) >= inq_cls.PROCS_PER_WINDOW.value:
+                if len(metric_queue) > inq_cls.PROCS_PER_WINDOW.value:
+                    cum_metric -= metric_queue.popleft()
+                if i == len(p_list)-1 or not (proc.dos_start == p_list[i+1].dos_start):
+                    out.append((proc.dos_start, cum_metric/inq_cls.PROCS_PER_WINDOW.value))
+        rad1_to_out[rad1] = out
+    return rad1_to_out
+
+class Test_Vectorized_Metrics(unittest.TestCase):
+    PARAM_NAMES = ('USE_LOG', 'CLAMP', 'NORMALIZE_PENALTY', 'PROCS_PER_WINDOW')
+
+    def setUp(self):
+        self.inq_cls = operator_improvement.Operator_Improvement
+        self.old_values = dict([(name, getattr(self.inq_cls, name).value)
+                                for name in self.PARAM_NAMES])
+        rand = random.Random(3)
+        # cpt '3' has a median of 0, so the unnormalized branch is used for it
+        fluoro_choices = {'1' : [0, 1, 2, 3, 4, 5, 7, 8, 20],
+                          '2' : [10, 12, 15, 18, 33, 45],
+                          '3' : [0, 0, 0, .7, 1, 2]}
+        procs = []
+        for rad1 in ('A', 'B', 'C'):
+            day = date(2011, 1, 1)
+            for i in range(40):
+                if rand.random() < .6: # several procedures on some dates
+                    day += timedelta(days = 1)
+                cpts = rand.choice(sorted(fluoro_choices.keys()))
+                procs.append(_Fake_Proc(rad1, cpts, rand.choice(fluoro_choices[cpts]), day))
+        cpt_to_procs = {}
+        for p in procs:
+            cpt_to_procs.setdefault(p.get_cpts_as_string(), []).append(p)
+        self.stats = operator_improvement._operator_cpt_stats([], [], cpt_to_procs, 1)
+        self.rad1_to_procs = operator_improvement.sort_by_rads_helper(procs, 1)
+
+    def tearDown(self):
+        for name, value in self.old_values.iteritems():
+            getattr(self.inq_cls, name).set_value(value)
+
+    def test_matches_loop(self):
+        args = (self.rad1_to_procs, self.stats['medians'], self.stats['log_fluoros'],
+                self.stats['log_means'], self.stats['log_devs'])
+        for use_log, clamp, normalize, window in itertools.product((True, False), (True, False),
+                                                                   (True, False), (1, 3, 7)):
+            self.inq_cls.USE_LOG.set_value(use_log)
+            self.inq_cls.CLAMP.set_value(clamp)
+            self.inq_cls.NORMALIZE_PENALTY.set_value(normalize)
+            self.inq_cls.PROCS_PER_WINDOW.set_value(window)
+            inq = self.inq_cls.__new__(self.inq_cls)
+            inq._the_meat(*args)
+            expected = _loop_lookup(self.inq_cls, *args)
+            case = str((use_log, clamp, normalize, window))
+            self.assertEqual(sorted(expected.keys()), sorted(inq.lookup.keys()), case)
+            for rad1, out in expected.iteritems():
+                self.assertEqual([d for d, m in out], [d for d, m in inq.lookup[rad1]], case)
+                for (d, m), (_, got) in zip(out, inq.lookup[rad1]):
+                    self.assertTrue(abs(m - got) < 1e-9, case + " " + rad1 + " " + str(d))
+                expected_devs = [p.fluoro - self.stats['medians'][p.get_cpts_as_string()]
+                                 for p in self.rad1_to_procs[rad1]]
+                self.assertEqual(expected_devs, inq.raw_devs[rad1])
+
+
 if __name__ == '__main__':
     unittest.main()
 
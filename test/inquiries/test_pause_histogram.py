@@ -0,0 +1,106 @@
+import unittest
+import tempfile
+import shutil
+import os
+import csv
+import numpy as np
+from srqi.core import synthetic_data, srdata, incremental, my_utils, my_exceptions
+from srqi.inquiries import pause_histogram
+
+
+class Test_Get_Pauses(unittest.TestCase):
+
+    def test_unsorted_events(self):
+        # procedure 1's events are out of order, and the procedures are
+        # interleaved
+        procedure_ids = np.array([1, 0, 1, 0, 1])
+        starts = np.array([20., 0., 0., 10., 40.])
+        ends = np.array([25., 5., 8., 12., 41.])
+        pauses, indices = pause_histogram.get_pauses(procedure_ids, starts, ends)
+        # procedure 0: 0-5 then 10-12. procedure 1: 0-8, 20-25, 40-41
+        self.assertEqual([5., 12., 15.], pauses.tolist())
+        self.assertEqual([3, 0, 4], indices.tolist())
+
+    def test_overlap_and_single_events(self):
+        procedure_ids = np.array([0, 0, 1, 2])
+        starts = np.array([0., 3., 7., 9.])
+        ends = np.array([5., 6., 8., 10.])
+        pauses, indices = pause_histogram.get_pauses(procedure_ids, starts, ends)
+        self.assertEqual([-2.], pauses.tolist())
+        self.assertEqual([1], indices.tolist())
+
+
+class Test_Pause_Parts(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        cls.xml_paths, _ = synthetic_data.generate_dataset(cls.out_dir, 1500, seed = 4,
+                                                          events_per_xml_file = 500)
+        inq_cls = pause_histogram.Pause_Histogram
+        cls.old_write_pauses = inq_cls.WRITE_PAUSES.value
+        inq_cls.WRITE_PAUSES.set_value(True)
+        cls.inq_cls = inq_cls
+        # keep pauses.csv and the temporary parts out of the source tree
+        cls.old_get_output_directory = my_utils.get_output_directory
+        my_utils.get_output_directory = lambda: cls.out_dir
+        cls.old_tempdir = tempfile.tempdir
+        cls.temp_dir = os.path.join(cls.out_dir, 'tmp')
+        os.mkdir(cls.temp_dir)
+        tempfile.tempdir = cls.temp_dir
+
+    @classmethod
+    def tearDownClass(cls):
+        tempfile.tempdir = cls.old_tempdir
+        my_utils.get_output_directory = cls.old_get_output_directory
+        shutil.rmtree(cls.out_dir)
+        cls.inq_cls.WRITE_PAUSES.set_value(cls.old_write_pauses)
+
+    def setUp(self):
+        self.store = incremental.Aggregate_Store(tempfile.mkdtemp(dir = self.out_dir))
+        self.state_dir = self.store.get_state_directory(self.inq_cls)
+
+    def _count_rows(self, inq):
+        self.assertEqual(os.path.join(self.out_dir, 'pauses.csv'), inq.pause_file)
+        with open(inq.pause_file, 'rb') as f:
+            return len(list(csv.reader(f))) - 1
+
+    def _get_parts(self, inq):
+        return sorted([os.path.basename(p) for p in inq._pause_files])
+
+    def test_parts_removed(self):
+        procs, _ = srdata.process_files(self.xml_paths, [])
+        inq = self.inq_cls(procs)
+        self.assertEqual(inq.num_pauses, self._count_rows(inq))
+        self.assertEqual([], inq._pause_files)
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_incremental_parts_kept(self):
+        self.store.refresh([self.inq_cls], self.xml_paths[:-1])
+        inq = self.store.refresh([self.inq_cls], self.xml_paths)[0]
+        self.assertEqual(inq.num_pauses, self._count_rows(inq))
+        self.assertEqual(self._get_parts(inq), sorted(os.listdir(self.state_dir)))
+        # rebuilding from scratch drops the old state's parts
+        self.store.clear(self.inq_cls)
+        self.assertFalse(os.path.exists(self.state_dir))
+        inq = self.store.refresh([self.inq_cls], self.xml_paths)[0]
+        self.assertEqual(inq.num_pauses, self._count_rows(inq))
+        self.assertEqual(self._get_parts(inq), sorted(os.listdir(self.state_dir)))
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_plain_run_between_refreshes(self):
+        self.store.refresh([self.inq_cls], self.xml_paths[:-1])
+        procs, _ = srdata.process_files(self.xml_paths, [])
+        self.inq_cls(procs)
+        inq = self.store.refresh([self.inq_cls], self.xml_paths)[0]
+        self.assertEqual(inq.num_pauses, self._count_rows(inq))
+
+    def test_missing_part(self):
+        inq = self.store.refresh([self.inq_cls], self.xml_paths[:-1])[0]
+        for path in inq._pause_files:
+            os.remove(path)
+        # the state is rebuilt rather than used without its parts
+        inq = self.store.refresh([self.inq_cls], self.xml_paths)[0]
+        self.assertEqual(inq.num_pauses, self._count_rows(inq))
+        os.remove(inq._pause_files[0])
+        self.assertRaises(my_exceptions.DataMissingError, inq.finish)